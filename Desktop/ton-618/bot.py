@@ -1,126 +1,98 @@
 from json.tool import main
 import os
 import logging
-import sqlite3
 import asyncio
 import base64
 import random
 import re
 from urllib.parse import quote
+from html import escape
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.client.default import DefaultBotProperties
 from datetime import datetime
-from PIL import Image
 import io
+import copy
 import json
+import hashlib
+import shutil
+import tempfile
+import time
+from media import ImageProcessor, MediaStore, PHOTO_EXTENSIONS, entry_blobs, make_derivatives
+from media import DownloadTooLarge, VideoProcessor, stream_download
+from render import RenderCache, SiteRenderer, splice_sections
+from database import Database
+from optimize import HtmlMinifier, PrecompressedFile, TeeWriter, minify_html, write_precompressed
 
 # Настройка логов
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 # Инициализация бота
-from config import BOT_TOKEN
+from config import BOT_TOKEN, IMAGE_WORKERS, IMAGE_QUEUE_SIZE, SITE_BASE_URL, PHOTO_WIDTHS
+from config import PHOTO_ENCODER, PHOTO_BYTE_BUDGET, PHOTO_MIN_PSNR, MEDIA_STORE_DIR
+from config import VIDEO_MAX_BYTES, VIDEO_CHUNK_SIZE, FFMPEG_PATH, VIDEO_TARGET_BITRATE, VIDEO_WORKERS
+from config import SESSION_TTL, SESSION_SWEEP_INTERVAL, ALBUM_DEBOUNCE, TEMPLATE_CACHE_DIR
+from config import ASSETS_DIR, ASSETS_URL, RENDER_CACHE_DIR, RENDER_CACHE_MEMORY_BYTES, RENDER_CACHE_DISK_BYTES
+from config import PUBLISH_MINIFY, PAGE_BROTLI_QUALITY, LITE_JS_BUDGET, MAP_MODE, FONT_DIR, FONT_FAMILY
+from config import DB_PATH, DB_BLOB_DIR, DB_READERS, DB_CACHE_KB, DB_MMAP_BYTES, DB_BUSY_TIMEOUT_MS
+from config import SITES_PAGE_SIZE
 bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode='HTML'))
 dp = Dispatcher()
 
-# База данных SQLite
-def init_db():
-    conn = sqlite3.connect('realtor_bot.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY,
-            username TEXT,
-            first_name TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS websites (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            title TEXT,
-            description TEXT,
-            price TEXT,
-            location TEXT,
-            area TEXT,
-            rooms TEXT,
-            completion_date TEXT,
-            broker_phone TEXT,
-            broker_email TEXT,
-            broker_tg TEXT,
-            style_used TEXT,
-            html_content TEXT,
-            media_files TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (user_id)
-        )
-    ''')
-    
-    # Таблица лидов
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS leads (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            site_id INTEGER,
-            tg_user_id INTEGER,
-            username TEXT,
-            first_name TEXT,
-            phone TEXT,
-            email TEXT,
-            message TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
-
-def fix_database():
-    """Добавляет недостающие колонки в существующую базу"""
-    try:
-        conn = sqlite3.connect('realtor_bot.db')
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='websites'")
-        if not cursor.fetchone():
-            conn.close()
-            return
-            
-        cursor.execute("PRAGMA table_info(websites)")
-        columns = [column[1] for column in cursor.fetchall()]
-        
-        missing_columns = []
-        required_columns = ['price', 'location', 'area', 'rooms', 'completion_date', 
-                          'broker_phone', 'broker_email', 'broker_tg', 'style_used', 'media_files']
-        
-        for column in required_columns:
-            if column not in columns:
-                missing_columns.append(column)
-        
-        if missing_columns:
-            for column in missing_columns:
-                try:
-                    cursor.execute(f'ALTER TABLE websites ADD COLUMN {column} TEXT')
-                except sqlite3.OperationalError:
-                    pass
-            conn.commit()
-            
-    except Exception as e:
-        print(f"❌ Ошибка базы данных: {e}")
-    finally:
-        conn.close()
-
-# Исправляем базу перед созданием
-fix_database()
-init_db()
+# Запросы к базе — в своих потоках с постоянными соединениями (один писатель, несколько читателей);
+# схема обновляется миграциями при запуске (main); HTML страниц и списки медиа — файлами в DB_BLOB_DIR
+db = Database(DB_PATH, DB_BLOB_DIR, readers=DB_READERS, cache_kb=DB_CACHE_KB, mmap_bytes=DB_MMAP_BYTES,
+              busy_timeout_ms=DB_BUSY_TIMEOUT_MS)
 
 # Хранение временных данных
 user_sessions = {}
 
+def reset_session(user_id, data=None):
+    """Заменяет сессию пользователя (или удаляет при data=None), отменяя фоновые загрузки старой"""
+    old = user_sessions.pop(user_id, None)
+    for task in (old or {}).get('prefetch') or []:
+        task.cancel()
+    if data is not None:
+        data['touched'] = time.monotonic()
+        user_sessions[user_id] = data
+    return data
+
+@dp.message.outer_middleware()
+async def touch_session(handler, event, data):
+    """Отмечает активность пользователя, чтобы живые сессии не попали под очистку"""
+    session = user_sessions.get(event.from_user.id) if event.from_user else None
+    if session is not None:
+        session['touched'] = time.monotonic()
+    return await handler(event, data)
+
+async def sweep_sessions():
+    """Периодически удаляет брошенные сессии вместе с их фоновыми загрузками"""
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL)
+        now = time.monotonic()
+        for user_id, session in list(user_sessions.items()):
+            if session.get('state') != 'generating' and now - session.get('touched', now) > SESSION_TTL:
+                reset_session(user_id)
+
+# Пул обработки фото
+image_processor = ImageProcessor(workers=IMAGE_WORKERS, max_pending=IMAGE_QUEUE_SIZE)
+PHOTO_ENCODING = {'encoder': PHOTO_ENCODER, 'max_bytes': PHOTO_BYTE_BUDGET, 'min_psnr': PHOTO_MIN_PSNR}
+
+# Хранилище обработанных медиа, общее для всех сайтов
+media_store = MediaStore(MEDIA_STORE_DIR)
+
+# Постобработка видео (faststart, обложка, пережатие)
+video_processor = VideoProcessor(ffmpeg=FFMPEG_PATH, workers=VIDEO_WORKERS, target_bitrate=VIDEO_TARGET_BITRATE)
+
+# Шаблоны сайтов компилируются один раз при запуске
+site_renderer = SiteRenderer(cache_dir=TEMPLATE_CACHE_DIR, assets_dir=ASSETS_DIR, assets_url=ASSETS_URL,
+                             minify=PUBLISH_MINIFY, lite_js_budget=LITE_JS_BUDGET,
+                             font_dir=FONT_DIR, font_family=FONT_FAMILY)
+site_renderer.warm()
+render_cache = RenderCache(RENDER_CACHE_DIR, RENDER_CACHE_MEMORY_BYTES, RENDER_CACHE_DISK_BYTES)
+
 # Клавиатуры
 def get_main_menu():
     return ReplyKeyboardMarkup(
@@ -163,34 +135,227 @@ def get_style_choice_keyboard():
 
 # ===== ОБРАБОТКА МЕДИА =====
 
-async def download_photo(photo_id):
-    """Скачивает и обрабатывает фото"""
+async def download_bytes(file_id):
+    """Скачивает файл из Telegram целиком в память"""
+    file = await bot.get_file(file_id)
+    data = await bot.download_file(file.file_path)
+    return data.read()
+
+async def process_photo_bytes(raw):
+    """Обрабатывает фото в пуле и кладёт копии для srcset в хранилище"""
+    # Копии режем прямо из загруженного файла: одно декодирование, по одному ресайзу
+    # и кодированию на копию, без промежуточного пережатого оригинала
+    derivatives = await image_processor.run(make_derivatives, raw, PHOTO_WIDTHS, **PHOTO_ENCODING)
+    
+    variants = []
+    for d in derivatives:
+        ext = PHOTO_EXTENSIONS[d['format']]
+        variants.append({
+            'sha256': await asyncio.to_thread(media_store.put, d['bytes'], ext),
+            'ext': ext,
+            'format': d['format'],
+            'width': d['width'],
+            'height': d['height'],
+            'size': len(d['bytes']),
+        })
+    # Главный блоб записи — самая широкая JPEG-копия, она же исходник при повторной обработке
+    widest = [v for v in variants if v['format'] == 'jpeg'][-1]
+    return {
+        'type': 'photo',
+        'sha256': widest['sha256'],
+        'ext': 'jpg',
+        'original_bytes': len(raw),
+        'variants': variants,
+    }
+
+async def download_photo(photo_id, file_unique_id=None):
+    """Скачивает и обрабатывает фото; повторные загрузки берутся из хранилища"""
     try:
-        file = await bot.get_file(photo_id)
-        photo_data = await bot.download_file(file.file_path)
-        
-        image = Image.open(io.BytesIO(photo_data.read()))
-        image.thumbnail((1200, 800))
-        
-        buffered = io.BytesIO()
-        image.save(buffered, format="JPEG", quality=90)
-        img_str = base64.b64encode(buffered.getvalue()).decode()
-        
-        return f"data:image/jpeg;base64,{img_str}"
+        entry = await asyncio.to_thread(media_store.lookup, file_unique_id)
+        if entry:
+            return entry
+        entry = await process_photo_bytes(await download_bytes(photo_id))
+        await asyncio.to_thread(media_store.remember, file_unique_id, entry)
+        return entry
     except Exception as e:
         logger.error(f"Ошибка обработки фото: {e}")
         return None
 
-async def download_video(video_id):
-    """Обработка видео - возвращает file_id для скачивания"""
+async def store_video(path, duration=None, thumb_file_id=None):
+    """Постобработка скачанного видео и перенос в хранилище вместе с обложкой"""
+    out_path, poster_path = await video_processor.process(path, duration)
+    entry = {'type': 'video', 'ext': 'mp4', 'size': os.path.getsize(out_path)}
+    # Хэширование и перенос файла до VIDEO_MAX_BYTES — в потоке, чтобы не стоял весь бот
+    entry['sha256'] = await asyncio.to_thread(media_store.put_file, out_path, 'mp4')
+    
+    if poster_path:
+        entry['poster'] = {'sha256': await asyncio.to_thread(media_store.put_file, poster_path, 'jpg'), 'ext': 'jpg'}
+    elif thumb_file_id:
+        # Без ffmpeg обложкой служит превью, которое Telegram уже сделал сам
+        try:
+            thumb = await download_bytes(thumb_file_id)
+            entry['poster'] = {'sha256': await asyncio.to_thread(media_store.put, thumb, 'jpg'), 'ext': 'jpg'}
+        except Exception as e:
+            logger.error(f"Не удалось скачать превью видео: {e}")
+    return entry
+
+# Идущие загрузки видео: file_unique_id -> задача. Повторный запрос того же ролика
+# (префетч и генерация, два сайта с одним видео) ждёт уже идущую загрузку, а не качает
+# его второй раз в тот же .part
+video_downloads = {}
+
+async def download_video_file(video_id, file_unique_id=None, progress=None, duration=None, thumb_file_id=None):
+    """Потоково скачивает видео в хранилище; повторные загрузки берутся из хранилища"""
+    entry = await asyncio.to_thread(media_store.lookup, file_unique_id)
+    if entry:
+        return entry
+    if not file_unique_id:
+        return await fetch_video(video_id, file_unique_id, progress, duration, thumb_file_id)
+    task = video_downloads.get(file_unique_id)
+    if task is None:
+        task = asyncio.create_task(fetch_video(video_id, file_unique_id, progress, duration, thumb_file_id))
+        video_downloads[file_unique_id] = task
+        task.add_done_callback(lambda _: video_downloads.pop(file_unique_id, None))
+    # shield: отмена одного ожидающего не обрывает загрузку для остальных
+    return copy.deepcopy(await asyncio.shield(task))
+
+async def fetch_video(video_id, file_unique_id=None, progress=None, duration=None, thumb_file_id=None):
+    """Сама загрузка и постобработка видео — одна на file_unique_id, см. video_downloads"""
+    file = await bot.get_file(video_id)
+    # Недокачанный файл лежит под стабильным именем — следующая попытка продолжит с места обрыва
+    part_path = os.path.join(MEDIA_STORE_DIR, 'incoming', f'{file.file_unique_id}.part')
+    await stream_download(bot, file.file_path, part_path, total=file.file_size,
+                          max_bytes=VIDEO_MAX_BYTES, chunk_size=VIDEO_CHUNK_SIZE, progress=progress)
+    entry = await store_video(part_path, duration, thumb_file_id)
+    await asyncio.to_thread(media_store.remember, file_unique_id, entry)
+    return entry
+
+def progress_reporter(status_message, label):
+    """Колбэк прогресса загрузки: правит статусное сообщение не чаще раза в 3 секунды"""
+    last_update = 0
+    
+    async def report(done, total):
+        nonlocal last_update
+        now = asyncio.get_running_loop().time()
+        if not total or now - last_update < 3:
+            return
+        last_update = now
+        try:
+            await status_message.edit_text(f"⏳ <b>{label}:</b> {done * 100 // total}% ({done // (1024 * 1024)} из {total // (1024 * 1024)} МБ)")
+        except Exception:
+            pass
+    
+    return report
+
+async def prefetch_media(m):
+    """Фоновая загрузка и обработка одного медиа; результат дописывается прямо в запись сессии"""
     try:
-        return video_id  # Возвращаем file_id для последующей обработки
+        if m['type'] == 'photo':
+            entry = await download_photo(m['file_id'], m.get('file_unique_id'))
+        else:
+            entry = await download_video_file(m['file_id'], m.get('file_unique_id'), None,
+                                              m.get('duration'), m.get('thumb_file_id'))
+        if entry:
+            m.update(entry)
+    except DownloadTooLarge:
+        logger.error(f"Видео {m.get('file_id')} больше {VIDEO_MAX_BYTES} байт, пропускаем")
     except Exception as e:
-        logger.error(f"Ошибка обработки видео: {e}")
-        return None
+        # Неудачная загрузка повторится при публикации
+        logger.error(f"Ошибка фоновой загрузки медиа {m.get('file_id')}: {e}")
+
+def media_counts(session):
+    """Счётчики фото и видео в сессии — ведутся при добавлении, без пересчёта списка"""
+    counts = session.get('counts')
+    if counts is None:
+        counts = session['counts'] = {'photo': 0, 'video': 0}
+        for m in session.get('media') or []:
+            counts[m['type']] = counts.get(m['type'], 0) + 1
+    return counts
+
+def schedule_prefetch(user_id, m):
+    """Ставит загрузку медиа в фон сразу после получения — она идёт, пока пользователь заполняет анкету"""
+    session = user_sessions[user_id]
+    media_counts(session)[m['type']] += 1
+    session['media'].append(m)
+    session.setdefault('prefetch', []).append(asyncio.create_task(prefetch_media(m)))
+
+# Альбомы приходят пачкой отдельных сообщений с общим media_group_id:
+# (user_id, media_group_id) -> {'session', 'message', 'items', 'deadline'}
+album_buffers = {}
+# Задачи flush_album: event loop держит задачи по слабым ссылкам — без этого набора
+# задачу могут собрать сборщиком мусора до того, как альбом будет принят
+album_tasks = set()
+
+async def acknowledge_media(message, session, items):
+    """Одно подтверждение на одиночное медиа или на весь альбом"""
+    counts = media_counts(session)
+    if len(items) == 1:
+        kind = items[0]['type']
+        header = f"✅ {'Фото' if kind == 'photo' else 'Видео'} #{counts[kind]} добавлено!"
+    else:
+        header = f"✅ Альбом добавлен: {len(items)} медиа"
+    if image_processor.overloaded:
+        header += "\n⏳ Сейчас обрабатывается много фото, ваши будут готовы чуть позже..."
+    await message.answer(
+        f"{header}\n\n"
+        f"Загружено: {counts['photo']} фото, {counts['video']} видео\n\n"
+        "Продолжайте загружать медиа или нажмите «✅ Завершить загрузку»",
+        reply_markup=get_media_type_keyboard()
+    )
+
+async def flush_album(key):
+    """Ждёт, пока альбом перестанет пополняться, и принимает его целиком"""
+    loop = asyncio.get_running_loop()
+    buffer = album_buffers[key]
+    while loop.time() < buffer['deadline']:
+        await asyncio.sleep(buffer['deadline'] - loop.time())
+    album_buffers.pop(key, None)
+    
+    user_id = key[0]
+    # Сессию могли заменить, пока альбом докачивался
+    if user_sessions.get(user_id) is not buffer['session']:
+        return
+    for m in buffer['items']:
+        schedule_prefetch(user_id, m)
+    try:
+        await acknowledge_media(buffer['message'], buffer['session'], buffer['items'])
+    except Exception as e:
+        logger.error(f"Ошибка подтверждения альбома: {e}")
+
+async def accept_media(message, m):
+    """Принимает медиа: одиночное — сразу с ответом, части альбома — копит и подтверждает разом"""
+    user_id = message.from_user.id
+    if not message.media_group_id:
+        schedule_prefetch(user_id, m)
+        await acknowledge_media(message, user_sessions[user_id], [m])
+        return
+    
+    key = (user_id, message.media_group_id)
+    deadline = asyncio.get_running_loop().time() + ALBUM_DEBOUNCE
+    buffer = album_buffers.get(key)
+    if buffer:
+        buffer['items'].append(m)
+        buffer['deadline'] = deadline
+        return
+    album_buffers[key] = {'session': user_sessions[user_id], 'message': message, 'items': [m], 'deadline': deadline}
+    task = asyncio.create_task(flush_album(key))
+    album_tasks.add(task)
+    task.add_done_callback(album_tasks.discard)
+
+async def await_prefetch(user_data, status_message=None):
+    """Дожидается фоновых загрузок, которые ещё не закончились к моменту генерации"""
+    pending = [task for task in user_data.get('prefetch') or [] if not task.done()]
+    if not pending:
+        return
+    if status_message:
+        try:
+            await status_message.edit_text(f"⏳ <b>Дообрабатываю медиа:</b> осталось {len(pending)}")
+        except Exception:
+            pass
+    await asyncio.gather(*pending, return_exceptions=True)
 
-def get_google_maps_url(location):
-    """Генерирует URL для Google Maps на основе локации"""
+def get_google_maps_url(location, embed=True):
+    """Генерирует URL для Google Maps на основе локации: для iframe (embed) или обычную ссылку"""
     if not location:
         return None
     
@@ -199,6 +364,8 @@ def get_google_maps_url(location):
     encoded_location = quote(clean_location)
     
     # Без API ключа (простая версия)
+    if not embed:
+        return f"https://www.google.com/maps?q={encoded_location}"
     return f"https://www.google.com/maps?q={encoded_location}&output=embed"
 
 def detect_style_from_description(description):
@@ -288,221 +455,11 @@ def detect_style_from_description(description):
 
 
 
-async def generate_website_html(user_data, media_files):
-    """Генерирует профессиональный HTML сайт с видео и картами"""
-    
+def site_context(user_data, media_files, lead_link):
+    """Данные страницы для шаблонов: и для целой страницы, и для отдельных секций"""
     # Fallback: derive style from description if not already set
     style = user_data.get('style') or detect_style_from_description(user_data.get('description', '') or '')
-    photos = [m for m in media_files if m['type'] == 'photo']
-    videos = [m for m in media_files if m['type'] == 'video']
-    
-    # Формируем галерею фото
-    gallery_html = ""
-    for i, media in enumerate(photos):
-        if media.get('data'):
-            gallery_html += f'''
-            <div class="gallery-item">
-                <img src="{media['data']}" alt="Фото объекта {i+1}" loading="lazy">
-                <div class="gallery-overlay">
-                    <span class="gallery-number">{i+1}</span>
-                </div>
-            </div>'''
-
-    # Формируем секцию видео
-    videos_html = ""
-    if videos:
-        videos_html += '''
-        <section id="videos" class="section">
-            <div class="container">
-                <h2 class="section-title">Видеообзор</h2>
-                <div class="videos-grid">'''
-        for i, video in enumerate(videos):
-            videos_html += f'''
-                <div class="video-item">
-                    <div class="video-wrapper">
-                        <video controls preload="metadata" playsinline controlslist="nodownload noremoteplayback">
-                            <source src="{video['file_id']}" type="video/mp4">
-                            Ваш браузер не поддерживает видео.
-                        </video>
-                    </div>
-                    <div class="video-caption">Видео обзор {i+1}</div>
-                </div>'''
-        videos_html += '''
-            </div>
-        </section>'''
-
-    # Спец-оформление для новых стилей
-    special_bg = ""
-    special_classes = ""
-    if style.get('key') == 'pixel_city':
-        special_classes = "pixel-city"
-        special_bg = """
-        .pixel-city .header { position: relative; }
-        .pixel-city .header::after {
-            content: '';
-            position: absolute;
-            left: 0; right: 0; bottom: -30px; height: 60px;
-            background: repeating-linear-gradient(90deg, rgba(0,0,0,0.08) 0 10px, rgba(0,0,0,0.12) 10px 20px);
-            filter: blur(3px);
-        }
-        .pixel-skyline { position: absolute; inset: 0; pointer-events: none; overflow: hidden; z-index: 1; }
-        .pixel-building { position: absolute; bottom: -16px; width: 100px; height: 120px; background: #1f2937; box-shadow: 0 0 0 4px #000 inset; image-rendering: pixelated; border-radius: 4px; opacity: .9; }
-        .pixel-building .pixel-window { position: absolute; width: 8px; height: 8px; background: #ffd166; box-shadow: 0 0 0 2px #000 inset; }
-        .pixel-bird { position: absolute; width: 14px; height: 10px; background: #fff; box-shadow: 0 0 0 2px #000 inset; transform: rotate(-8deg); animation: birdFly 10s linear infinite; opacity: .8; }
-        @keyframes birdFly { 0%{ transform: translateX(-10vw) translateY(0) rotate(-8deg);} 50%{ transform: translateX(50vw) translateY(-10px) rotate(4deg);} 100%{ transform: translateX(110vw) translateY(0) rotate(-8deg);} }
-        @keyframes floatHouse { 0%{ transform: translateY(0);} 50%{ transform: translateY(-10px);} 100%{ transform: translateY(0);} }
-        .flying-house { position: absolute; top: 20%; left: 10%; width: 120px; height: 80px; background: #ff6b35; box-shadow: 0 0 0 4px #000 inset; border-radius: 6px; animation: floatHouse 4s ease-in-out infinite; }
-        .flying-house::before { content: ''; position: absolute; bottom: -20px; left: 40px; width: 40px; height: 20px; background: #00000033; filter: blur(6px); border-radius: 50%; }
-        .pixel-cloud { position: absolute; top: 10%; width: 120px; height: 40px; background: #ffffffcc; box-shadow: 0 0 0 4px #000 inset; border-radius: 6px; animation: floatHouse 6s ease-in-out infinite; }
-        .pixel-stars { position:absolute; inset:0; pointer-events:none; z-index:0; }
-        .pixel-star { position:absolute; width:4px; height:4px; background:#fff; box-shadow:0 0 0 2px #000 inset; opacity:.9; animation: twinkle 2.2s ease-in-out infinite; }
-        @keyframes twinkle { 0%,100%{ transform: scale(0.9); opacity:.5;} 50%{ transform: scale(1.2); opacity:1; } }
-        .btn { position: relative; overflow: hidden; }
-        .btn::after { content:''; position:absolute; inset:auto -20% -20% -20%; height:200%; width: 40%; transform: rotate(25deg) translateX(-120%); background:linear-gradient(90deg, transparent, rgba(255,255,255,.28), transparent); transition: transform .6s ease; }
-        .btn:hover::after { transform: rotate(25deg) translateX(260%); }
-        """
-    elif style.get('key') == 'neon_city':
-        special_classes = "neon-city"
-        special_bg = """
-        .neon-city body { background: radial-gradient(1200px 600px at 10% 10%, #1a0033, #020010 60%); }
-        .neon-glow { position: fixed; inset: -20%; background: radial-gradient(circle at 20% 30%, #ff00cc22, transparent 30%), radial-gradient(circle at 80% 40%, #00e6ff22, transparent 30%), radial-gradient(circle at 50% 80%, #6600ff22, transparent 30%); pointer-events: none; z-index: 0; }
-        .header .property-title { text-shadow: 0 0 10px var(--accent), 0 0 20px var(--accent); }
-        .neon-scan { position: absolute; inset: 0; background: linear-gradient(transparent, rgba(255,255,255,0.06), transparent); animation: scan 4s linear infinite; pointer-events: none; }
-        @keyframes scan { 0%{ transform: translateY(-100%);} 100%{ transform: translateY(100%);} }
-        .neon-grid { position: absolute; left: 0; right: 0; bottom: 0; height: 220px; background: linear-gradient(transparent, rgba(0,230,255,0.05)); backdrop-filter: blur(2px); }
-        .neon-grid::before { content: ''; position: absolute; inset: 0; background-image: linear-gradient(rgba(0,230,255,0.2) 1px, transparent 1px), linear-gradient(90deg, rgba(0,230,255,0.2) 1px, transparent 1px); background-size: 20px 20px; }
-        .neon-particle { position: absolute; width: 6px; height: 6px; border-radius: 50%; background: var(--accent); box-shadow: 0 0 10px var(--accent), 0 0 20px var(--accent); animation: fly 8s linear infinite; }
-        @keyframes fly { 0%{ transform: translate(-10vw, 0);} 100%{ transform: translate(110vw, -20vh);} }
-        .btn { position: relative; border: 2px solid var(--accent); box-shadow: 0 0 12px var(--accent), inset 0 0 12px rgba(255,255,255,0.06); text-shadow: 0 0 8px var(--accent); }
-        .btn:hover { box-shadow: 0 0 18px var(--accent), inset 0 0 18px rgba(255,255,255,0.08); filter: saturate(1.2); }
-        .gallery-item { border: 1px solid rgba(255,255,255,0.08); box-shadow: 0 0 12px rgba(0,230,255,0.12); }
-        .gallery-item:hover { box-shadow: 0 0 22px rgba(255,0,204,0.18); }
-        .section-title { text-shadow: 0 0 10px rgba(0,230,255,0.4); }
-        """
-    elif style.get('key') == 'neo_premium':
-        special_classes = "neo"
-        special_bg = """
-        body.neo { background:#0f0f0f; color:#ffffff; }
-        .header { position:relative; overflow:hidden }
-        .neon-gradient { position:absolute; inset:-30%; background:radial-gradient(800px 400px at 10% 10%, rgba(138,43,226,.25), transparent 40%), radial-gradient(900px 600px at 90% 20%, rgba(0,229,255,.20), transparent 50%); filter: blur(20px); }
-        .property-title { font-family:'Space Grotesk', Inter, sans-serif; font-weight:800; letter-spacing:-.02em; text-shadow: 0 0 10px rgba(255,0,102,.4); }
-        .btn { border:none; border-radius:14px; background: linear-gradient(135deg, #ff7a18, #ff0066); box-shadow: 0 10px 30px rgba(255,0,102,.2) }
-        .gallery-item, .video-item, .map-container { background: rgba(255,255,255,.06); border:1px solid rgba(255,255,255,.08) }
-        .section-title { font-family:'Space Grotesk', Inter, sans-serif; text-shadow: 0 0 10px rgba(0,229,255,.3) }
-        """
-    elif style.get('key') == 'living_house':
-        special_classes = "living-house"
-        special_bg = """
-        .living-house .header { position: relative; overflow: hidden; }
-        .living-house .flying-house { position: fixed; top: 20%; left: 10%; width: 120px; height: 90px; background: #ff9f1c; border-radius: 12px; box-shadow: 0 10px 30px rgba(0,0,0,.3); z-index: 9999; animation: flyPath 12s ease-in-out infinite; }
-        .living-house .flying-house::before { content:''; position:absolute; bottom:-18px; left: 40px; width: 50px; height: 20px; background: rgba(0,0,0,.15); filter: blur(6px); border-radius: 50%; }
-        .living-house .house-eye { position:absolute; width: 10px; height: 10px; background:#fff; border-radius:50%; top: 28px; left: 28px; box-shadow: 0 0 0 2px #000 inset; }
-        .living-house .house-eye.right { left: 52px; }
-        .living-house .house-smile { position:absolute; width: 36px; height: 12px; border-bottom: 4px solid #000; border-radius: 0 0 36px 36px; top: 50px; left: 28px; }
-        @keyframes flyPath { 0%{ transform: translate(0,0) rotate(-2deg);} 25%{ transform: translate(40vw,-6vh) rotate(2deg);} 50%{ transform: translate(68vw,2vh) rotate(-1deg);} 75%{ transform: translate(30vw,8vh) rotate(3deg);} 100%{ transform: translate(0,0) rotate(-2deg);} }
-        .living-house .spark { position: fixed; width: 6px; height: 6px; background: #e71d36; border-radius: 50%; box-shadow: 0 0 10px #e71d36; animation: spark 1.6s linear infinite; }
-        @keyframes spark { 0%{ transform: translateY(0); opacity:1 } 100%{ transform: translateY(-40px); opacity:0 } }
-        .living-house .gallery-item:hover { transform: translateY(-6px) rotate(-.4deg) scale(1.02); box-shadow: var(--shadow-hover); }
-        .living-house .btn { position:relative; overflow:hidden }
-        .living-house .btn::after { content:''; position:absolute; inset:auto -20% -20% -20%; height:200%; width:40%; transform: rotate(25deg) translateX(-120%); background:linear-gradient(90deg, transparent, rgba(255,255,255,.28), transparent); transition: transform .6s ease; }
-        .living-house .btn:hover::after { transform: rotate(25deg) translateX(260%); }
-        """
-    elif style.get('key') == 'tropical_paradise':
-        special_classes = "tropical"
-        special_bg = """
-        body.tropical { background: linear-gradient(135deg, #ff7e5f, #feb47b); }
-        .header { background: url('tropical.jpg') no-repeat center center; background-size: cover; }
-        """
-    elif style.get('key') == 'space_station':
-        special_classes = "space"
-        special_bg = """
-        body.space { background: radial-gradient(circle at center, #000428, #004e92); }
-        .header { background: url('space.jpg') no-repeat center center; background-size: cover; }
-        """
-    elif style.get('key') == 'retro_80s':
-        special_classes = "retro"
-        special_bg = """
-        body.retro { background: linear-gradient(135deg, #ff6a00, #ee0979); }
-        .header { background: url('retro.jpg') no-repeat center center; background-size: cover; }
-        """
-    elif style.get('key') == 'cyberpunk':
-        special_classes = "cyber"
-        special_bg = """
-        body.cyber { background: linear-gradient(135deg, #0f0c29, #302b63); }
-        .header { background: url('cyberpunk.jpg') no-repeat center center; background-size: cover; }
-        """
-
-    # Google Maps
-    maps_html = ""
-    maps_url = get_google_maps_url(user_data.get('location'))
-    if maps_url:
-        maps_html = f'''
-        <section id="map" class="section">
-            <div class="container">
-                <h2 class="section-title">Расположение на карте</h2>
-                <div class="map-container">
-                    <iframe 
-                        src="{maps_url}"
-                        width="100%" 
-                        height="450" 
-                        style="border:0; border-radius: var(--radius);" 
-                        allowfullscreen="" 
-                        loading="lazy" 
-                        referrerpolicy="no-referrer-when-downgrade">
-                    </iframe>
-                    <div class="map-address">
-                        <h3>📍 Адрес объекта</h3>
-                        <p>{user_data.get('location', 'Адрес уточняется')}</p>
-                    </div>
-                </div>
-            </div>
-        </section>'''
-    else:
-        maps_html = f'''
-        <section id="location" class="section">
-            <div class="container">
-                <h2 class="section-title">Расположение</h2>
-                <div class="about-content">
-                    <h3>{user_data.get('location', 'Престижный район')}</h3>
-                    <p>Объект расположен в одном из самых престижных и развитых районов города. Отличная транспортная доступность, развитая инфраструктура, близость к парковым зонам и основным магистралям.</p>
-                </div>
-            </div>
-        </section>'''
-
-    # Контактная информация
-    contacts_html = ""
-    if user_data.get('broker_phone'):
-        contacts_html += f'''
-        <div class="contact-item">
-            <div class="contact-icon">📞</div>
-            <div class="contact-info">
-                <h4>Телефон</h4>
-                <p>{user_data['broker_phone']}</p>
-            </div>
-        </div>'''
-    
-    if user_data.get('broker_email'):
-        contacts_html += f'''
-        <div class="contact-item">
-            <div class="contact-icon">📧</div>
-            <div class="contact-info">
-                <h4>Email</h4>
-                <p>{user_data['broker_email']}</p>
-            </div>
-        </div>'''
     
-    if user_data.get('broker_tg'):
-        contacts_html += f'''
-        <div class="contact-item">
-            <div class="contact-icon">✈️</div>
-            <div class="contact-info">
-                <h4>Telegram</h4>
-                <p>@{user_data['broker_tg']}</p>
-            </div>
-        </div>'''
-    
-    # Характеристики
-    specs_html = ""
     specs = [
         ("💰 Цена", user_data.get('price')),
         ("📍 Локация", user_data.get('location')),
@@ -511,659 +468,58 @@ async def generate_website_html(user_data, media_files):
         ("📅 Срок сдачи", user_data.get('completion_date')),
     ]
     
-    for icon, value in specs:
-        if value and value not in ['Не указана', 'Не указано', 'Не указан']:
-            specs_html += f'''
-            <div class="spec-item">
-                <div class="spec-icon">{icon.split()[0]}</div>
-                <div class="spec-content">
-                    <h4>{icon}</h4>
-                    <p>{value}</p>
-                </div>
-            </div>'''
-
-    # CTA кнопки
-    cta_buttons_html = ""
-    if user_data.get('broker_phone') or user_data.get('broker_tg'):
-        cta_buttons_html += '<div class="cta-buttons">'
-        if user_data.get('broker_phone'):
-            cta_buttons_html += f'<a href="tel:{user_data["broker_phone"]}" class="btn"><i class="fas fa-phone"></i> Позвонить сейчас</a>'
-        if user_data.get('broker_tg'):
-            cta_buttons_html += f'<a href="https://t.me/{user_data["broker_tg"]}" class="btn btn-outline"><i class="fab fa-telegram"></i> Написать в Telegram</a>'
-        # Кнопка лида в Telegram с плейсхолдером (подменим позже на реальную ссылку)
-        cta_buttons_html += '<a href="LEAD_PLACEHOLDER" class="btn btn-outline"><i class="fab fa-telegram"></i> Оставить заявку в Telegram</a>'
-        cta_buttons_html += '</div>'
-    else:
-        # Если контактов нет — всё равно добавим кнопку лида
-        cta_buttons_html += '<div class="cta-buttons">'
-        cta_buttons_html += '<a href="LEAD_PLACEHOLDER" class="btn"><i class="fab fa-telegram"></i> Оставить заявку в Telegram</a>'
-        cta_buttons_html += '</div>'
-
-    html_content = f'''<!DOCTYPE html>
-<html lang="ru" class="{special_classes}">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{user_data['title']}</title>
-    <link href="https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700;800&display=swap" rel="stylesheet">
-    <link href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css" rel="stylesheet">
-    <style>
-        :root {{
-            --primary: {style['color']};
-            --secondary: {style['secondary']};
-            --accent: {style['accent']};
-            --dark: #2c3e50;
-            --light: #ecf0f1;
-            --text: #2c3e50;
-            --text-light: #7f8c8d;
-            --shadow: 0 25px 50px rgba(0,0,0,0.15);
-            --shadow-hover: 0 35px 70px rgba(0,0,0,0.25);
-            --radius: 20px;
-            --transition: all 0.4s cubic-bezier(0.25, 0.46, 0.45, 0.94);
-        }}
-        {special_bg}
-        
-        * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-        body {{ font-family: 'Inter', sans-serif; line-height: 1.7; color: var (--text); background: linear-gradient(135deg, #f8f9fa 0%, #e9ecef 100%); min-height: 100vh; }}
-        .container {{ max-width: 1400px; margin: 0 auto; padding: 0 20px; }}
-        
-        .header {{ background: linear-gradient(135deg, var(--primary) 0%, var(--secondary) 100%); color: white; padding: 80px 0; text-align: center; position: relative; overflow: hidden; }}
-        .header::before {{ content: ''; position: absolute; top: 0; left: 0; right: 0; bottom: 0; background: url('data:image/svg+xml,<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 100 100"><defs><pattern id="grain" width="100" height="100" patternUnits="userSpaceOnUse"><circle cx="50" cy="50" r="1" fill="rgba(255,255,255,0.1)"/></pattern></defs><rect width="100" height="100" fill="url(%23grain)"/></svg>'); opacity: 0.1; }}
-        .header-content {{ position: relative; z-index: 2; }}
-        .property-badge {{ background: rgba(255,255,255,0.2); backdrop-filter: blur(10px); padding: 12px 25px; border-radius: 50px; display: inline-block; margin-bottom: 30px; font-weight: 600; font-size: 0.9rem; letter-spacing: 1px; text-transform: uppercase; }}
-        .property-title {{ font-size: 4rem; font-weight: 800; margin-bottom: 20px; line-height: 1.2; text-shadow: 2px 2px 4px rgba(0,0,0,0.3); }}
-        .property-description {{ font-size: 1.4rem; margin-bottom: 40px; opacity: 0.95; max-width: 800px; margin-left: auto; margin-right: auto; line-height: 1.6; }}
-        .property-price {{ font-size: 2.5rem; font-weight: 700; margin-bottom: 40px; color: var(--accent); text-shadow: 1px 1px 2px rgba(0,0,0,0.2); }}
-        
-        .nav-scroll {{ background: white; padding: 25px 0; position: sticky; top: 0; z-index: 1000; box-shadow: 0 5px 20px rgba(0,0,0,0.1); }}
-        .nav-container {{ display: flex; justify-content: center; gap: 40px; }}
-        .nav-item {{ color: var(--text); text-decoration: none; font-weight: 600; font-size: 1.1rem; padding: 10px 20px; border-radius: 25px; transition: var(--transition); position: relative; }}
-        .nav-item:hover {{ color: var(--primary); transform: translateY(-2px); }}
-        .nav-item::after {{ content: ''; position: absolute; bottom: 0; left: 50%; width: 0; height: 3px; background: var(--primary); transition: var(--transition); transform: translateX(-50%); border-radius: 3px; }}
-        .nav-item:hover::after {{ width: 60%; }}
-        
-        .section {{ padding: 100px 0; }}
-        .section-title {{ font-size: 3rem; font-weight: 700; text-align: center; margin-bottom: 60px; color: var(--dark); position: relative; }}
-        .section-title::after {{ content: ''; position: absolute; bottom: -15px; left: 50%; transform: translateX(-50%); width: 80px; height: 4px; background: linear-gradient(90deg, var(--primary), var(--accent)); border-radius: 2px; }}
-        
-                .about-content {{ 
-            background: white; 
-            padding: 60px; 
-            border-radius: var(--radius); 
-            box-shadow: var(--shadow); 
-            margin-bottom: 60px; 
-            line-height: 1.8; 
-            font-size: 1.2rem; 
-        }}
-        
-        .specs-grid {{ 
-            display: grid; 
-            grid-template-columns: repeat(auto-fit, minmax(350px, 1fr)); 
-            gap: 30px; 
-            margin-bottom: 60px; 
-        }}
-        
-        .spec-item {{ 
-            background: white; 
-            padding: 40px; 
-            border-radius: var(--radius); 
-            box-shadow: var(--shadow); 
-            display: flex; 
-            align-items: center; 
-            gap: 25px; 
-            transition: var(--transition); 
-        }}
-        
-        .spec-item:hover {{ 
-            transform: translateY(-8px); 
-            box-shadow: var(--shadow-hover); 
-        }}
-        
-        .spec-icon {{ 
-            font-size: 2.5rem; 
-            color: var (--primary); 
-            flex-shrink: 0; 
-        }}
-        
-        .spec-content h4 {{ 
-            font-size: 1.3rem; 
-            font-weight: 600; 
-            margin-bottom: 8px; 
-            color: var (--dark); 
-        }}
-        
-        .spec-content p {{ 
-            color: var(--text-light); 
-            font-size: 1.1rem; 
-        }}
-        
-        .gallery {{ 
-            display: grid; 
-            grid-template-columns: repeat(auto-fit, minmax(400px, 1fr)); 
-            gap: 25px; 
-            margin-bottom: 60px; 
-        }}
-        
-        .gallery-item {{ 
-            position: relative; 
-            border-radius: var (--radius); 
-            overflow: hidden; 
-            box-shadow: var(--shadow); 
-            transition: var (--transition); 
-            height: 350px; 
-        }}
-        
-        .gallery-item:hover {{ 
-            transform: scale(1.03); 
-            box-shadow: var(--shadow-hover); 
-        }}
-        
-        .gallery-item img {{ 
-            width: 100%; 
-            height: 100%; 
-            object-fit: cover; 
-            transition: var(--transition); 
-        }}
-        
-        .gallery-item:hover img {{ 
-            transform: scale(1.1); 
-        }}
-        
-        .gallery-overlay {{ 
-            position: absolute; 
-            top: 20px; 
-            right: 20px; 
-            background: rgba(0,0,0,0.8); 
-            color: white; 
-            padding: 10px 15px; 
-            border-radius: 20px; 
-            font-weight: 600; 
-        }}
-        
-        .videos-grid {{ 
-            display: grid; 
-            grid-template-columns: repeat(auto-fit, minmax(500px, 1fr)); 
-            gap: 30px; 
-            margin-bottom: 60px; 
-        }}
-        
-        .video-item {{ 
-            background: white; 
-            padding: 20px; 
-            border-radius: var(--radius); 
-            box-shadow: var (--shadow); 
-        }}
-        
-        .video-wrapper {{ 
-            position: relative; 
-            padding-bottom: 56.25%; 
-            height: 0; 
-            overflow: hidden; 
-            border-radius: 15px; 
-        }}
-        
-        .video-wrapper video {{ 
-            position: absolute; 
-            top: 0; 
-            left: 0; 
-            width: 100%; 
-            height: 100%; 
-            object-fit: cover; 
-        }}
-        
-        .video-caption {{ 
-            text-align: center; 
-            margin-top: 15px; 
-            color: var(--text-light); 
-            font-weight: 600; 
-        }}
-        
-        .map-container {{ 
-            background: white; 
-            padding: 30px; 
-            border-radius: var(--radius); 
-            box-shadow: var (--shadow); 
-        }}
-        
-        .map-container iframe {{ 
-            border-radius: 15px; 
-        }}
-        
-        .map-address {{ 
-            margin-top: 20px; 
-            text-align: center; 
-        }}
-        
-        .map-address h3 {{ 
-            color: var(--primary); 
-            margin-bottom: 10px; 
-        }}
-        
-        .contact-section {{ 
-            background: linear-gradient(135deg, var(--dark) 0%, #34495e 100%); 
-            color: white; 
-            padding: 100px 0; 
-        }}
-        
-        .contact-grid {{ 
-            display: grid; 
-            grid-template-columns: repeat(auto-fit, minmax(300px, 1fr)); 
-            gap: 40px; 
-            margin-bottom: 60px; 
-        }}
-        
-        .contact-item {{ 
-            background: rgba(255,255,255,0.1); 
-            backdrop-filter: blur(10px); 
-            padding: 40px; 
-            border-radius: var(--radius); 
-            text-align: center; 
-            transition: var(--transition); 
-        }}
-        
-        .contact-item:hover {{ 
-            background: rgba(255,255,255,0.15); 
-            transform: translateY(-5px); 
-        }}
-        
-        .contact-icon {{ 
-            font-size: 3rem; 
-            margin-bottom: 20px; 
-            color: var(--accent); 
-        }}
-        
-        .contact-info h4 {{ 
-            font-size: 1.4rem; 
-            margin-bottom: 15px; 
-            color: white; 
-        }}
-        
-        .contact-info p {{ 
-            font-size: 1.2rem; 
-            opacity: 0.9; 
-        }}
-        
-        .cta-buttons {{ 
-            display: flex; 
-            justify-content: center; 
-            gap: 20px; 
-            flex-wrap: wrap; 
-        }}
-        
-        .btn {{ 
-            background: linear-gradient(135deg, var(--primary), var(--accent)); 
-            color: white; 
-            padding: 20px 40px; 
-            border: none; 
-            border-radius: 50px; 
-            font-size: 1.2rem; 
-            font-weight: 600; 
-            text-decoration: none; 
-            display: inline-flex; 
-            align-items: center; 
-            gap: 12px; 
-            transition: var(--transition); 
-            cursor: pointer; 
-            box-shadow: 0 10px 30px rgba(0,0,0,0.2); 
-        }}
-        
-        .btn:hover {{ 
-            transform: translateY(-3px); 
-            box-shadow: 0 15px 40px rgba(0,0,0,0.3); 
-            color: white; 
-        }}
-        
-        .btn-outline {{ 
-            background: transparent; 
-            border: 2px solid var(--accent); 
-            color: var(--accent); 
-        }}
-        
-        .btn-outline:hover {{ 
-            background: var(--accent); 
-            color: white; 
-        }}
-        
-        .footer {{ 
-            background: var(--dark); 
-            color: white; 
-            padding: 60px 0 30px; 
-            text-align: center; 
-        }}
-        
-        .watermark {{ 
-            opacity: 0.7; 
-            font-size: 0.9rem; 
-            margin-top: 40px; 
-            color: var(--light); 
-        }}
-        
-        @keyframes fadeInUp {{ 
-            from {{ 
-                opacity: 0; 
-                transform: translateY(50px); 
-            }}
-            to {{ 
-                opacity: 1; 
-                transform: translateY(0); 
-            }}
-        }}
-        
-        .animate {{ 
-            animation: fadeInUp 1s ease-out; 
-        }}
-        
-        /* Responsive Design */
-        @media (max-width: 1200px) {{
-            .property-title {{ font-size: 3rem; }}
-            .section-title {{ font-size: 2.5rem; }}
-        }}
-        
-        @media (max-width: 992px) {{
-            .header {{ padding: 60px 0; }}
-            .property-title {{ font-size: 2.5rem; }}
-            .property-description {{ font-size: 1.2rem; }}
-            .section {{ padding: 80px 0; }}
-        }}
-        
-        @media (max-width: 768px) {{
-            .property-title {{ font-size: 2.2rem; }}
-            .property-description {{ font-size: 1.1rem; }}
-            .property-price {{ font-size: 1.8rem; }}
-            .section-title {{ font-size: 2rem; }}
-            .section {{ padding: 60px 0; }}
-            .gallery, .videos-grid {{ grid-template-columns: 1fr; }}
-            .specs-grid {{ grid-template-columns: 1fr; }}
-            .contact-grid {{ grid-template-columns: 1fr; }}
-            .cta-buttons {{ flex-direction: column; }}
-            .nav-container {{ flex-wrap: wrap; gap: 20px; }}
-            .about-content {{ padding: 30px; }}
-            .spec-item, .contact-item {{ padding: 30px; }}
-        }}
-        
-        @media (max-width: 576px) {{
-            .property-title {{ font-size: 1.8rem; }}
-            .header {{ padding: 40px 0; }}
-            .section {{ padding: 40px 0; }}
-            .gallery-item {{ height: 300px; }}
-            .btn {{ padding: 15px 30px; font-size: 1rem; }}
-        }}
-        
-        /* Additional styles for empty states */
-        .no-specs, .no-photos, .no-videos {{ 
-            text-align: center; 
-            color: var (--text-light); 
-            font-size: 1.2rem; 
-            padding: 40px; 
-            grid-column: 1 / -1; 
-        }}
-        
-        /* Loading states */
-        .loading {{ 
-            display: inline-block; 
-            width: 20px; 
-            height: 20px; 
-            border: 3px solid rgba(255,255,255,.3); 
-            border-radius: 50%; 
-            border-top-color: #fff; 
-            animation: spin 1s ease-in-out infinite; 
-        }}
-        
-        @keyframes spin {{ 
-            to {{ transform: rotate(360deg); }} 
-        }}
-        
-        /* Accessibility */
-        @media (prefers-reduced-motion: reduce) {{
-            *, *::before, *::after {{
-                animation-duration: 0.01ms !important;
-                animation-iteration-count: 1 !important;
-                transition-duration: 0.01ms !important;
-                scroll-behavior: auto !important;
-            }}
-        }}
-        
-        /* Focus styles for accessibility */
-        a:focus, button:focus, input:focus, textarea:focus {{
-            outline: 2px solid var(--accent);
-            outline-offset: 2px;
-        }}
-        
-        /* High contrast mode support */
-        @media (prefers-contrast: high) {{
-            :root {{
-                --text: #000000;
-                --text-light: #333333;
-                --light: #ffffff;
-            }}
-            
-            .header {{
-                background: var(--primary);
-            }}
-            
-            .spec-item, .about-content {{
-                border: 2px solid var (--primary);
-            }}
-        }}
-        
-        /* Dark mode support */
-        @media (prefers-color-scheme: dark) {{
-            body {{
-                background: linear-gradient(135deg, #1a1a1a 0%, #2d2d2d 100%);
-                color: #ffffff;
-            }}
-            
-            .about-content, .spec-item, .gallery-item, .video-item, .map-container {{
-                background: #2d2d2d;
-                color: #ffffff;
-            }}
-            
-            .spec-content h4, .spec-content p {{
-                color: #ffffff;
-            }}
-            
-            .nav-scroll {{
-                background: #1a1a1a;
-            }}
-            
-            .nav-item {{
-                color: #ffffff;
-            }}
-        }}
-    </style>
-</head>
-<body>
-    {"<div class='neon-gradient'></div>" if style.get('key') == 'neo_premium' else ''}
-    <header class="header">
-        <div class="container">
-            <div class="header-content animate">
-                <div class="property-badge">Элитная недвижимость</div>
-                <h1 class="property-title">{user_data['title']}</h1>
-                <p class="property-description">{user_data['description']}</p>
-                <div class="property-price">{user_data.get('price', 'Цена по запросу')}</div>
-                {cta_buttons_html}
-            </div>
-            {"<div class='neon-scan'></div><div class='neon-grid'></div>" if style.get('key') == 'neon_city' else ''}
-        </div>
-    </header>
-
-    <nav class="nav-scroll">
-        <div class="container">
-            <div class="nav-container">
-                <a href="#about" class="nav-item">О проекте</a>
-                <a href="#specs" class="nav-item">Характеристики</a>
-                <a href="#gallery" class="nav-item">Галерея</a>
-                {"<a href=\"#videos\" class=\"nav-item\">Видео</a>" if videos_html else ''}
-                <a href="#map" class="nav-item">Карта</a>
-                {"<a href=\"#contact\" class=\"nav-item\">Контакты</a>" if contacts_html else ''}
-            </div>
-        </div>
-    </nav>
-
-    <section id="about" class="section">
-        <div class="container">
-            <h2 class="section-title">О проекте</h2>
-            <div class="about-content animate">
-                <p>{user_data['description']}</p>
-            </div>
-        </div>
-    </section>
-
-    <section id="specs" class="section" style="background: #f8f9fa;">
-        <div class="container">
-            <h2 class="section-title">Характеристики</h2>
-            <div class="specs-grid">
-                {specs_html if specs_html else '<p class="no-specs">Характеристики не указаны</p>'}
-            </div>
-        </div>
-    </section>
-
-    <section id="gallery" class="section">
-        <div class="container">
-            <h2 class="section-title">Фотогалерея</h2>
-            <div class="gallery">
-                {gallery_html if gallery_html else '<p class="no-photos">Фотографии не добавлены</p>'}
-            </div>
-        </div>
-    </section>
-
-    {videos_html if videos_html else ''}
-
-    {maps_html if maps_html else f'''
-    <section id="location" class="section">
-        <div class="container">
-            <h2 class="section-title">Расположение</h2>
-            <div class="about-content">
-                <h3>{user_data.get('location', 'Престижный район')}</h3>
-                <p>Объект расположен в одном из самых престижных и развитых районов города. Отличная транспортная доступность, развитая инфраструктура, близость к парковым зонам и основным магистралям.</p>
-            </div>
-        </div>
-    </section>'''}
-
-    {f'''
-    <section id="contact" class="contact-section">
-        <div class="container">
-            <h2 class="section-title" style="color: white;">Контакты</h2>
-            <div class="contact-grid">{contacts_html}</div>
-            {cta_buttons_html}
-        </div>
-    </section>
-    ''' if contacts_html else ''}
-
-    <footer class="footer">
-        <div class="container">
-            <p>© 2024 {user_data['title']}. Все права защищены.</p>
-            <div class="watermark">Сайт создан через @ANton618_bot</div>
-        </div>
-    </footer>
-
-    <script>
-        // Плавная прокрутка
-        document.querySelectorAll('a[href^="#"]').forEach(anchor => {{
-            anchor.addEventListener('click', function (e) {{
-                e.preventDefault();
-                const target = document.querySelector(this.getAttribute('href'));
-                if (target) {{
-                    target.scrollIntoView({{
-                        behavior: 'smooth',
-                        block: 'start'
-                    }});
-                }}
-            }});
-        }});
-
-        // Анимации при скролле
-        const observerOptions = {{
-            threshold: 0.1,
-            rootMargin: '0px 0px -100px 0px'
-        }};
-
-        const observer = new IntersectionObserver((entries) => {{
-            entries.forEach(entry => {{
-                if (entry.isIntersecting) {{
-                    entry.target.classList.add('animate');
-                }}
-            }});
-        }}, observerOptions);
-
-        document.querySelectorAll('.spec-item, .gallery-item, .video-item, .contact-item, .about-content').forEach(el => {{
-            observer.observe(el);
-        }});
-
-        // Фиксированная навигация
-        window.addEventListener('scroll', () => {{
-            const nav = document.querySelector('.nav-scroll');
-            if (window.scrollY > 200) {{
-                nav.style.position = 'fixed';
-                nav.style.width = '100%';
-                nav.style.top = '0';
-            }} else {{
-                nav.style.position = 'static';
-            }}
-        }});
-
-        // Lazy loading для изображений
-        if ('loading' in HTMLImageElement.prototype) {{
-            const images = document.querySelectorAll('img[loading="lazy"]');
-            images.forEach(img => {{
-                img.src = img.dataset.src;
-            }});
-        }}
-
-        // Обработка видео
-        const videos = document.querySelectorAll('video');
-        videos.forEach(video => {{
-            video.addEventListener('click', function() {{
-                if (this.paused) {{
-                    this.play();
-                }} else {{
-                    this.pause();
-                }}
-            }});
-        }});
-
-        // Параллакс эффект для header
-        window.addEventListener('scroll', () => {{
-            const scrolled = window.pageYOffset;
-            const parallax = document.querySelector('.header');
-            if (parallax) {{
-                parallax.style.backgroundPositionY = -(scrolled * 0.5) + 'px';
-            }}
-        }});
-
-        // Обработка ошибок загрузки медиа
-        document.addEventListener('error', function(e) {{
-            if (e.target.tagName === 'IMG') {{
-                e.target.style.display = 'none';
-            }} else if (e.target.tagName === 'VIDEO') {{
-                e.target.parentElement.innerHTML = '<p>Не удалось загрузить видео</p>';
-            }}
-        }}, true);
-
-        // Аналитика просмотров
-        window.addEventListener('load', function() {{
-            const timeSpent = Date.now();
-            window.addEventListener('beforeunload', function() {{
-                const totalTime = Date.now() - timeSpent;
-                console.log('Время на сайте:', Math.round(totalTime/1000), 'секунд');
-            }});
-        }});
-
-        // Оптимизация производительности
-        let resizeTimer;
-        window.addEventListener('resize', function() {{
-            clearTimeout(resizeTimer);
-            resizeTimer = setTimeout(function() {{
-                document.body.classList.add('resize-animation-stopper');
-                setTimeout(function() {{
-                    document.body.classList.remove('resize-animation-stopper');
-                }}, 400);
-            }}, 400);
-        }});
-    </script>
-</body>
-</html>'''
-    return html_content
+    return {
+        'style': style,
+        'title': user_data['title'],
+        'description': user_data['description'],
+        'price': user_data.get('price', 'Цена по запросу'),
+        'location': user_data.get('location'),
+        'maps_url': get_google_maps_url(user_data.get('location')),
+        'maps_link': get_google_maps_url(user_data.get('location'), embed=False),
+        # Как грузится карта: iframe сразу или заглушка (click/visible); NULL у старых сайтов — iframe
+        'map_mode': user_data.get('map_mode') or 'iframe',
+        'specs': [(label, value) for label, value in specs if value and value not in ['Не указана', 'Не указано', 'Не указан']],
+        'photos': [m for m in media_files if m['type'] == 'photo' and m.get('src')],
+        'videos': [m for m in media_files if m['type'] == 'video' and m.get('src')],
+        'contacts': {'phone': user_data.get('broker_phone'), 'email': user_data.get('broker_email'),
+                     'tg': user_data.get('broker_tg')},
+        # Кнопка лида: deep-link на бота, site_id известен до рендера
+        'lead_link': lead_link,
+    }
+
+def generate_website_html(user_data, media_files, lead_link, page, document=None, lite=False):
+    """Генерирует профессиональный HTML сайт с видео и картами потоком в файл page.
+
+    CSS/JS подключаются общими файлами из sites/assets; в document (если задан) параллельно
+    пишется копия со встроенными CSS/JS — для файла, который открывают без остальной публикации.
+    lite=True — облегчённая версия для слабых телефонов (lite.html).
+    """
+    context = site_context(user_data, media_files, lead_link)
+    # Разметка, CSS и JS — в templates/, здесь только данные страницы
+    return site_renderer.publish(context['style'].get('key'), page, document, lite=lite, **context)
+
+# Поля объекта, которые попадают в страницу
+RENDER_FIELDS = ('title', 'description', 'price', 'location', 'area', 'rooms', 'completion_date',
+                 'broker_phone', 'broker_email', 'broker_tg')
+
+# В кэше рендера вместо лид-ссылки (в ней site_id) — плейсхолдер: одинаковые объявления
+# делят одну запись, ссылка конкретного сайта подставляется после выборки из кэша
+LEAD_PLACEHOLDER = 'LEAD_PLACEHOLDER'
+
+def render_cache_key(user_data, media_files):
+    """Хэш всего, от чего зависит HTML, кроме лид-ссылки: поля объекта, медиа (по хэшам
+    содержимого), стиль и версия шаблонов"""
+    style = user_data.get('style') or {}
+    payload = {
+        'map_mode': user_data.get('map_mode') or 'iframe',
+        'fields': {field: str(user_data.get(field) or '').strip() for field in RENDER_FIELDS},
+        'style': {k: style.get(k) for k in ('key', 'name', 'color', 'secondary', 'accent')},
+        'media': [[m.get('type'), m.get('sha256') or m.get('file_id'),
+                   [v.get('sha256') for v in m.get('variants') or []],
+                   (m.get('poster') or {}).get('sha256')] for m in media_files],
+        'templates': site_renderer.version,
+    }
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode()).hexdigest()
 
 # ===== ОСНОВНЫЕ ОБРАБОТЧИКИ =====
 
@@ -1171,14 +527,7 @@ async def generate_website_html(user_data, media_files):
 async def start(message: types.Message):
     user_id = message.from_user.id
     
-    conn = sqlite3.connect('realtor_bot.db')
-    cursor = conn.cursor()
-    cursor.execute(
-        'INSERT OR IGNORE INTO users (user_id, username, first_name) VALUES (?, ?, ?)',
-        (user_id, message.from_user.username, message.from_user.first_name)
-    )
-    conn.commit()
-    conn.close()
+    await db.add_user(user_id, message.from_user.username, message.from_user.first_name)
     
     # Обработка deep-link: /start lead_<site_id>
     payload = None
@@ -1190,7 +539,7 @@ async def start(message: types.Message):
     if payload and payload.startswith('lead_'):
         try:
             site_id = int(payload.split('_')[1])
-            user_sessions[user_id] = { 'state': 'lead_collect', 'lead_site_id': site_id }
+            reset_session(user_id, { 'state': 'lead_collect', 'lead_site_id': site_id })
             await message.answer(
                 "📩 <b>Заявка по объекту принята!</b>\n\n"
                 "Оставьте, пожалуйста, контакт: \n"
@@ -1221,7 +570,7 @@ async def start(message: types.Message):
 @dp.message(F.text == "🌐 Создать сайт")
 async def start_creation(message: types.Message):
     user_id = message.from_user.id
-    user_sessions[user_id] = {
+    reset_session(user_id, {
         'state': 'waiting_media_type',
         'media': [],
         'title': '',
@@ -1235,7 +584,7 @@ async def start_creation(message: types.Message):
         'broker_email': '',
         'broker_tg': '',
         'style': {}
-    }
+    })
     await message.answer(
         "📸 <b>ШАГ 1: Медиафайлы объекта</b>\n\n"
         "Выберите тип медиа для загрузки:\n"
@@ -1291,46 +640,31 @@ async def handle_photo_upload(message: types.Message):
     user_id = message.from_user.id
     if user_id not in user_sessions: return
     
-    photo_data = await download_photo(message.photo[-1].file_id)
-    if photo_data:
-        user_sessions[user_id]['media'].append({
-            'type': 'photo',
-            'file_id': message.photo[-1].file_id,
-            'data': photo_data
-        })
-        
-        count = len([m for m in user_sessions[user_id]['media'] if m['type'] == 'photo'])
-        await message.answer(
-            f"✅ Фото #{count} добавлено!\n\n"
-            f"Загружено: {count} фото, {len([m for m in user_sessions[user_id]['media'] if m['type'] == 'video'])} видео\n\n"
-            "Продолжайте загружать медиа или нажмите «✅ Завершить загрузку»",
-            reply_markup=get_media_type_keyboard()
-        )
-    else:
-        await message.answer("❌ Ошибка обработки фото. Попробуйте еще раз.")
+    photo = message.photo[-1]
+    # Скачивание и обработка идут в фоне, ответ приходит сразу
+    await accept_media(message, {
+        'type': 'photo',
+        'file_id': photo.file_id,
+        'file_unique_id': photo.file_unique_id,
+    })
 
 @dp.message(F.video, lambda msg: user_sessions.get(msg.from_user.id, {}).get('state') == 'waiting_video')
 async def handle_video_upload(message: types.Message):
     user_id = message.from_user.id
     if user_id not in user_sessions: return
     
-    video_data = await download_video(message.video.file_id)
-    if video_data:
-        user_sessions[user_id]['media'].append({
-            'type': 'video',
-            'file_id': message.video.file_id,
-            'thumbnail': f"https://img.youtube.com/vi/dQw4w9WgXcQ/mqdefault.jpg"  # Заглушка
-        })
-        
-        count = len([m for m in user_sessions[user_id]['media'] if m['type'] == 'video'])
-        await message.answer(
-            f"✅ Видео #{count} добавлено!\n\n"
-            f"Загружено: {len([m for m in user_sessions[user_id]['media'] if m['type'] == 'photo'])} фото, {count} видео\n\n"
-            "Продолжайте загружать медиа или нажмите «✅ Завершить загрузку»",
-            reply_markup=get_media_type_keyboard()
-        )
-    else:
-        await message.answer("❌ Ошибка обработки видео. Попробуйте еще раз.")
+    if message.video.file_size and message.video.file_size > VIDEO_MAX_BYTES:
+        await message.answer(f"❌ Видео больше {VIDEO_MAX_BYTES // (1024 * 1024)} МБ. Сожмите его или отправьте другое.")
+        return
+    
+    # Видео качается и обрабатывается в фоне, пока пользователь заполняет остальные шаги
+    await accept_media(message, {
+        'type': 'video',
+        'file_id': message.video.file_id,
+        'file_unique_id': message.video.file_unique_id,
+        'duration': message.video.duration,
+        'thumb_file_id': message.video.thumbnail.file_id if message.video.thumbnail else None
+    })
 
 @dp.message(F.text == "✅ Завершить загрузку")
 async def handle_finish_media(message: types.Message):
@@ -1579,189 +913,382 @@ async def handle_contacts(message: types.Message):
     user_sessions[user_id]['state'] = 'generating'
     await generate_website(message)
 
+async def legacy_photo_bytes(m, source_dir):
+    """Исходник фото из записей до появления хранилища: base64 или файл старой публикации"""
+    data = m.get('data') or ''
+    if data.startswith('data:image'):
+        return base64.b64decode(data.split('base64,', 1)[1])
+    candidates = [v['src'] for v in m.get('variants') or [] if v.get('format') == 'jpeg']
+    candidates = candidates[-1:] + ([m['src']] if m.get('src') else [])
+    for src in candidates:
+        old_path = os.path.join(source_dir, src) if source_dir else None
+        if old_path and os.path.exists(old_path):
+            with open(old_path, 'rb') as imgf:
+                return imgf.read()
+    return await download_bytes(m['file_id'])
+
+def blobs_present(entry):
+    """Все ли блобы записи лежат в хранилище (stat на диске — звать через to_thread)"""
+    return all(media_store.has(sha, ext) for sha, ext in entry_blobs(entry))
+
+async def publish_media(media, publish_dir, source_dir=None, status_message=None):
+    """Публикует медиа из хранилища в папку сайта до рендера и проставляет относительные ссылки (src)"""
+    media_dir = os.path.join(publish_dir, 'media')
+    os.makedirs(media_dir, exist_ok=True)
+    
+    for m in media:
+        try:
+            if m.get('type') == 'photo':
+                entry = m if m.get('sha256') else None
+                if entry and not await asyncio.to_thread(blobs_present, entry):
+                    entry = await asyncio.to_thread(media_store.lookup, m.get('file_unique_id'))
+                if not entry:
+                    # Хранилище очищено или запись старого формата — обрабатываем заново
+                    if m.get('sha256') and m.get('file_id'):
+                        raw = await download_bytes(m['file_id'])
+                    else:
+                        raw = await legacy_photo_bytes(m, source_dir)
+                    entry = await process_photo_bytes(raw)
+                    await asyncio.to_thread(media_store.remember, m.get('file_unique_id'), entry)
+                m.update(entry)
+                m.pop('data', None)
+                
+                for v in m['variants']:
+                    # Имена по хэшу: одинаковые фото в разных сайтах — один и тот же блоб
+                    v['src'] = f"media/{v['sha256'][:16]}.{v['ext']}"
+                    await asyncio.to_thread(media_store.link, v['sha256'], v['ext'], os.path.join(publish_dir, v['src']))
+                jpegs = [v for v in m['variants'] if v['format'] == 'jpeg']
+                # Фолбэк для старых браузеров — средняя по ширине JPEG-копия
+                m['src'] = jpegs[len(jpegs) // 2]['src']
+                m['width'] = jpegs[-1]['width']
+                m['height'] = jpegs[-1]['height']
+            elif m.get('type') == 'video' and m.get('file_id'):
+                entry = m if m.get('sha256') and await asyncio.to_thread(blobs_present, m) else None
+                if not entry:
+                    old_path = os.path.join(source_dir, m['src']) if source_dir and m.get('src') else None
+                    if old_path and os.path.exists(old_path):
+                        incoming = os.path.join(MEDIA_STORE_DIR, 'incoming')
+                        os.makedirs(incoming, exist_ok=True)
+                        fd, part_path = tempfile.mkstemp(dir=incoming, suffix='.part')
+                        os.close(fd)
+                        await asyncio.to_thread(shutil.copyfile, old_path, part_path)
+                        entry = await store_video(part_path, m.get('duration'), m.get('thumb_file_id'))
+                    else:
+                        progress = progress_reporter(status_message, "Загружаю видео") if status_message else None
+                        entry = await download_video_file(m['file_id'], m.get('file_unique_id'), progress,
+                                                          m.get('duration'), m.get('thumb_file_id'))
+                m.update(entry)
+                m['src'] = f"media/{m['sha256'][:16]}.mp4"
+                # Без жёстких ссылок link() копирует файл — для видео это в потоке
+                await asyncio.to_thread(media_store.link, m['sha256'], 'mp4', os.path.join(publish_dir, m['src']))
+                if m.get('poster'):
+                    m['poster_src'] = f"media/{m['poster']['sha256'][:16]}.jpg"
+                    await asyncio.to_thread(media_store.link, m['poster']['sha256'], 'jpg',
+                                            os.path.join(publish_dir, m['poster_src']))
+        except DownloadTooLarge:
+            logger.error(f"Видео {m.get('file_id')} больше {VIDEO_MAX_BYTES} байт, пропускаем")
+        except Exception as me:
+            logger.error(f"Ошибка сохранения медиа: {me}")
+
+def photo_savings(media):
+    """Сколько байт фото весили при загрузке и сколько весят на сайте (самые широкие копии)"""
+    original = published = 0
+    for m in media:
+        sizes = [v.get('size', 0) for v in m.get('variants') or []]
+        if m.get('type') == 'photo' and m.get('original_bytes') and sizes:
+            original += m['original_bytes']
+            published += max(sizes)
+    return original, published
+
+# Ссылки на медиа в атрибутах страницы: src="media/..", poster="media/..", srcset="media/.. 480w, media/.. 960w"
+MEDIA_ATTR = re.compile(r'(\s(?:src|srcset|poster)=")([^"]*)"')
+MEDIA_SRCSET = re.compile(r'<source\b[^>]*\ssrcset="media/[^>]*>|\ssrcset="media/[^"]*"(?:\s+sizes="[^"]*")?')
+MEDIA_MIME = {'jpg': 'image/jpeg', 'webp': 'image/webp'}
+
+def document_media(html, media, publish_dir, base_url=None):
+    """Копия страницы для Telegram без папки media/ рядом: ссылки на медиа ведут на опубликованный
+    сайт (base_url), а без него фото встраиваются самой маленькой JPEG-копией, обложки видео — целиком"""
+    if base_url:
+        def absolute(match):
+            value = re.sub(r'(^|,\s*)media/', lambda m: f"{m.group(1)}{base_url}media/", match.group(2))
+            return f'{match.group(1)}{value}"'
+        return MEDIA_ATTR.sub(absolute, html)
+    
+    def data_uri(src):
+        ext = src.rsplit('.', 1)[-1]
+        with open(os.path.join(publish_dir, src), 'rb') as f:
+            return f"data:{MEDIA_MIME.get(ext, 'image/jpeg')};base64,{base64.b64encode(f.read()).decode()}"
+    
+    inline = {}
+    for m in media:
+        try:
+            if m.get('type') == 'photo' and m.get('src'):
+                jpegs = [v for v in m.get('variants') or [] if v.get('format') == 'jpeg' and v.get('src')]
+                uri = data_uri(min(jpegs, key=lambda v: v['width'])['src'] if jpegs else m['src'])
+                for src in [m['src']] + [v['src'] for v in m.get('variants') or [] if v.get('src')]:
+                    inline[src] = uri
+            elif m.get('type') == 'video' and m.get('poster_src'):
+                inline[m['poster_src']] = data_uri(m['poster_src'])
+        except OSError as e:
+            logger.error(f"Не удалось встроить медиа {m.get('src')}: {e}")
+    # srcset с файлами из media/ в копии не нужен — остаётся одна встроенная картинка
+    html = MEDIA_SRCSET.sub('', html)
+    return MEDIA_ATTR.sub(lambda match: f'{match.group(1)}{inline.get(match.group(2), match.group(2))}"', html)
+
+def buffer_text(buffer):
+    """Текст из буфера байт без промежуточной копии; буфер после этого освобождается"""
+    with buffer.getbuffer() as view:
+        text = str(view, 'utf-8')
+    buffer.close()
+    return text
+
+def document_file(document, media, publish_dir, base_url=None):
+    """Байты файла для Telegram из буфера встроенной копии (буфер освобождается по ходу)"""
+    return document_media(buffer_text(document), media, publish_dir, base_url).encode('utf-8')
+
+def write_page(path, render, document=None, capture=None):
+    """Публикует страницу: render(page, document) пишет HTML потоком, здесь он минифицируется
+    и сохраняется вместе с .gz/.br-копиями; capture (если задан) получает те же минифицированные
+    байты, что и файл. Возвращает размеры файлов и исходный размер"""
+    with PrecompressedFile(path, brotli_quality=PAGE_BROTLI_QUALITY) as pf:
+        page = HtmlMinifier(TeeWriter(pf, capture) if capture is not None else pf, PUBLISH_MINIFY)
+        document_page = HtmlMinifier(document, PUBLISH_MINIFY) if document is not None else None
+        render(page, document_page)
+        page.close()
+        if document_page is not None:
+            document_page.close()
+    return dict(pf.sizes, original=page.bytes_in)
+
+def write_service_worker(style_key, publish_dir):
+    """Service worker с манифестом опубликованных файлов: повторные визиты — из кэша браузера"""
+    return write_precompressed(os.path.join(publish_dir, 'sw.js'),
+                               site_renderer.service_worker(style_key, publish_dir).encode('utf-8'))
+
 async def generate_website(message: types.Message):
     user_id = message.from_user.id
     user_data = user_sessions[user_id]
     
-    await message.answer("⏳ <b>Создаю профессиональный сайт...</b>\n\nЭто займет 1-2 минуты")
+    status_message = await message.answer("⏳ <b>Создаю профессиональный сайт...</b>\n\nЭто займет 1-2 минуты")
     
+    site_id = None
+    saved = False
     try:
-        # Генерируем HTML с медиафайлами
-        html_content = await generate_website_html(user_data, user_data['media'])
+        # Режим карты фиксируется за сайтом — по нему /stats сравнивает вес страниц
+        user_data['map_mode'] = user_data.get('map_mode') or MAP_MODE
+        # Сначала создаём запись, чтобы знать site_id (папка публикации и лид-ссылка)
+        site_id = await db.create_website(user_id, user_data)
         
-        # Сохраняем в базу
-        conn = sqlite3.connect('realtor_bot.db')
-        cursor = conn.cursor()
-        cursor.execute(
-            '''INSERT INTO websites 
-            (user_id, title, description, price, location, area, rooms, completion_date, 
-             broker_phone, broker_email, broker_tg, style_used, html_content, media_files) 
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-            (user_id, user_data['title'], user_data['description'], user_data['price'], 
-             user_data['location'], user_data['area'], user_data['rooms'], user_data['completion_date'],
-             user_data.get('broker_phone'), user_data.get('broker_email'), user_data.get('broker_tg'),
-             (user_data.get('style') or {}).get('name', ''), html_content, json.dumps(user_data['media'], ensure_ascii=False))
-        )
-        site_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        
-        # Подменяем ссылку для лида на реальную deep-link ссылку
         bot_username = "ANton618_bot"
         lead_link = f"https://t.me/{bot_username}?start=lead_{site_id}"
-        html_content = html_content.replace('LEAD_PLACEHOLDER', lead_link)
         
-        # Папка публикации
+        # Папка публикации: медиа пишем до рендера, чтобы страница ссылалась на файлы, а не на base64
         publish_dir = os.path.join('sites', f'site_{site_id}')
-        media_dir = os.path.join(publish_dir, 'media')
-        os.makedirs(media_dir, exist_ok=True)
-        
-        # Сохранение фото как файлов и замена data:base64 на ссылки
-        try:
-            photo_index = 1
-            for m in user_data['media']:
-                if m.get('type') == 'photo' and m.get('data') and m['data'].startswith('data:image'):
-                    try:
-                        b64 = m['data'].split('base64,', 1)[1]
-                        data_bytes = base64.b64decode(b64)
-                        rel_path = f'media/photo_{photo_index}.jpg'
-                        abs_path = os.path.join(publish_dir, rel_path)
-                        with open(abs_path, 'wb') as imgf:
-                            imgf.write(data_bytes)
-                        # Заменяем base64 на относительный путь
-                        m['data'] = rel_path
-                        photo_index += 1
-                    except Exception as ie:
-                        logger.error(f"Ошибка сохранения фото: {ie}")
-        except Exception as se:
-            logger.error(f"Ошибка обработки медиа: {se}")
+        source_dir = None
+        if user_data.get('regenerate_site_id'):
+            source_dir = os.path.join('sites', f"site_{user_data['regenerate_site_id']}")
+        await await_prefetch(user_data, status_message)
+        await publish_media(user_data['media'], publish_dir, source_dir, status_message)
+        
+        original_bytes, published_bytes = photo_savings(user_data['media'])
+        savings_line = ""
+        if original_bytes:
+            saved_pct = round(100 * (original_bytes - published_bytes) / original_bytes)
+            savings_line = f"📉 <b>Вес фото:</b> {original_bytes // 1024} КБ → {published_bytes // 1024} КБ (−{saved_pct}%)\n"
+            logger.info(f"Сайт {site_id}: фото {original_bytes} → {published_bytes} байт, экономия {original_bytes - published_bytes}")
+        
+        # Тот же набор данных уже рендерился — берём готовый HTML (в кэше он с плейсхолдером
+        # вместо лид-ссылки, так его делят одинаковые объявления), иначе рендерим потоком:
+        # страница сразу минифицируется и пишется в папку публикации вместе с .gz/.br-копиями
+        # и в буфер для кэша, а копия со встроенными CSS/JS — в буфер для отправки.
+        # Рядом публикуется lite.html — облегчённая версия для слабых телефонов.
+        # Рендер и сжатие идут в потоке, чтобы бот не стоял на время сборки страницы
+        render_key = render_cache_key(user_data, user_data['media'])
+        style_key = (user_data.get('style') or {}).get('key')
+        publish_path = os.path.join(publish_dir, 'index.html')
+        lite_path = os.path.join(publish_dir, 'lite.html')
+        document = io.BytesIO()
+        rendered = render_cache.get(render_key)
+        if rendered is None:
+            page_buffer, lite_buffer = io.BytesIO(), io.BytesIO()
+            page_sizes = await asyncio.to_thread(write_page, publish_path, lambda page, document_page: generate_website_html(
+                user_data, user_data['media'], lead_link, page, document_page), document, page_buffer)
+            lite_sizes = await asyncio.to_thread(write_page, lite_path, lambda page, _: generate_website_html(
+                user_data, user_data['media'], lead_link, page, lite=True), None, lite_buffer)
+            page_html = buffer_text(page_buffer)
+            lite_html = buffer_text(lite_buffer)
+            render_cache.put(render_key, {
+                'original_bytes': page_sizes['original'], 'lite_original_bytes': lite_sizes['original'],
+                'page': page_html.replace(lead_link, LEAD_PLACEHOLDER),
+                'lite': lite_html.replace(lead_link, LEAD_PLACEHOLDER),
+            })
+        else:
+            page_html = rendered['page'].replace(LEAD_PLACEHOLDER, lead_link)
+            lite_html = rendered['lite'].replace(LEAD_PLACEHOLDER, lead_link)
+            page_sizes = dict(await asyncio.to_thread(write_precompressed, publish_path, page_html.encode('utf-8'),
+                                                      PAGE_BROTLI_QUALITY), original=rendered.get('original_bytes'))
+            lite_sizes = dict(await asyncio.to_thread(write_precompressed, lite_path, lite_html.encode('utf-8'),
+                                                      PAGE_BROTLI_QUALITY), original=rendered.get('lite_original_bytes'))
+            document.write(site_renderer.inline_assets(page_html, style_key).encode('utf-8'))
+        sw_sizes = await asyncio.to_thread(write_service_worker, style_key, publish_dir)
+        
+        await db.record_site_files(site_id, {'index.html': page_sizes, 'lite.html': lite_sizes, 'sw.js': sw_sizes,
+                                             **site_renderer.asset_sizes(style_key),
+                                             **site_renderer.asset_sizes(style_key, lite=True)})
+        page_line = f"🗜 <b>Страница:</b> {page_sizes['bytes'] // 1024} КБ"
+        if page_sizes['original']:
+            page_line = f"🗜 <b>Страница:</b> {page_sizes['original'] // 1024} КБ → {page_sizes['bytes'] // 1024} КБ"
+        page_line += f", gzip {page_sizes['gzip'] // 1024} КБ; lite-версия {lite_sizes['bytes'] // 1024} КБ\n"
+        logger.info(f"Сайт {site_id}: страница {page_sizes}, lite {lite_sizes}")
+        
+        await db.save_render(
+            site_id, page_html, json.dumps(user_data['media'], ensure_ascii=False), render_key,
+            json.dumps(site_renderer.section_keys(site_context(user_data, user_data['media'], lead_link))),
+            site_renderer.version
+        )
+        saved = True
         
-        # Сохранение видео как файлов
-        try:
-            video_index = 1
-            for m in user_data['media']:
-                if m.get('type') == 'video' and m.get('file_id'):
-                    try:
-                        file = await bot.get_file(m['file_id'])
-                        video_data = await bot.download_file(file.file_path)
-                        rel_path = f'media/video_{video_index}.mp4'
-                        abs_path = os.path.join(publish_dir, rel_path)
-                        with open(abs_path, 'wb') as vidf:
-                            vidf.write(video_data.read())
-                        # Заменяем file_id на относительный путь
-                        m['file_id'] = rel_path
-                        video_index += 1
-                    except Exception as ve:
-                        logger.error(f"Ошибка сохранения видео: {ve}")
-        except Exception as se:
-            logger.error(f"Ошибка обработки видео: {se}")
+        site_url = f"{SITE_BASE_URL}/site_{site_id}/" if SITE_BASE_URL else f"sites/site_{site_id}/index.html"
+        # Файл в Telegram уходит без папки media/ — медиа по ссылкам на сайт или встроенные
+        document_bytes = await asyncio.to_thread(
+            document_file, document, user_data['media'], publish_dir, site_url if SITE_BASE_URL else None)
         
-        # Публикация
-        try:
-            os.makedirs(publish_dir, exist_ok=True)
-            publish_path = os.path.join(publish_dir, 'index.html')
-            with open(publish_path, 'w', encoding='utf-8') as pf:
-                pf.write(html_content)
-        except Exception as pe:
-            logger.error(f"Ошибка публикации сайта: {pe}")
-        
-        # Отправка файла пользователю
+        # Отправка файла пользователю прямо из буфера
         filename = f"site_{user_data['title'].replace(' ', '_')}.html"
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(html_content)
-        
-        with open(filename, 'rb') as f:
-            await message.answer_document(
-                types.BufferedInputFile(
-                    f.read(),
-                    filename=filename
-                ),
-                caption=(
-                    f"🎉 <b>Сайт успешно создан!</b>\n\n"
-                    f"🏠 <b>Название:</b> {user_data['title']}\n"
-                    f"🎨 <b>Стиль:</b> {(user_data.get('style') or {}).get('name', 'Авто')}\n"
-                    f"📷 <b>Медиа:</b> {len([m for m in user_data['media'] if m['type'] == 'photo'])} фото, {len([m for m in user_data['media'] if m['type'] == 'video'])} видео\n"
-                    f"🗺️ <b>Карта:</b> {'Да' if user_data.get('location') else 'Нет'}\n\n"
-                    f"🌐 <b>Путь публикации:</b> sites/site_{site_id}/index.html\n"
-                    f"📩 <b>Лид-ссылка:</b> {lead_link}\n"
-                    f"💾 <b>Сохраните файл и откройте в браузере</b>"
-                ),
-                reply_markup=get_main_menu()
-            )
-        
-        os.remove(filename)
+        await message.answer_document(
+            types.BufferedInputFile(
+                document_bytes,
+                filename=filename
+            ),
+            caption=(
+                f"🎉 <b>Сайт успешно создан!</b>\n\n"
+                f"🏠 <b>Название:</b> {user_data['title']}\n"
+                f"🎨 <b>Стиль:</b> {(user_data.get('style') or {}).get('name', 'Авто')}\n"
+                f"📷 <b>Медиа:</b> {media_counts(user_data)['photo']} фото, {media_counts(user_data)['video']} видео\n"
+                f"🗺️ <b>Карта:</b> {'Да' if user_data.get('location') else 'Нет'}\n"
+                f"{savings_line}"
+                f"{page_line}\n"
+                f"🌐 <b>Опубликован:</b> {site_url}\n"
+                f"📩 <b>Лид-ссылка:</b> {lead_link}\n"
+                + ("💾 <b>Фото и видео в файле загружаются с опубликованного сайта</b>" if SITE_BASE_URL else
+                   "💾 <b>Фото встроены в файл, видео — на опубликованном сайте</b>")
+            ),
+            reply_markup=get_main_menu()
+        )
         
     except Exception as e:
         logger.error(f"Ошибка генерации сайта: {e}")
+        if site_id is not None and not saved:
+            # Запись создаётся до рендера (нужен site_id) — без страницы ей не место в «Мои сайты»
+            try:
+                await db.delete_website(site_id, user_id)
+                await asyncio.to_thread(shutil.rmtree, os.path.join('sites', f'site_{site_id}'), True)
+            except Exception as cleanup_error:
+                logger.error(f"Не удалось удалить незавершённый сайт {site_id}: {cleanup_error}")
         await message.answer("❌ <b>Ошибка при создании сайта</b>\n\nПопробуйте еще раз")
     
-    user_sessions.pop(user_id, None)
+    reset_session(user_id)
+
+async def websites_page(user_id, cursor=None):
+    """Текст и кнопки страницы «Мои сайты»; None, если сайтов нет.
+    Кнопки несут курсор страницы — в памяти бота списки сайтов не хранятся"""
+    websites, newer, older = await db.list_websites(user_id, cursor, limit=SITES_PAGE_SIZE)
+    if not websites:
+        return None
+    
+    response = "📚 <b>Ваши созданные сайты:</b>\n\n"
+    for site_id, title, created_at in websites:
+        response += f"<b>#{site_id}</b> {escape(title or '')}\n   📅 {(created_at or '')[:10]}\n\n"
+    
+    example_id = websites[0][0]
+    response += (
+        f"Чтобы пересоздать сайт, отправьте: <code>Редактировать N</code>, где N — номер сайта "
+        f"(например: Редактировать {example_id})\n"
+        f"Чтобы поменять одно поле: <code>Изменить N поле: значение</code> "
+        f"(например: Изменить {example_id} цена: 25 000 000 ₽)"
+    )
+    
+    buttons = []
+    if newer:
+        buttons.append(InlineKeyboardButton(text="◀️ Новее", callback_data=f"sites:{newer}"))
+    if older:
+        buttons.append(InlineKeyboardButton(text="Старше ▶️", callback_data=f"sites:{older}"))
+    return response, InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
 
 @dp.message(F.text == "📚 Мои сайты")
 async def show_websites(message: types.Message):
     user_id = message.from_user.id
     
-    conn = sqlite3.connect('realtor_bot.db')
-    cursor = conn.cursor()
-    cursor.execute(
-        'SELECT id, title, created_at FROM websites WHERE user_id = ? ORDER BY created_at DESC LIMIT 10',
-        (user_id,)
-    )
-    websites = cursor.fetchall()
-    conn.close()
+    page = await websites_page(user_id)
     
-    if not websites:
+    if not page:
         await message.answer("📭 <b>У вас еще нет созданных сайтов</b>\n\nНачните с кнопки «Создать сайт»")
         return
     
-    # Сохраним список сайтов в сессию для последующего редактирования
-    user_sessions[user_id] = user_sessions.get(user_id, {})
-    user_sessions[user_id]['last_websites'] = websites
-    
-    response = "📚 <b>Ваши созданные сайты:</b>\n\n"
-    for i, (site_id, title, created_at) in enumerate(websites, 1):
-        response += f"{i}. <b>{title}</b>\n   📅 {created_at[:10]}\n\n"
-    
-    response += (
-        f"<b>Всего сайтов:</b> {len(websites)}\n\n"
-        f"Чтобы пересоздать сайт, отправьте: <code>Редактировать N</code> (например: Редактировать 1)"
+    response, keyboard = page
+    await message.answer(response, reply_markup=keyboard)
+
+@dp.callback_query(F.data.startswith("sites:"))
+async def page_websites(callback: types.CallbackQuery):
+    """Листание «Мои сайты»: то же сообщение показывает соседнюю страницу"""
+    page = await websites_page(callback.from_user.id, callback.data.split(':', 1)[1])
+    try:
+        if page:
+            response, keyboard = page
+            await callback.message.edit_text(response, reply_markup=keyboard)
+        else:
+            await callback.message.edit_text("📭 <b>У вас еще нет созданных сайтов</b>")
+    except Exception as e:
+        logger.error(f"Ошибка листания сайтов: {e}")
+    await callback.answer()
+
+async def send_unchanged_site(message, site_id, title, style_key, rendered, media):
+    """Повторно отправляет уже опубликованный сайт, который не изменился"""
+    lead_link = f"https://t.me/ANton618_bot?start=lead_{site_id}"
+    site_url = f"{SITE_BASE_URL}/site_{site_id}/" if SITE_BASE_URL else f"sites/site_{site_id}/index.html"
+    filename = f"site_{title.replace(' ', '_')}.html"
+    document_html = await asyncio.to_thread(
+        document_media, site_renderer.inline_assets(rendered['page'].replace(LEAD_PLACEHOLDER, lead_link), style_key), media,
+        os.path.join('sites', f'site_{site_id}'), site_url if SITE_BASE_URL else None)
+    await message.answer_document(
+        types.BufferedInputFile(document_html.encode('utf-8'), filename=filename),
+        caption=(
+            f"♻️ <b>Изменений нет — сайт уже опубликован</b>\n\n"
+            f"🏠 <b>Название:</b> {title}\n"
+            f"🌐 <b>Опубликован:</b> {site_url}\n"
+            f"📩 <b>Лид-ссылка:</b> {lead_link}"
+        ),
+        reply_markup=get_main_menu()
     )
-    await message.answer(response)
 
 @dp.message(F.text.regexp(r'^Редактировать\s+(\d+)$'))
 async def edit_website_quick(message: types.Message, regexp: types.Message):
     user_id = message.from_user.id
-    idx_str = regexp.group(1)
     try:
-        idx = int(idx_str)
-        last = user_sessions.get(user_id, {}).get('last_websites')
-        if not last or idx < 1 or idx > len(last):
-            await message.answer("❌ Неверный номер. Откройте ‘Мои сайты' и повторите.")
-            return
-        site_id = last[idx-1][0]
+        # N — номер сайта из «Мои сайты»; get_website найдёт только сайт этого пользователя
+        site_id = int(regexp.group(1))
         # Загрузим данные сайта
-        conn = sqlite3.connect('realtor_bot.db')
-        cursor = conn.cursor()
-        cursor.execute('''SELECT title, description, price, location, area, rooms, completion_date,
-                                 broker_phone, broker_email, broker_tg, style_used, html_content, media_files
-                          FROM websites WHERE id = ? AND user_id = ?''', (site_id, user_id))
-        row = cursor.fetchone()
-        conn.close()
+        row = await db.get_website(site_id, user_id)
         if not row:
-            await message.answer("❌ Сайт не найден")
+            await message.answer("❌ Сайт не найден. Номер сайта указан в «Мои сайты».")
             return
         (title, description, price, location, area, rooms, completion_date,
-         broker_phone, broker_email, broker_tg, style_used, html_content, media_files) = row
+         broker_phone, broker_email, broker_tg) = (row[field] for field in RENDER_FIELDS)
+        style_used, media_files, style_json, render_key = (
+            row['style_used'], row['media_files'], row['style_json'], row['render_key'])
         # Подготовим user_data для регенерации
         try:
             media = json.loads(media_files) if media_files else []
         except Exception:
             media = []
-        # Определим стиль (по имени сохранённого)
+        # Стиль целиком (цвета, ключ шаблона); у старых записей сохранено только имя
         style = {}
-        if style_used:
+        try:
+            style = json.loads(style_json) if style_json else {}
+        except Exception:
+            pass
+        if not style and style_used:
             style = {"name": style_used, "key": ""}
-        user_sessions[user_id] = {
+        user_data = reset_session(user_id, {
             'state': 'generating',
             'media': media,
             'title': title,
@@ -1775,13 +1302,182 @@ async def edit_website_quick(message: types.Message, regexp: types.Message):
             'broker_email': broker_email,
             'broker_tg': broker_tg,
             'style': style,
+            # Пересоздание — новый сайт, карта в текущем режиме из config
+            'map_mode': MAP_MODE,
             'regenerate_site_id': site_id
-        }
+        })
+        
+        # Данные не менялись и сайт опубликован — ни рендер, ни публикация не нужны
+        publish_path = os.path.join('sites', f'site_{site_id}', 'index.html')
+        if render_key and render_key == render_cache_key(user_data, media) and os.path.exists(publish_path):
+            rendered = render_cache.get(render_key)
+            if rendered:
+                reset_session(user_id)
+                await send_unchanged_site(message, site_id, title, style.get('key'), rendered, media)
+                return
+        
         await generate_website(message)
     except Exception as e:
         logger.error(f"Ошибка редактирования: {e}")
         await message.answer("❌ Не удалось пересоздать сайт. Попробуйте позже.")
 
+# Поля, которые можно поменять командой «Изменить N поле: значение»
+EDITABLE_FIELDS = {
+    'название': 'title',
+    'описание': 'description',
+    'цена': 'price',
+    'адрес': 'location',
+    'локация': 'location',
+    'площадь': 'area',
+    'комнаты': 'rooms',
+    'срок': 'completion_date',
+    'срок сдачи': 'completion_date',
+    'телефон': 'broker_phone',
+    'email': 'broker_email',
+    'telegram': 'broker_tg',
+}
+
+@dp.message(F.text.regexp(re.compile(r'^Изменить\s+(\d+)\s+([^:\n]+):\s*(.+)$', re.S)))
+async def edit_website_field(message: types.Message, regexp: re.Match):
+    """Правка одного поля опубликованного сайта: перерисовываются только затронутые секции"""
+    user_id = message.from_user.id
+    field_name = regexp.group(2).strip().lower()
+    field = EDITABLE_FIELDS.get(field_name)
+    if not field:
+        await message.answer(
+            "❌ Неизвестное поле. Можно изменить: " + ", ".join(sorted(EDITABLE_FIELDS)) +
+            "\n\nНапример: <code>Изменить 1 цена: 25 000 000 ₽</code>"
+        )
+        return
+    value = regexp.group(3).strip()
+    if field == 'broker_tg':
+        value = value.replace('@', '')
+    
+    try:
+        site_id = int(regexp.group(1))
+        started = time.perf_counter()
+        
+        row = await db.get_website(site_id, user_id)
+        if not row:
+            await message.answer("❌ Сайт не найден. Номер сайта указан в «Мои сайты».")
+            return
+        user_data = {field: row[field] for field in RENDER_FIELDS}
+        style_used, style_json, html_content, media_files, section_keys = (
+            row['style_used'], row['style_json'], row['html_content'], row['media_files'], row['section_keys'])
+        # Правка не меняет режим карты сайта
+        user_data['map_mode'] = row['map_mode']
+        try:
+            user_data['style'] = json.loads(style_json) if style_json else {}
+        except Exception:
+            user_data['style'] = {}
+        if not user_data['style'] and style_used:
+            user_data['style'] = {"name": style_used, "key": ""}
+        try:
+            media = json.loads(media_files) if media_files else []
+        except Exception:
+            media = []
+        try:
+            old_keys = json.loads(section_keys) if section_keys else {}
+        except Exception:
+            old_keys = {}
+        user_data[field] = value
+        
+        lead_link = f"https://t.me/ANton618_bot?start=lead_{site_id}"
+        context = site_context(user_data, media, lead_link)
+        new_keys = site_renderer.section_keys(context)
+        changed = [name for name in new_keys if name != '_page' and old_keys.get(name) != new_keys[name]]
+        
+        html = None
+        if html_content and old_keys.get('_page') == new_keys['_page']:
+            html = splice_sections(html_content, site_renderer.render_sections(changed, **context))
+        if html is None:
+            # Сайт старого формата или сменились шаблоны — перерисовываем страницу целиком
+            changed = [name for name in new_keys if name != '_page']
+            html = site_renderer.render(context['style'].get('key'), **context)
+        # Сохранённая страница уже минифицирована — дожимаем только вклеенные секции
+        html = minify_html(html, PUBLISH_MINIFY)
+        
+        render_key = render_cache_key(user_data, media)
+        await db.update_website_field(site_id, field, value, html, json.dumps(new_keys),
+                                      render_key, site_renderer.version)
+        
+        style_key = context['style'].get('key')
+        publish_dir = os.path.join('sites', f'site_{site_id}')
+        os.makedirs(publish_dir, exist_ok=True)
+        page_sizes = await asyncio.to_thread(write_precompressed, os.path.join(publish_dir, 'index.html'),
+                                             html.encode('utf-8'), PAGE_BROTLI_QUALITY)
+        # lite.html не хранится в базе — перерисовываем её целиком
+        lite_buffer = io.BytesIO()
+        lite_sizes = await asyncio.to_thread(write_page, os.path.join(publish_dir, 'lite.html'),
+                                             lambda page, _: site_renderer.publish(style_key, page, lite=True, **context),
+                                             None, lite_buffer)
+        # Те же данные при следующем «Создать сайт» или «Редактировать» — готовая страница из кэша.
+        # Исходный размер склеенной страницы неизвестен — в подписи будет только итоговый
+        render_cache.put(render_key, {
+            'lite_original_bytes': lite_sizes['original'],
+            'page': html.replace(lead_link, LEAD_PLACEHOLDER),
+            'lite': buffer_text(lite_buffer).replace(lead_link, LEAD_PLACEHOLDER),
+        })
+        # Манифест service worker ссылается на новые версии страниц
+        sw_sizes = await asyncio.to_thread(write_service_worker, style_key, publish_dir)
+        await db.record_site_files(site_id, {'index.html': page_sizes, 'lite.html': lite_sizes, 'sw.js': sw_sizes})
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        logger.info(f"Сайт {site_id}: поле {field} обновлено за {elapsed_ms:.1f} мс, секции: {', '.join(changed) or 'нет'}")
+        
+        site_url = f"{SITE_BASE_URL}/site_{site_id}/" if SITE_BASE_URL else f"sites/site_{site_id}/index.html"
+        document_html = await asyncio.to_thread(
+            document_media, site_renderer.inline_assets(html, style_key), media, publish_dir,
+            site_url if SITE_BASE_URL else None)
+        await message.answer_document(
+            types.BufferedInputFile(document_html.encode('utf-8'), filename=f"site_{user_data['title'].replace(' ', '_')}.html"),
+            caption=(
+                f"✏️ <b>Сайт обновлён:</b> {escape(field_name)} → {escape(value)}\n\n"
+                f"🧩 <b>Перерисовано секций:</b> {len(changed)} из {len(new_keys) - 1}\n"
+                f"⚡ <b>Время:</b> {elapsed_ms:.0f} мс\n"
+                f"🌐 <b>Опубликован:</b> {site_url}"
+            ),
+            reply_markup=get_main_menu()
+        )
+    except Exception as e:
+        logger.error(f"Ошибка изменения поля: {e}")
+        await message.answer("❌ Не удалось изменить сайт. Попробуйте позже.")
+
+@dp.message(Command("stats"))
+async def show_render_stats(message: types.Message):
+    stats = render_cache.stats()
+    (pages, original, minified, gzipped, brotlied), map_modes = await db.publish_stats()
+    map_lines = "".join(
+        f"\n{mode}: {count} стр., в среднем {avg_bytes / 1024:.1f} КБ (gzip {avg_gzip / 1024:.1f} КБ)"
+        for mode, count, avg_bytes, avg_gzip in map_modes
+    )
+    await message.answer(
+        "📊 <b>Кэш рендера</b>\n\n"
+        f"Попадания: {stats['hits']} в памяти, {stats['disk_hits']} с диска\n"
+        f"Промахи: {stats['misses']} (доля попаданий {stats['hit_rate']:.0%})\n"
+        f"В памяти: {stats['memory_items']} стр., {stats['memory_bytes'] // 1024} КБ\n"
+        f"На диске: {stats['disk_items']} стр., {stats['disk_bytes'] // 1024} КБ\n\n"
+        f"🗜 <b>Опубликованные страницы:</b> {pages}\n"
+        f"Исходный HTML: {(original or 0) // 1024} КБ → минифицированный {(minified or 0) // 1024} КБ\n"
+        f"gzip: {(gzipped or 0) // 1024} КБ, brotli: {f'{brotlied // 1024} КБ' if brotlied else 'нет'}"
+        + (f"\n\n🗺 <b>Карта по режимам</b> (iframe грузит Google Maps сразу, click/visible — по требованию):{map_lines}"
+           if map_lines else "")
+    )
+
+@dp.message(Command("style_report"))
+async def show_style_report(message: types.Message):
+    """Вес оформления и тяжёлые эффекты по стилям: полная версия → lite"""
+    lines = ["🎨 <b>Стили: вес и стоимость анимаций</b> (полная → lite, gzip)\n"]
+    for key, row in site_renderer.style_report().items():
+        cost = row['cost']
+        lines.append(
+            f"<b>{key}</b>: CSS {row['css_gzip'] / 1024:.1f} → {row['lite_css_gzip'] / 1024:.1f} КБ, "
+            f"JS {row['js_gzip'] / 1024:.1f} → {row['lite_js_gzip'] / 1024:.1f} КБ\n"
+            f"   ∞-анимаций {cost['infinite_animations']}, blur {cost['blur_filters']}, "
+            f"backdrop {cost['backdrop_filters']}, @keyframes {cost['keyframes']} → "
+            f"в lite {sum(v for k, v in row['lite_cost'].items() if k != 'keyframes')}"
+        )
+    await message.answer("\n".join(lines))
+
 @dp.message(F.text == "⚙️ Настройки")
 async def show_settings(message: types.Message):
     await message.answer(
@@ -1800,7 +1496,14 @@ async def show_settings(message: types.Message):
     await dp.start_polling(bot)
 
 async def main():
-    await dp.start_polling(bot)
+    await db.open()
+    sweeper = asyncio.create_task(sweep_sessions())
+    try:
+        await dp.start_polling(bot)
+    finally:
+        sweeper.cancel()
+        image_processor.shutdown()
+        db.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
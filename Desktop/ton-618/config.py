@@ -1,4 +1,5 @@
 import os
+import shutil
 
 # Telegram bot token is loaded from environment; falls back to provided test token
 # To override: export BOT_TOKEN="123:ABC"
@@ -6,3 +7,86 @@ BOT_TOKEN = os.getenv("BOT_TOKEN", "8358851724:AAEVVzB4EqDqmWNLjrAnW2mZVnALCzPqW
 
 if not BOT_TOKEN:
     print("⚠️ BOT_TOKEN is not set. Please export BOT_TOKEN in your environment.")
+
+# Пул обработки фото: число процессов-воркеров и предел очереди задач
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+IMAGE_QUEUE_SIZE = int(os.getenv("IMAGE_QUEUE_SIZE", "16"))
+
+# Публичный адрес папки sites/ (например https://example.com/sites); пусто — только локальная публикация
+SITE_BASE_URL = os.getenv("SITE_BASE_URL", "").rstrip("/")
+
+# Ширины адаптивных копий фото для srcset (WebP + JPEG)
+PHOTO_WIDTHS = tuple(int(w) for w in os.getenv("PHOTO_WIDTHS", "480,960,1600").split(","))
+
+# Кодирование фото: "budget" — качество подбирается под бюджет байт (для самой широкой копии),
+# "psnr" — под порог визуального качества в дБ, "fixed" — всегда одно качество
+PHOTO_ENCODER = os.getenv("PHOTO_ENCODER", "budget")
+PHOTO_BYTE_BUDGET = int(os.getenv("PHOTO_BYTE_BUDGET", "250000"))
+PHOTO_MIN_PSNR = float(os.getenv("PHOTO_MIN_PSNR", "38"))
+
+# Общее хранилище обработанных медиа (блобы по sha256 + индекс по file_unique_id)
+MEDIA_STORE_DIR = os.getenv("MEDIA_STORE_DIR", "media_store")
+
+# Видео: предельный размер файла (байт) и размер куска при потоковой загрузке
+VIDEO_MAX_BYTES = int(os.getenv("VIDEO_MAX_BYTES", str(50 * 1024 * 1024)))
+VIDEO_CHUNK_SIZE = int(os.getenv("VIDEO_CHUNK_SIZE", str(256 * 1024)))
+
+# Постобработка видео: ffmpeg необязателен (без него только перенос moov в начало файла),
+# VIDEO_TARGET_BITRATE — пережимать ролики тяжелее этого битрейта (бит/с, 0 — не пережимать)
+FFMPEG_PATH = os.getenv("FFMPEG_PATH") or shutil.which("ffmpeg")
+VIDEO_TARGET_BITRATE = int(os.getenv("VIDEO_TARGET_BITRATE", "0"))
+VIDEO_WORKERS = int(os.getenv("VIDEO_WORKERS", "1"))
+
+# Сессии: через сколько секунд бездействия сессия считается брошенной и как часто их проверять
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(2 * 3600)))
+SESSION_SWEEP_INTERVAL = int(os.getenv("SESSION_SWEEP_INTERVAL", "300"))
+
+# Альбомы: сколько секунд ждать следующую часть альбома, прежде чем принять его целиком
+ALBUM_DEBOUNCE = float(os.getenv("ALBUM_DEBOUNCE", "0.8"))
+
+# Кэш скомпилированных Jinja2-шаблонов сайтов
+TEMPLATE_CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR", "template_cache")
+
+# Общие CSS/JS-бандлы стилей: папка рядом с папками сайтов и путь к ней со страницы сайта
+ASSETS_DIR = os.getenv("ASSETS_DIR", os.path.join("sites", "assets"))
+ASSETS_URL = os.getenv("ASSETS_URL", "../assets")
+
+# Кэш готовых страниц: папка и лимиты размера в памяти и на диске (байт)
+RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR", "render_cache")
+RENDER_CACHE_MEMORY_BYTES = int(os.getenv("RENDER_CACHE_MEMORY_BYTES", str(16 * 1024 * 1024)))
+RENDER_CACHE_DISK_BYTES = int(os.getenv("RENDER_CACHE_DISK_BYTES", str(256 * 1024 * 1024)))
+
+# Публикация: минифицировать HTML/CSS/JS (0 — писать как есть); .gz-копии (и .br при установленном
+# пакете Brotli) пишутся всегда
+PUBLISH_MINIFY = os.getenv("PUBLISH_MINIFY", "1") != "0"
+# Качество brotli для страниц сайтов (0–11): они перезаписываются при каждой правке, а 11
+# в несколько раз медленнее 10 почти без выигрыша; общие бандлы всегда сжимаются с 11
+PAGE_BROTLI_QUALITY = int(os.getenv("PAGE_BROTLI_QUALITY", "10"))
+
+# Lite-версия страницы (lite.html) для слабых телефонов: предел размера её JS (байт)
+LITE_JS_BUDGET = int(os.getenv("LITE_JS_BUDGET", "2048"))
+
+# Карта на странице сайта: "iframe" — Google Maps сразу (как раньше), "click" — лёгкая заглушка
+# с адресом и кнопкой, "visible" — заглушка, которая подгружает карту у края экрана
+MAP_MODE = os.getenv("MAP_MODE", "visible")
+
+# Свой шрифт сайтов: папка с файлами начертаний (.ttf/.otf/.woff2, статические или вариативный)
+# и семейство. Публикуется подмножество под стиль и язык (нужен fontTools). Файлы в репозитории
+# не лежат: Inter (OFL) — https://github.com/rsms/inter/releases. Если шрифта нет, сайты грузят
+# его с Google Fonts, при запуске в лог пишется предупреждение; FONT_DIR="" — на системных шрифтах
+FONT_DIR = os.getenv("FONT_DIR", "fonts")
+FONT_FAMILY = os.getenv("FONT_FAMILY", "Inter")
+
+# База SQLite: путь и число потоков-читателей (пишет всегда один поток)
+DB_PATH = os.getenv("DB_PATH", "realtor_bot.db")
+# HTML страниц и списки медиа сайтов — сжатыми файлами по хэшу, в таблице только ссылки на них
+DB_BLOB_DIR = os.getenv("DB_BLOB_DIR", "db_blobs")
+DB_READERS = int(os.getenv("DB_READERS", "2"))
+# Настройки соединений: кэш страниц на соединение (КБ), отображение файла в память (байт),
+# сколько ждать блокировку (мс) вместо мгновенной ошибки "database is locked"
+DB_CACHE_KB = int(os.getenv("DB_CACHE_KB", "16384"))
+DB_MMAP_BYTES = int(os.getenv("DB_MMAP_BYTES", str(64 * 1024 * 1024)))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+
+# «Мои сайты»: сайтов на странице (листание кнопками «Новее»/«Старше»)
+SITES_PAGE_SIZE = int(os.getenv("SITES_PAGE_SIZE", "10"))
@@ -0,0 +1 @@
+# Корень проекта для pytest: тесты в tests/ импортируют модули бота (database, render, ...) напрямую
@@ -0,0 +1,634 @@
+import asyncio
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+logger = logging.getLogger(__name__)
+
+# Колонки сайта, которые читают обработчики (пересоздание и правка полей); страница и медиа
+# лежат вне таблицы — в строке только ссылки на файлы (html_path, media_path)
+WEBSITE_COLUMNS = ('title', 'description', 'price', 'location', 'area', 'rooms', 'completion_date',
+                   'broker_phone', 'broker_email', 'broker_tg', 'style_used', 'style_json',
+                   'html_path', 'media_path', 'render_key', 'section_keys', 'map_mode')
+# Поля, которые можно менять правкой одного поля
+EDITABLE_COLUMNS = ('title', 'description', 'price', 'location', 'area', 'rooms', 'completion_date',
+                    'broker_phone', 'broker_email', 'broker_tg')
+SELECT_WEBSITE = f'SELECT {", ".join(WEBSITE_COLUMNS)} FROM websites WHERE id = ? AND user_id = ?'
+
+
+# ===== ФАЙЛЫ ВНЕ ТАБЛИЦ =====
+
+class BlobStore:
+    """Большие значения (HTML страниц, списки медиа) сжатыми файлами по sha256 содержимого.
+
+    В строке таблицы остаются путь, хэш и размер — таблица сайтов маленькая и целиком
+    помещается в кэш страниц SQLite. Одинаковое содержимое хранится один раз.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def put(self, data):
+        """Сохраняет байты; возвращает (путь относительно root, sha256, размер до сжатия)"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = f'{digest[:2]}/{digest}.gz'
+        full_path = os.path.join(self.root, path)
+        if not os.path.exists(full_path):
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            tmp = f'{full_path}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as f:
+                # mtime=0 — одинаковое содержимое даёт одинаковый файл
+                f.write(gzip.compress(data, compresslevel=6, mtime=0))
+            os.replace(tmp, full_path)
+        return path, digest, len(data)
+
+    def get(self, path):
+        """Байты по пути из put() или None, если файла нет"""
+        try:
+            with open(os.path.join(self.root, path), 'rb') as f:
+                return gzip.decompress(f.read())
+        except FileNotFoundError:
+            logger.error(f"Нет файла {path} в {self.root}")
+            return None
+
+    def delete(self, path):
+        try:
+            os.remove(os.path.join(self.root, path))
+        except FileNotFoundError:
+            pass
+
+    def paths(self):
+        """Пути всех сохранённых файлов относительно root"""
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith('.gz'):
+                    yield os.path.relpath(os.path.join(directory, name), self.root).replace(os.sep, '/')
+
+    def put_text(self, text):
+        return self.put(text.encode('utf-8')) if text is not None else (None, None, None)
+
+    def get_text(self, path):
+        data = self.get(path) if path else None
+        return data.decode('utf-8') if data is not None else None
+
+
+# ===== МИГРАЦИИ СХЕМЫ =====
+
+def add_column(table, column, kind='TEXT'):
+    """Шаг миграции: колонка, если её ещё нет — базы без schema_version могли получить её от fix_database"""
+    def step(conn, blobs):
+        if column not in {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {kind}')
+    return step
+
+
+def move_site_blobs(conn, blobs):
+    """Шаг миграции: HTML и список медиа сайтов из колонок таблицы — в BlobStore;
+    возвращает число перенесённых строк"""
+    ids = [row[0] for row in conn.execute(
+        'SELECT id FROM websites WHERE html_content IS NOT NULL OR media_files IS NOT NULL')]
+    # По одной строке: страницы старых сайтов со встроенными base64-фото весят сотни КБ
+    for site_id in ids:
+        html_content, media_files = conn.execute(
+            'SELECT html_content, media_files FROM websites WHERE id = ?', (site_id,)).fetchone()
+        conn.execute(
+            '''UPDATE websites SET html_path = ?, html_sha256 = ?, html_bytes = ?,
+                                    media_path = ?, media_sha256 = ?, media_bytes = ?,
+                                    html_content = NULL, media_files = NULL
+               WHERE id = ?''',
+            (*blobs.put_text(html_content), *blobs.put_text(media_files), site_id)
+        )
+    logger.info(f"База: страницы и медиа {len(ids)} сайтов вынесены в {blobs.root}")
+    return len(ids)
+
+
+def sweep_blobs(conn, blobs):
+    """Удаляет из BlobStore файлы, на которые не ссылается ни один сайт (остались от прежних
+    рендеров до того, как их стали удалять при сохранении); возвращает число удалённых.
+
+    Полный обход папки — один раз миграцией 9, дальше вручную: python database.py --sweep-blobs
+    """
+    referenced = set()
+    for html_path, media_path in conn.execute('SELECT html_path, media_path FROM websites'):
+        referenced.update((html_path, media_path))
+    removed = 0
+    for path in list(blobs.paths()):
+        if path not in referenced:
+            blobs.delete(path)
+            removed += 1
+    if removed:
+        logger.info(f"База: удалено {removed} файлов без ссылок из {blobs.root}")
+    return removed
+
+
+# Миграции по порядку: (версия, описание, шаги — SQL или функция от соединения и BlobStore).
+# Каждая применяется один раз в своей транзакции и записывается в schema_version;
+# шаги идемпотентны, потому что старые базы уже могли содержать их результат.
+# Новая миграция — новый элемент в конце списка, применённые не меняются
+MIGRATIONS = [
+    (1, 'начальная схема', [
+        '''CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+        '''CREATE TABLE IF NOT EXISTS websites (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            title TEXT,
+            description TEXT,
+            price TEXT,
+            location TEXT,
+            area TEXT,
+            rooms TEXT,
+            completion_date TEXT,
+            broker_phone TEXT,
+            broker_email TEXT,
+            broker_tg TEXT,
+            style_used TEXT,
+            html_content TEXT,
+            media_files TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )''',
+        '''CREATE TABLE IF NOT EXISTS leads (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            site_id INTEGER,
+            tg_user_id INTEGER,
+            username TEXT,
+            first_name TEXT,
+            phone TEXT,
+            email TEXT,
+            message TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+    ]),
+    (2, 'поля объекта в старых базах', [
+        add_column('websites', column) for column in ('price', 'location', 'area', 'rooms', 'completion_date',
+                                                      'broker_phone', 'broker_email', 'broker_tg', 'style_used',
+                                                      'media_files')
+    ]),
+    (3, 'кэш рендера и правка по секциям', [
+        add_column('websites', 'render_key'),
+        add_column('websites', 'style_json'),
+        add_column('websites', 'section_keys'),
+    ]),
+    (4, 'размеры опубликованных файлов', [
+        '''CREATE TABLE IF NOT EXISTS site_files (
+            site_id INTEGER,
+            path TEXT,
+            original_bytes INTEGER,
+            bytes INTEGER,
+            gzip_bytes INTEGER,
+            brotli_bytes INTEGER,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (site_id, path)
+        )''',
+    ]),
+    (5, 'режим карты сайта', [
+        add_column('websites', 'map_mode'),
+    ]),
+    (6, 'страницы и медиа вне таблицы', [
+        add_column('websites', 'html_path'),
+        add_column('websites', 'html_sha256'),
+        add_column('websites', 'html_bytes', 'INTEGER'),
+        add_column('websites', 'media_path'),
+        add_column('websites', 'media_sha256'),
+        add_column('websites', 'media_bytes', 'INTEGER'),
+        add_column('websites', 'render_version'),
+        move_site_blobs,
+    ]),
+    (7, 'покрывающие индексы горячих запросов', [
+        # Список сайтов: фильтр, порядок и выбираемые поля — всё в индексе, таблица не читается
+        '''CREATE INDEX IF NOT EXISTS idx_websites_user_created
+           ON websites (user_id, created_at, id, title)''',
+        # Статистика публикаций: страницы index.html без прохода по всем файлам сайтов
+        '''CREATE INDEX IF NOT EXISTS idx_site_files_path
+           ON site_files (path, site_id, original_bytes, bytes, gzip_bytes, brotli_bytes)''',
+        '''CREATE INDEX IF NOT EXISTS idx_leads_site
+           ON leads (site_id, created_at)''',
+        'ANALYZE',
+    ]),
+    (8, 'ссылки на файлы страниц и медиа', [
+        # Проверка, что файл в BlobStore больше никому не нужен, перед его удалением
+        'CREATE INDEX IF NOT EXISTS idx_websites_html_path ON websites (html_path)',
+        'CREATE INDEX IF NOT EXISTS idx_websites_media_path ON websites (media_path)',
+    ]),
+    (9, 'файлы страниц без ссылок', [
+        sweep_blobs,
+    ]),
+]
+# После этих миграций файл базы сжимается (VACUUM), если их шаги что-то перенесли
+# (вернули ненулевое число строк): освободились страницы с большими значениями
+VACUUM_AFTER = {6}
+
+
+def migrate(conn, blobs, migrations=MIGRATIONS):
+    """Применяет миграции новее записанной в schema_version версии; возвращает (была, стала).
+
+    Каждая миграция — отдельная транзакция: при ошибке база остаётся на предыдущей версии.
+    """
+    conn.execute('''CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+    current = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()[0] or 0
+    version = current
+    isolation_level = conn.isolation_level
+    # Транзакции вручную: модуль sqlite3 не открывает их перед DDL сам
+    conn.isolation_level = None
+    try:
+        for version, name, steps in migrations:
+            if version <= current:
+                continue
+            conn.execute('BEGIN IMMEDIATE')
+            moved = 0
+            try:
+                for step in steps:
+                    if callable(step):
+                        moved += step(conn, blobs) or 0
+                    else:
+                        conn.execute(step)
+                conn.execute('INSERT INTO schema_version (version, name) VALUES (?, ?)', (version, name))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            logger.info(f"База: применена миграция {version} — {name}")
+            if version in VACUUM_AFTER and moved:
+                conn.execute('VACUUM')
+    finally:
+        conn.isolation_level = isolation_level
+    return current, max(current, version)
+
+
+# ===== ГОРЯЧИЕ ЗАПРОСЫ =====
+
+# Список сайтов страницами по ключу (created_at, id): каждая страница начинается сразу за
+# границей предыдущей в индексе, без OFFSET — цена страницы не зависит от числа сайтов
+LIST_WEBSITES = '''SELECT id, title, created_at FROM websites WHERE user_id = ?
+                   ORDER BY created_at DESC, id DESC LIMIT ?'''
+LIST_WEBSITES_OLDER = '''SELECT id, title, created_at FROM websites
+                         WHERE user_id = ? AND (created_at, id) < (?, ?)
+                         ORDER BY created_at DESC, id DESC LIMIT ?'''
+LIST_WEBSITES_NEWER = '''SELECT id, title, created_at FROM websites
+                         WHERE user_id = ? AND (created_at, id) > (?, ?)
+                         ORDER BY created_at, id LIMIT ?'''
+SAVE_RENDER = '''UPDATE websites SET html_path = ?, html_sha256 = ?, html_bytes = ?,
+                                     media_path = ?, media_sha256 = ?, media_bytes = ?,
+                                     render_key = ?, section_keys = ?, render_version = ?
+                 WHERE id = ?'''
+PUBLISH_TOTALS = '''SELECT COUNT(*), SUM(original_bytes), SUM(bytes), SUM(gzip_bytes), SUM(brotli_bytes)
+                    FROM site_files WHERE path = 'index.html' '''
+# У старых сайтов режим не записан — у них iframe
+PUBLISH_MAP_MODES = '''SELECT COALESCE(w.map_mode, 'iframe'), COUNT(*), AVG(f.bytes), AVG(f.gzip_bytes)
+                       FROM site_files f JOIN websites w ON w.id = f.site_id
+                       WHERE f.path = 'index.html'
+                       GROUP BY 1 ORDER BY 1'''
+
+ADD_USER = 'INSERT OR IGNORE INTO users (user_id, username, first_name) VALUES (?, ?, ?)'
+CREATE_WEBSITE = '''INSERT INTO websites
+                    (user_id, title, description, price, location, area, rooms, completion_date,
+                     broker_phone, broker_email, broker_tg, style_used, style_json, map_mode)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+# {field} — одно из EDITABLE_COLUMNS
+UPDATE_WEBSITE_FIELD = '''UPDATE websites SET {field} = ?, html_path = ?, html_sha256 = ?, html_bytes = ?,
+                                              section_keys = ?, render_key = ?, render_version = ?
+                          WHERE id = ?'''
+RECORD_SITE_FILE = '''INSERT INTO site_files (site_id, path, original_bytes, bytes, gzip_bytes, brotli_bytes)
+                      VALUES (?, ?, ?, ?, ?, ?)
+                      ON CONFLICT(site_id, path) DO UPDATE SET
+                          original_bytes = COALESCE(excluded.original_bytes, site_files.original_bytes),
+                          bytes = excluded.bytes, gzip_bytes = excluded.gzip_bytes,
+                          brotli_bytes = excluded.brotli_bytes, updated_at = CURRENT_TIMESTAMP'''
+
+# Сайт, который не удалось опубликовать, удаляется вместе с размерами его файлов
+DELETE_SITE_FILES = 'DELETE FROM site_files WHERE site_id = ?'
+DELETE_WEBSITE = 'DELETE FROM websites WHERE id = ? AND user_id = ?'
+
+# Одинаковое содержимое хранится одним файлом — удалять его можно, только когда на него
+# не ссылается ни один сайт
+BLOB_REFERENCED = 'SELECT 1 FROM websites WHERE html_path = ? OR media_path = ? LIMIT 1'
+SITE_BLOBS = 'SELECT html_path, media_path FROM websites WHERE id = ?'
+
+# Запросы, которые бот выполняет на каждое действие пользователя: имя -> (SQL, пример параметров).
+# tests/test_database.py через check_query_plans() проверяет, что ни один не читает таблицу целиком;
+# новый запрос в репозитории — сюда же, вместе с индексом под него
+HOT_QUERIES = {
+    'add_user': (ADD_USER, (1, 'u', 'U')),
+    'create_website': (CREATE_WEBSITE, (1,) + (None,) * 13),
+    'get_website': (SELECT_WEBSITE, (1, 1)),
+    'list_websites': (LIST_WEBSITES, (1, 10)),
+    'list_websites_older': (LIST_WEBSITES_OLDER, (1, '2024-01-01 00:00:00', 1, 10)),
+    'list_websites_newer': (LIST_WEBSITES_NEWER, (1, '2024-01-01 00:00:00', 1, 10)),
+    'save_render': (SAVE_RENDER, (None,) * 9 + (1,)),
+    'update_website_field': (UPDATE_WEBSITE_FIELD.format(field='title'), (None,) * 7 + (1,)),
+    'record_site_files': (RECORD_SITE_FILE, (1, 'index.html', 1, 1, 1, 1)),
+    'delete_site_files': (DELETE_SITE_FILES, (1,)),
+    'delete_website': (DELETE_WEBSITE, (1, 1)),
+    'blob_referenced': (BLOB_REFERENCED, ('ab/x.gz', 'ab/x.gz')),
+    'site_blobs': (SITE_BLOBS, (1,)),
+    'publish_totals': (PUBLISH_TOTALS, ()),
+    'publish_map_modes': (PUBLISH_MAP_MODES, ()),
+}
+
+
+def check_query_plans(conn, queries=HOT_QUERIES):
+    """EXPLAIN QUERY PLAN горячих запросов; возвращает список проблем (пустой — всё в порядке).
+
+    Проблема — полный проход по таблице или индексу (SCAN) и сортировка всей выборки
+    для ORDER BY во временном B-дереве.
+    """
+    problems = []
+    for name, (sql, params) in queries.items():
+        for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params):
+            detail = row[-1]
+            if detail.startswith('SCAN') or detail.startswith('USE TEMP B-TREE FOR ORDER BY'):
+                problems.append(f"{name}: {detail}")
+    return problems
+
+
+def encode_cursor(direction, website):
+    """Курсор страницы списка сайтов: направление ('older'/'newer') и ключ граничного сайта
+    (id, title, created_at) одной строкой base64 — короче 64 байт callback_data"""
+    site_id, _, created_at = website
+    raw = f'{direction[0]}{site_id}|{created_at}'.encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(направление, created_at, id) из encode_cursor() или None, если курсор испорчен"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        direction = {'o': 'older', 'n': 'newer'}[raw[0]]
+        site_id, created_at = raw[1:].split('|', 1)
+        return direction, created_at, int(site_id)
+    except (ValueError, KeyError, IndexError):
+        return None
+
+
+# ===== ДОСТУП К БАЗЕ =====
+
+class Database:
+    """Асинхронный доступ к SQLite: запросы идут в своих потоках с долгоживущими соединениями,
+    event loop не ждёт диск и не открывает соединение на каждый обработчик.
+
+    Пишет один поток-писатель — SQLite всё равно допускает одного писателя, а так записи
+    встают в очередь без ошибок "database is locked"; читают readers потоков, у каждого
+    своё соединение только для чтения. SQL-выражения — константы, поэтому соединения
+    держат их подготовленными в своём кэше (cached_statements) и не разбирают заново.
+
+    База работает в режиме WAL: чтение не ждёт записи. open() включает его и применяет
+    миграции — вызывать при запуске до первого запроса.
+    """
+
+    def __init__(self, path, blob_dir, readers=2, statement_cache=128, cache_kb=16384,
+                 mmap_bytes=64 * 1024 * 1024, busy_timeout_ms=5000):
+        self.path = path
+        self.blobs = BlobStore(blob_dir)
+        self.readers = readers
+        self.statement_cache = statement_cache
+        self.cache_kb = cache_kb
+        self.mmap_bytes = mmap_bytes
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._writer = None
+        self._reader = None
+
+    def _connect(self, readonly):
+        # Соединение живёт в потоке пула; из другого потока его только закрывают в close()
+        conn = sqlite3.connect(self.path, cached_statements=self.statement_cache, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        # В WAL synchronous=NORMAL не теряет целостность (только последние транзакции при сбое питания)
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA cache_size = -{int(self.cache_kb)}')
+        conn.execute(f'PRAGMA mmap_size = {int(self.mmap_bytes)}')
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout_ms)}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        if readonly:
+            conn.execute('PRAGMA query_only = ON')
+        self._local.conn = conn
+        with self._lock:
+            self._connections.append(conn)
+
+    def _ensure_started(self):
+        if self._writer is None:
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer',
+                                              initializer=self._connect, initargs=(False,))
+            self._reader = ThreadPoolExecutor(max_workers=self.readers, thread_name_prefix='db-reader',
+                                              initializer=self._connect, initargs=(True,))
+
+    def _call(self, func, args):
+        return func(self._local.conn, *args)
+
+    def _transaction(self, func, args):
+        # Всё, что делает func, — одна транзакция: либо целиком, либо откат
+        conn = self._local.conn
+        with conn:
+            return func(conn, *args)
+
+    async def read(self, func, *args):
+        """Выполняет func(conn, *args) в потоке-читателе"""
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._reader, partial(self._call, func, args))
+
+    async def open(self):
+        """Включает WAL и применяет новые миграции в потоке-писателе; возвращает (была, стала) версию схемы"""
+        def prepare(conn):
+            # Режим журнала хранится в самом файле базы — переключается один раз
+            conn.execute('PRAGMA journal_mode = WAL')
+            return migrate(conn, self.blobs)
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, partial(self._call, prepare, ()))
+
+    async def write(self, func, *args):
+        """Выполняет func(conn, *args) в потоке-писателе одной транзакцией"""
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, partial(self._transaction, func, args))
+
+    async def _release_blobs(self, paths):
+        """Удаляет файлы прежнего рендера, если на них больше никто не ссылается. Идёт в
+        потоке-писателе: новый файл не может появиться между проверкой и удалением"""
+        def query(conn):
+            for path in paths - {None}:
+                if conn.execute(BLOB_REFERENCED, (path, path)).fetchone() is None:
+                    self.blobs.delete(path)
+        await self.write(query)
+
+    def close(self):
+        """Дожидается начатых запросов и закрывает соединения"""
+        for executor in (self._writer, self._reader):
+            if executor is not None:
+                executor.shutdown(wait=True)
+        self._writer = self._reader = None
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+
+    # ----- пользователи -----
+
+    async def add_user(self, user_id, username, first_name):
+        def query(conn):
+            conn.execute(ADD_USER, (user_id, username, first_name))
+        await self.write(query)
+
+    # ----- сайты -----
+
+    async def create_website(self, user_id, user_data):
+        """Новая запись сайта до рендера (нужен site_id); возвращает site_id"""
+        style = user_data.get('style') or {}
+
+        def query(conn):
+            cursor = conn.execute(
+                CREATE_WEBSITE,
+                (user_id, user_data['title'], user_data['description'], user_data['price'],
+                 user_data['location'], user_data['area'], user_data['rooms'], user_data['completion_date'],
+                 user_data.get('broker_phone'), user_data.get('broker_email'), user_data.get('broker_tg'),
+                 style.get('name', ''), json.dumps(style, ensure_ascii=False), user_data.get('map_mode'))
+            )
+            return cursor.lastrowid
+        return await self.write(query)
+
+    async def save_render(self, site_id, html_content, media_files, render_key, section_keys, render_version):
+        """Готовая страница сайта и данные для следующих правок; страница и медиа — в BlobStore,
+        файлы прежнего рендера удаляются"""
+        def query(conn):
+            old = conn.execute(SITE_BLOBS, (site_id,)).fetchone()
+            conn.execute(
+                SAVE_RENDER,
+                (*self.blobs.put_text(html_content), *self.blobs.put_text(media_files),
+                 render_key, section_keys, render_version, site_id)
+            )
+            return set(old) if old else set()
+        await self._release_blobs(await self.write(query))
+
+    async def update_website_field(self, site_id, field, value, html_content, section_keys, render_key,
+                                   render_version):
+        """Новое значение одного поля вместе с перерисованной страницей"""
+        if field not in EDITABLE_COLUMNS:
+            raise ValueError(f"Поле {field} нельзя менять")
+
+        def query(conn):
+            old = conn.execute(SITE_BLOBS, (site_id,)).fetchone()
+            conn.execute(
+                UPDATE_WEBSITE_FIELD.format(field=field),
+                (value, *self.blobs.put_text(html_content), section_keys, render_key, render_version, site_id)
+            )
+            return {old['html_path']} if old else set()
+        await self._release_blobs(await self.write(query))
+
+    async def delete_website(self, site_id, user_id):
+        """Удаляет сайт пользователя (запись, размеры файлов и файлы страницы в BlobStore)"""
+        def query(conn):
+            old = conn.execute(SITE_BLOBS, (site_id,)).fetchone()
+            conn.execute(DELETE_SITE_FILES, (site_id,))
+            if conn.execute(DELETE_WEBSITE, (site_id, user_id)).rowcount == 0:
+                return set()
+            return set(old) if old else set()
+        await self._release_blobs(await self.write(query))
+
+    async def list_websites(self, user_id, cursor=None, limit=10):
+        """Страница сайтов пользователя, от новых к старым: ([(id, title, created_at)], курсор
+        предыдущей страницы, курсор следующей). Без курсора — первая страница; курсора нет,
+        если дальше в ту сторону сайтов нет. Испорченный курсор — тоже первая страница"""
+        position = decode_cursor(cursor) if cursor else None
+
+        def query(conn):
+            # На один сайт больше страницы — так видно, есть ли следующая, без COUNT(*)
+            if position is None:
+                rows = conn.execute(LIST_WEBSITES, (user_id, limit + 1)).fetchall()
+            else:
+                direction, created_at, site_id = position
+                sql = LIST_WEBSITES_OLDER if direction == 'older' else LIST_WEBSITES_NEWER
+                rows = conn.execute(sql, (user_id, created_at, site_id, limit + 1)).fetchall()
+            return [tuple(row) for row in rows]
+        rows = await self.read(query)
+        more = len(rows) > limit
+        websites = rows[:limit]
+        if position is not None and position[0] == 'newer':
+            # Более новые выбраны по возрастанию — на экран в том же порядке, что и остальные
+            websites.reverse()
+            has_newer, has_older = more, True
+        else:
+            has_newer, has_older = position is not None, more
+        if not websites:
+            return [], None, None
+        return (websites,
+                encode_cursor('newer', websites[0]) if has_newer else None,
+                encode_cursor('older', websites[-1]) if has_older else None)
+
+    async def get_website(self, site_id, user_id):
+        """Сайт пользователя словарём WEBSITE_COLUMNS или None; страница и список медиа
+        подгружаются из BlobStore в html_content и media_files (None, если их нет)"""
+        def query(conn):
+            row = conn.execute(SELECT_WEBSITE, (site_id, user_id)).fetchone()
+            if not row:
+                return None
+            website = dict(row)
+            website['html_content'] = self.blobs.get_text(website['html_path'])
+            website['media_files'] = self.blobs.get_text(website['media_path'])
+            return website
+        return await self.read(query)
+
+    # ----- опубликованные файлы -----
+
+    async def record_site_files(self, site_id, files):
+        """Сохраняет размеры опубликованных файлов сайта {путь: {'bytes', 'gzip', 'brotli', 'original'}};
+        неизвестный исходный размер не затирает прежний"""
+        def query(conn):
+            conn.executemany(
+                RECORD_SITE_FILE,
+                [(site_id, path, sizes.get('original'), sizes['bytes'], sizes['gzip'], sizes['brotli'])
+                 for path, sizes in files.items()]
+            )
+        await self.write(query)
+
+    async def publish_stats(self):
+        """Итоги по опубликованным страницам: (страниц, исходный, минифицированный, gzip, brotli)
+        и вес страниц по режиму карты [(режим, страниц, средний размер, средний gzip)]"""
+        def query(conn):
+            totals = tuple(conn.execute(PUBLISH_TOTALS).fetchone())
+            map_modes = [tuple(row) for row in conn.execute(PUBLISH_MAP_MODES)]
+            return totals, map_modes
+        return await self.read(query)
+
+
+# Проверка планов: python database.py [путь к базе] — без пути на пустой базе после всех миграций.
+# Очистка BlobStore: python database.py --sweep-blobs <путь к базе> <папка файлов> (бот остановлен)
+if __name__ == '__main__':
+    import sys
+    import tempfile
+
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) == 4 and sys.argv[1] == '--sweep-blobs':
+        conn = sqlite3.connect(sys.argv[2])
+        print(f"Удалено файлов без ссылок: {sweep_blobs(conn, BlobStore(sys.argv[3]))}")
+        conn.close()
+        sys.exit(0)
+    with tempfile.TemporaryDirectory() as blob_dir:
+        conn = sqlite3.connect(sys.argv[1] if len(sys.argv) > 1 else ':memory:')
+        if len(sys.argv) > 1:
+            conn.execute('PRAGMA query_only = ON')
+        else:
+            migrate(conn, BlobStore(blob_dir))
+        problems = check_query_plans(conn)
+        conn.close()
+    for problem in problems:
+        print(f"Полный проход: {problem}")
+    print("Планы горячих запросов в порядке" if not problems else f"Проблем: {len(problems)}")
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,573 @@
+import asyncio
+import copy
+import hashlib
+import io
+import json
+import logging
+import math
+import os
+import shutil
+import struct
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import aiofiles
+import aiohttp
+from PIL import Image, ImageChops, ImageOps, ImageStat
+
+logger = logging.getLogger(__name__)
+
+# ===== ОБРАБОТКА ИЗОБРАЖЕНИЙ В ПУЛЕ ПРОЦЕССОВ =====
+
+def open_image(raw, min_edge=None):
+    """Открывает фото, поворачивает по EXIF-ориентации и приводит к RGB.
+
+    min_edge — JPEG декодируется сразу в уменьшенном масштабе, если обе стороны
+    всё равно останутся не меньше min_edge.
+    """
+    image = Image.open(io.BytesIO(raw))
+    if min_edge and image.format == 'JPEG':
+        image.draft('RGB', (min_edge, min_edge))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    return image
+
+
+def save_image(image, fmt, quality):
+    """Кодирует фото без метаданных (EXIF/ICC не передаём); JPEG — прогрессивный"""
+    buffered = io.BytesIO()
+    if fmt == 'jpeg':
+        image.save(buffered, format='JPEG', quality=quality, optimize=True, progressive=True)
+    else:
+        image.save(buffered, format='WEBP', quality=quality, method=4)
+    return buffered.getvalue()
+
+
+def psnr(image, encoded):
+    """PSNR (дБ) между исходным изображением и закодированным файлом"""
+    decoded = Image.open(io.BytesIO(encoded)).convert(image.mode)
+    stat = ImageStat.Stat(ImageChops.difference(image, decoded))
+    mse = sum(rms * rms for rms in stat.rms) / len(stat.rms)
+    if mse == 0:
+        return float('inf')
+    return 20 * math.log10(255 / math.sqrt(mse))
+
+
+def encode_adaptive(image, fmt='jpeg', encoder='fixed', max_bytes=None, min_psnr=None,
+                    quality=90, min_quality=40):
+    """Кодирует фото, подбирая качество бинарным поиском.
+
+    encoder="budget" — самое высокое качество, при котором файл не больше max_bytes;
+    encoder="psnr" — самое низкое качество, при котором PSNR не ниже min_psnr;
+    encoder="fixed" — просто quality.
+    """
+    if encoder == 'budget' and max_bytes:
+        fits = lambda data: len(data) <= max_bytes
+        prefer_higher = True
+    elif encoder == 'psnr' and min_psnr:
+        fits = lambda data: psnr(image, data) >= min_psnr
+        prefer_higher = False
+    else:
+        return save_image(image, fmt, quality)
+
+    best = None
+    low, high = min_quality, quality
+    while low <= high:
+        q = (low + high) // 2
+        data = save_image(image, fmt, q)
+        if fits(data):
+            best = data
+            if prefer_higher:
+                low = q + 1
+            else:
+                high = q - 1
+        elif prefer_higher:
+            high = q - 1
+        else:
+            low = q + 1
+
+    if best is None:
+        # Бюджет недостижим — минимальное качество; порог недостижим — максимальное
+        best = save_image(image, fmt, min_quality if prefer_higher else quality)
+    return best
+
+
+def process_image(raw, max_size=(1200, 800), quality=90, encoder='fixed', max_bytes=None, min_psnr=None):
+    """Декодирует, уменьшает и кодирует фото в JPEG (выполняется в процессе-воркере)"""
+    image = Image.open(io.BytesIO(raw))
+    fits_as_is = (
+        image.format == 'JPEG'
+        and image.width <= max_size[0] and image.height <= max_size[1]
+        and 'exif' not in image.info and 'icc_profile' not in image.info
+        and (not max_bytes or len(raw) <= max_bytes)
+    )
+    if fits_as_is and encoder != 'fixed':
+        # Маленький JPEG без метаданных не перекодируем — только потеряем качество
+        return raw
+
+    image = open_image(raw)
+    image.thumbnail(max_size)
+    return encode_adaptive(image, 'jpeg', encoder, max_bytes, min_psnr, quality)
+
+
+def make_derivatives(raw, widths=(480, 960, 1600), quality=82, encoder='fixed', max_bytes=None, min_psnr=None):
+    """Готовит копии фото нужных ширин в WebP и JPEG для srcset (выполняется в процессе-воркере).
+
+    raw — загруженный файл как есть: он декодируется один раз, каждая копия — один ресайз
+    от него. max_bytes — бюджет для самой широкой копии, для узких он уменьшается
+    пропорционально площади.
+    """
+    image = open_image(raw, max(widths))
+
+    derivatives = []
+    # Не увеличиваем фото: ширины больше исходной заменяем исходной
+    targets = sorted({min(w, image.width) for w in widths})
+    for width in targets:
+        if width == image.width:
+            resized = image
+        else:
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.LANCZOS)
+
+        budget = None
+        if max_bytes:
+            # Бюджет считаем от самой широкой копии, а не от исходника — тот может быть крупнее
+            budget = int(max_bytes * (width / targets[-1]) ** 2)
+
+        for fmt in ('webp', 'jpeg'):
+            data = encode_adaptive(resized, fmt, encoder, budget, min_psnr, quality)
+            derivatives.append({
+                'width': resized.width,
+                'height': resized.height,
+                'format': fmt,
+                'bytes': data,
+            })
+    return derivatives
+
+
+class ImageProcessor:
+    """Пул процессов для Pillow с ограниченной очередью задач.
+
+    Не больше max_pending фото одновременно находятся в обработке или ждут её,
+    остальные вызовы process() ждут свободного места. Свойство overloaded —
+    сигнал для обработчиков, что очередь заполнена и ответ будет не сразу.
+    """
+
+    def __init__(self, workers=2, max_pending=16):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor = None
+        self._slots = None
+
+    @property
+    def overloaded(self):
+        return self.pending >= self.max_pending
+
+    def _ensure_started(self):
+        # Пул и семафор создаём лениво — внутри работающего event loop
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            self._slots = asyncio.Semaphore(self.max_pending)
+
+    async def run(self, func, *args, **kwargs):
+        """Выполняет func в пуле процессов, соблюдая лимит очереди"""
+        self._ensure_started()
+        async with self._slots:
+            self.pending += 1
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+            finally:
+                self.pending -= 1
+
+    async def process(self, raw, max_size=(1200, 800), quality=90, **encoding):
+        """Обрабатывает фото в пуле и возвращает JPEG-байты"""
+        return await self.run(process_image, raw, max_size=max_size, quality=quality, **encoding)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# ===== КОНТЕНТ-АДРЕСУЕМОЕ ХРАНИЛИЩЕ МЕДИА =====
+
+PHOTO_EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+
+
+def entry_blobs(entry):
+    """Все (sha256, ext) блобов, на которые ссылается запись индекса"""
+    blobs = [(entry['sha256'], entry['ext'])]
+    blobs += [(v['sha256'], v['ext']) for v in entry.get('variants') or []]
+    if entry.get('poster'):
+        blobs.append((entry['poster']['sha256'], entry['poster']['ext']))
+    return blobs
+
+
+class MediaStore:
+    """Хранилище обработанных медиа: blobs/ab/<sha256>.<ext> плюс индекс file_unique_id → запись.
+
+    Повторная загрузка того же файла из Telegram и пересоздание сайта берут готовые
+    блобы из индекса, а папки публикации получают на них жёсткие ссылки вместо копий.
+
+    Индекс — журнал index.jsonl: remember() дописывает одну строку, цена записи не растёт
+    с числом фото. Методы блокируют на диске — из асинхронного кода их зовут через
+    asyncio.to_thread; доступ к индексу из разных потоков защищён блокировкой.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.index_path = os.path.join(root, 'index.jsonl')
+        # Индекс прежнего формата — один JSON, переписывавшийся целиком на каждое фото
+        self.legacy_index_path = os.path.join(root, 'index.json')
+        self._index = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        # Вызывается под self._lock
+        if self._index is None:
+            self._index = {}
+            lines = 0
+            torn = False
+            try:
+                if not os.path.exists(self.index_path) and os.path.exists(self.legacy_index_path):
+                    with open(self.legacy_index_path, encoding='utf-8') as f:
+                        self._index = json.load(f)
+                    self._rewrite()
+                    os.remove(self.legacy_index_path)
+                with open(self.index_path, encoding='utf-8') as f:
+                    for line in f:
+                        lines += 1
+                        torn = not line.endswith('\n')
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            # Строка, недописанная при сбое, — без неё файл просто скачается заново
+                            continue
+                        self._index[record['id']] = record['entry']
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.error(f"Ошибка чтения индекса медиа: {e}")
+            # Перезаписанные записи копятся в журнале — сжимаем, когда их больше половины;
+            # недописанную последнюю строку убираем, иначе к ней приклеится следующая запись
+            if torn or lines > 2 * len(self._index) + 100:
+                self._rewrite()
+        return self._index
+
+    def _rewrite(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for file_unique_id, entry in self._index.items():
+                f.write(json.dumps({'id': file_unique_id, 'entry': entry}, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, self.index_path)
+
+    def blob_path(self, sha256, ext):
+        return os.path.join(self.root, 'blobs', sha256[:2], f'{sha256}.{ext}')
+
+    def has(self, sha256, ext):
+        return os.path.exists(self.blob_path(sha256, ext))
+
+    def put(self, data, ext):
+        """Сохраняет байты как блоб (если такого ещё нет) и возвращает sha256"""
+        sha256 = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(sha256, ext)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Своё временное имя на каждый вызов: одно фото могут сохранять два потока сразу
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except OSError:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                # Соседний поток успел положить тот же блоб — содержимое одинаковое
+                if not os.path.exists(path):
+                    raise
+        return sha256
+
+    def put_file(self, path, ext):
+        """Переносит готовый файл в хранилище без чтения целиком в память, возвращает sha256"""
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+        blob = self.blob_path(sha256, ext)
+        if os.path.exists(blob):
+            os.remove(path)
+        else:
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            os.replace(path, blob)
+        return sha256
+
+    def lookup(self, file_unique_id):
+        """Запись из индекса, если все её блобы на месте"""
+        if not file_unique_id:
+            return None
+        with self._lock:
+            entry = self._load().get(file_unique_id)
+        if entry and all(self.has(sha256, ext) for sha256, ext in entry_blobs(entry)):
+            return copy.deepcopy(entry)
+        return None
+
+    def remember(self, file_unique_id, entry):
+        if not file_unique_id:
+            return
+        line = json.dumps({'id': file_unique_id, 'entry': entry}, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._load()[file_unique_id] = copy.deepcopy(entry)
+            os.makedirs(self.root, exist_ok=True)
+            with open(self.index_path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+    def link(self, sha256, ext, dest):
+        """Кладёт блоб в папку публикации: жёсткая ссылка, иначе симлинк, иначе копия"""
+        if os.path.exists(dest):
+            return
+        src = self.blob_path(sha256, ext)
+        try:
+            os.link(src, dest)
+        except FileExistsError:
+            # Ссылку уже положил параллельный вызов
+            return
+        except OSError:
+            try:
+                os.symlink(os.path.abspath(src), dest)
+            except OSError:
+                shutil.copyfile(src, dest)
+
+
+# ===== ПОТОКОВАЯ ЗАГРУЗКА ФАЙЛОВ =====
+
+class DownloadTooLarge(Exception):
+    """Файл больше допустимого размера"""
+
+
+async def stream_download(bot, file_path, dest, total=None, max_bytes=None, chunk_size=256 * 1024,
+                          progress=None, retries=3, timeout=60):
+    """Качает файл из Telegram кусками прямо на диск.
+
+    В памяти держится не больше одного куска, так что расход памяти не зависит от размера
+    файла. После обрыва докачивает с места остановки (Range), недокачанный dest можно
+    передать повторно — загрузка продолжится. progress(done, total) — async-колбэк.
+    """
+    if max_bytes and total and total > max_bytes:
+        raise DownloadTooLarge(total)
+    os.makedirs(os.path.dirname(dest) or '.', exist_ok=True)
+
+    if bot.session.api.is_local:
+        # Локальный Bot API сервер отдаёт файл с диска — aiogram сам копирует его кусками
+        await bot.download_file(file_path, destination=dest, chunk_size=chunk_size)
+        return os.path.getsize(dest)
+
+    url = bot.session.api.file_url(bot.token, file_path)
+    session = await bot.session.create_session()
+    failures = 0
+    while True:
+        done = os.path.getsize(dest) if os.path.exists(dest) else 0
+        if total and done >= total:
+            return done
+        headers = {'Range': f'bytes={done}-'} if done else {}
+        try:
+            async with session.get(url, headers=headers,
+                                   timeout=aiohttp.ClientTimeout(total=None, sock_read=timeout)) as resp:
+                if resp.status == 416 and done:
+                    # Докачивать нечего — файл уже целиком на диске
+                    return done
+                resp.raise_for_status()
+                if done and resp.status != 206:
+                    # Сервер проигнорировал Range — начинаем файл заново
+                    done = 0
+                async with aiofiles.open(dest, 'ab' if done else 'wb') as f:
+                    async for chunk in resp.content.iter_chunked(chunk_size):
+                        done += len(chunk)
+                        if max_bytes and done > max_bytes:
+                            raise DownloadTooLarge(done)
+                        await f.write(chunk)
+                        if progress:
+                            await progress(done, total)
+            if not total or done >= total:
+                return done
+            failures += 1
+            error = f"соединение закрыто на {done} из {total} байт"
+        except DownloadTooLarge:
+            os.remove(dest)
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            failures += 1
+            error = e
+        if failures > retries:
+            raise IOError(f"Не удалось скачать {file_path}: {error}")
+        logger.warning(f"Обрыв загрузки {file_path}, докачиваем (попытка {failures}): {error}")
+        await asyncio.sleep(min(2 ** failures, 10))
+
+
+# ===== ПОСТОБРАБОТКА ВИДЕО =====
+
+MP4_CONTAINER_ATOMS = {b'moov', b'trak', b'mdia', b'minf', b'stbl', b'edts', b'dinf', b'mvex'}
+
+
+def _atom_header(read, pos, end):
+    """Размер и тип атома по смещению pos (с учётом 64-битного размера)"""
+    size, kind = struct.unpack('>I4s', read(pos, 8))
+    header_size = 8
+    if size == 1:
+        size = struct.unpack('>Q', read(pos + 8, 8))[0]
+        header_size = 16
+    elif size == 0:
+        size = end - pos
+    if size < header_size or pos + size > end:
+        raise ValueError(f"Повреждённый атом {kind!r} на смещении {pos}")
+    return kind, size, header_size
+
+
+def _shift_chunk_offsets(moov, shift):
+    """Пересчитывает смещения чанков (stco/co64) внутри moov: shift(старое) -> новое"""
+    read = lambda pos, n: bytes(moov[pos:pos + n])
+
+    def walk(start, end):
+        pos = start
+        while pos + 8 <= end:
+            kind, size, header_size = _atom_header(read, pos, end)
+            body = pos + header_size
+            if kind in MP4_CONTAINER_ATOMS:
+                walk(body, pos + size)
+            elif kind in (b'stco', b'co64'):
+                fmt, width = ('>I', 4) if kind == b'stco' else ('>Q', 8)
+                count = struct.unpack_from('>I', moov, body + 4)[0]
+                for i in range(count):
+                    offset = body + 8 + i * width
+                    value = shift(struct.unpack_from(fmt, moov, offset)[0])
+                    if kind == b'stco' and value > 0xFFFFFFFF:
+                        raise ValueError("Смещение не помещается в stco")
+                    struct.pack_into(fmt, moov, offset, value)
+            pos += size
+
+    _, _, header_size = _atom_header(read, 0, len(moov))
+    walk(header_size, len(moov))
+
+
+def faststart_mp4(src, dst):
+    """Переносит moov в начало MP4 (как qt-faststart), чтобы видео начинало играть сразу.
+
+    Возвращает False, если moov уже стоит перед mdat и переписывать нечего.
+    """
+    end = os.path.getsize(src)
+    with open(src, 'rb') as f:
+        def read(pos, n):
+            f.seek(pos)
+            return f.read(n)
+
+        atoms = []
+        pos = 0
+        while pos + 8 <= end:
+            kind, size, _ = _atom_header(read, pos, end)
+            atoms.append((kind, pos, size))
+            pos += size
+
+        kinds = [kind for kind, _, _ in atoms]
+        if b'moov' not in kinds or b'mdat' not in kinds or kinds.index(b'moov') < kinds.index(b'mdat'):
+            return False
+
+        _, moov_pos, moov_size = atoms[kinds.index(b'moov')]
+        insert_pos = atoms[kinds.index(b'mdat')][1]
+        moov = bytearray(read(moov_pos, moov_size))
+        # Данные между новым и старым местом moov сдвигаются на его размер, остальные — нет
+        _shift_chunk_offsets(moov, lambda value: value + moov_size if insert_pos <= value < moov_pos else value)
+
+        with open(dst, 'wb') as out:
+            for kind, pos, size in atoms:
+                if pos == insert_pos:
+                    out.write(moov)
+                if kind == b'moov':
+                    continue
+                f.seek(pos)
+                remaining = size
+                while remaining:
+                    chunk = f.read(min(remaining, 1024 * 1024))
+                    out.write(chunk)
+                    remaining -= len(chunk)
+    return True
+
+
+class VideoProcessor:
+    """Фоновая постобработка видео: moov в начало, кадр-обложка и пережатие тяжёлых роликов.
+
+    ffmpeg — необязательная зависимость: без него moov переносится на чистом Python,
+    а обложку вызывающий код берёт из превью Telegram.
+    """
+
+    def __init__(self, ffmpeg=None, workers=1, target_bitrate=0):
+        self.ffmpeg = ffmpeg
+        self.workers = workers
+        self.target_bitrate = target_bitrate
+        self._slots = None
+
+    async def _ffmpeg(self, *args):
+        proc = await asyncio.create_subprocess_exec(
+            self.ffmpeg, '-y', '-v', 'error', *args,
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+        _, stderr = await proc.communicate()
+        if proc.returncode:
+            raise RuntimeError(stderr.decode(errors='ignore')[-300:])
+
+    async def _extract_poster(self, path, poster_path):
+        # Кадр на первой секунде; у совсем коротких роликов — самый первый кадр
+        for offset in ('1', '0'):
+            try:
+                await self._ffmpeg('-ss', offset, '-i', path, '-frames:v', '1',
+                                   '-vf', "scale='min(1280,iw)':-2", '-q:v', '4', poster_path)
+                if os.path.exists(poster_path) and os.path.getsize(poster_path):
+                    return poster_path
+            except Exception as e:
+                logger.warning(f"Не удалось извлечь обложку из {path}: {e}")
+        return None
+
+    async def process(self, path, duration=None):
+        """Обрабатывает видео и возвращает (путь к итоговому mp4, путь к обложке или None)"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+
+        async with self._slots:
+            # Случайный суффикс: один и тот же ролик могут обрабатывать два вызова сразу
+            base = f'{os.path.splitext(path)[0]}.{os.urandom(4).hex()}'
+            out_path = f'{base}.out.mp4'
+            poster_path = None
+
+            if self.ffmpeg:
+                bitrate = os.path.getsize(path) * 8 / duration if duration else 0
+                try:
+                    if self.target_bitrate and bitrate > self.target_bitrate * 1.2:
+                        target = str(self.target_bitrate)
+                        await self._ffmpeg('-i', path, '-c:v', 'libx264', '-preset', 'veryfast',
+                                           '-b:v', target, '-maxrate', target, '-bufsize', str(self.target_bitrate * 2),
+                                           '-vf', "scale='min(1280,iw)':-2", '-c:a', 'aac', '-b:a', '128k',
+                                           '-movflags', '+faststart', out_path)
+                    else:
+                        await self._ffmpeg('-i', path, '-map', '0', '-c', 'copy', '-movflags', '+faststart', out_path)
+                except Exception as e:
+                    logger.error(f"Ошибка ffmpeg при обработке {path}: {e}")
+                    if os.path.exists(out_path):
+                        os.remove(out_path)
+                poster_path = await self._extract_poster(path, f'{base}.poster.jpg')
+
+            if not os.path.exists(out_path):
+                try:
+                    if not await asyncio.to_thread(faststart_mp4, path, out_path):
+                        return path, poster_path
+                except Exception as e:
+                    logger.error(f"Не удалось перенести moov в {path}: {e}")
+                    if os.path.exists(out_path):
+                        os.remove(out_path)
+                    return path, poster_path
+
+            os.remove(path)
+            return out_path, poster_path
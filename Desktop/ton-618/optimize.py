@@ -0,0 +1,486 @@
+import gzip
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+
+try:
+    import brotli
+except ImportError:
+    # Без пакета Brotli пишутся только .gz-копии
+    brotli = None
+
+try:
+    from fontTools import subset as font_subset
+    from fontTools.ttLib import TTFont
+except ImportError:
+    # Без fontTools шрифты не подготавливаются — страницы используют системные
+    font_subset = TTFont = None
+else:
+    # Отчёты fontTools о каждой таблице шрифта в лог бота не нужны
+    logging.getLogger('fontTools').setLevel(logging.WARNING)
+
+# Строки и комментарии CSS: строки остаются как есть, комментарии выбрасываются
+CSS_STRINGS = r'"(?:\\.|[^"\\])*"' + r"|'(?:\\.|[^'\\])*'"
+CSS_TOKENS = re.compile(rf'({CSS_STRINGS}|/\*.*?\*/)', re.S)
+CSS_STRING = re.compile(f'({CSS_STRINGS})', re.S)
+# Открывающий тег блока, содержимое которого сжимается отдельно от разметки
+BLOCK_OPEN = re.compile(r'<(style|script)\b[^>]*>', re.I)
+# Маркеры секций страницы — по ним бот вклеивает перерисованные секции, их не удаляем
+SECTION_MARKERS = ('<!--section:', '<!--/section:')
+
+
+# ===== МИНИФИКАЦИЯ =====
+
+def minify_css(text):
+    """Убирает из CSS комментарии и лишние пробелы; строки (content, data:-URL) не трогает"""
+    # Сначала комментарии: пробелы по обе стороны от них должны схлопнуться вместе
+    text = CSS_TOKENS.sub(lambda m: '' if m.group(0).startswith('/*') else m.group(0), text)
+    out = []
+    for i, part in enumerate(CSS_STRING.split(text)):
+        if i % 2 == 0:
+            part = re.sub(r'\s+', ' ', part)
+            part = re.sub(r' ?([{};,>]) ?', r'\1', part)
+            part = part.replace(': ', ':')
+        out.append(part)
+    return ''.join(out).replace(';}', '}').strip()
+
+
+def minify_js(text):
+    """Осторожная минификация JS: без отступов, пустых строк и строк-комментариев.
+
+    Переводы строк сохраняются — код полагается на автоматическую расстановку «;».
+    """
+    lines = (line.strip() for line in text.split('\n'))
+    return '\n'.join(line for line in lines if line and not line.startswith('//'))
+
+
+class HtmlMinifier:
+    """Потоковая минификация HTML: write() принимает страницу кусками байт по мере рендера,
+    в sink уходят строки без отступов, пустых строк и комментариев.
+
+    Содержимое <style> и <script> копится до закрывающего тега и сжимается целиком,
+    маркеры секций сохраняются. В шаблонах нет <pre>/<textarea>, поэтому пробелы
+    в начале строк незначимы. С enabled=False байты передаются в sink без изменений.
+    """
+
+    def __init__(self, sink, enabled=True):
+        self.sink = sink
+        self.enabled = enabled
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._tail = []
+        self._out = []
+        self._block = None
+        self._in_comment = False
+
+    def write(self, data):
+        self.bytes_in += len(data)
+        if not self.enabled:
+            self._emit_bytes(data)
+            return len(data)
+        # Рендер отдаёт много мелких кусков — разбираем, только когда пришёл конец строки
+        self._tail.append(data)
+        if b'\n' not in data:
+            return len(data)
+        lines = b''.join(self._tail).split(b'\n')
+        self._tail = [lines.pop()]
+        for line in lines:
+            self._line(line.decode('utf-8'))
+        self._flush()
+        return len(data)
+
+    def close(self):
+        """Дописывает остаток; вызывать после последнего write()"""
+        tail = b''.join(self._tail)
+        self._tail = []
+        if tail:
+            self._line(tail.decode('utf-8'))
+        if self._block is not None:
+            # Незакрытый блок — отдаём как есть
+            kind, head, body = self._block
+            self._block = None
+            self._emit(head + '\n'.join(body))
+        self._flush()
+
+    def _emit_bytes(self, data):
+        self.sink.write(data)
+        self.bytes_out += len(data)
+
+    def _emit(self, line):
+        line = line.strip()
+        if line:
+            self._out.append(line)
+
+    def _flush(self):
+        """Готовые строки уходят в sink одной записью: sink может сжимать каждый кусок"""
+        if self._out:
+            self._out.append('')
+            self._emit_bytes('\n'.join(self._out).encode('utf-8'))
+            self._out = []
+
+    def _line(self, line):
+        prefix = ''
+        if self._block is not None:
+            kind, head, body = self._block
+            close = line.find(f'</{kind}>')
+            if close < 0:
+                body.append(line)
+                return
+            body.append(line[:close])
+            self._block = None
+            prefix = head + self._minify_block(kind, '\n'.join(body))
+            line = line[close:]
+        self._html(prefix, line)
+
+    def _html(self, prefix, text):
+        """Строка разметки: блоки <style>/<script> внутри неё сжимаются, остальное чистится от комментариев"""
+        if not self._in_comment and '<!--' not in text and '<s' not in text and '<S' not in text:
+            # Обычная строка разметки: ни комментариев, ни <style>/<script>
+            self._emit(prefix + text)
+            return
+        out = [prefix]
+        pos = 0
+        while True:
+            match = BLOCK_OPEN.search(text, pos)
+            out.append(self._strip_comments(text[pos:match.start() if match else len(text)]))
+            if not match:
+                break
+            kind = match.group(1).lower()
+            out.append(match.group(0))
+            close = text.find(f'</{kind}>', match.end())
+            if close < 0:
+                # Блок продолжается на следующих строках
+                self._block = (kind, ''.join(out), [text[match.end():]])
+                return
+            out.append(self._minify_block(kind, text[match.end():close]))
+            pos = close
+        self._emit(''.join(out))
+
+    def _strip_comments(self, text):
+        result = []
+        pos = 0
+        while pos < len(text):
+            if self._in_comment:
+                end = text.find('-->', pos)
+                if end < 0:
+                    break
+                self._in_comment = False
+                pos = end + 3
+                continue
+            start = text.find('<!--', pos)
+            if start < 0:
+                result.append(text[pos:])
+                break
+            result.append(text[pos:start])
+            end = text.find('-->', start + 4)
+            if end >= 0 and text.startswith(SECTION_MARKERS, start):
+                result.append(text[start:end + 3])
+            elif end < 0:
+                self._in_comment = True
+                break
+            pos = end + 3
+        return ''.join(result)
+
+    @staticmethod
+    def _minify_block(kind, body):
+        body = minify_css(body) if kind == 'style' else minify_js(body)
+        return f'\n{body}\n' if body else ''
+
+
+def minify_html(html, enabled=True):
+    """Минификация готовой страницы-строки тем же потоковым минификатором"""
+    buffer = io.BytesIO()
+    minifier = HtmlMinifier(buffer, enabled)
+    minifier.write(html.encode('utf-8'))
+    minifier.close()
+    return buffer.getvalue().decode('utf-8')
+
+
+# ===== РАЗБОР CSS =====
+
+def parse_css(css):
+    """Дерево CSS: список объявлений ("prop:value") и правил (заголовок, [дети]).
+
+    Разбор упрощённый — по { ; } вне строк и скобок, без проверки синтаксиса;
+    его хватает, чтобы выбрасывать отдельные объявления и правила.
+    """
+    root = []
+    stack = [root]
+    buf = []
+    depth = 0
+    for i, part in enumerate(CSS_STRING.split(CSS_TOKENS.sub(lambda m: '' if m.group(0).startswith('/*') else m.group(0), css))):
+        if i % 2:
+            buf.append(part)
+            continue
+        for ch in part:
+            if ch == '(':
+                depth += 1
+            elif ch == ')':
+                depth -= 1
+            if depth or ch not in '{;}':
+                buf.append(ch)
+                continue
+            text = ''.join(buf).strip()
+            buf = []
+            if ch == '{':
+                rule = (text, [])
+                stack[-1].append(rule)
+                stack.append(rule[1])
+                continue
+            if text:
+                stack[-1].append(text)
+            if ch == '}' and len(stack) > 1:
+                stack.pop()
+    return root
+
+
+def css_declarations(items):
+    """Все объявления дерева парами (свойство, значение)"""
+    for item in items:
+        if isinstance(item, tuple):
+            yield from css_declarations(item[1])
+        elif ':' in item:
+            prop, _, value = item.partition(':')
+            yield prop.strip().lower(), value.strip()
+
+
+def prune_css(css, drop):
+    """CSS без объявлений, для которых drop(свойство, значение) истинно.
+
+    Вместе с ними уходят опустевшие правила и @keyframes, на которые больше
+    ничего не ссылается. Результат — компактный CSS без лишних пробелов.
+    """
+    def keep(item):
+        if isinstance(item, tuple) or ':' not in item:
+            return True
+        prop, _, value = item.partition(':')
+        return not drop(prop.strip().lower(), value.strip())
+
+    def filtered(items):
+        return [(item[0], filtered(item[1])) if isinstance(item, tuple) else item
+                for item in items if keep(item)]
+
+    tree = filtered(parse_css(css))
+    used = set()
+    for prop, value in css_declarations(tree):
+        if prop in ('animation', 'animation-name'):
+            used.update(re.split(r'[\s,]+', value))
+
+    def emit(items):
+        out = []
+        for item in items:
+            if not isinstance(item, tuple):
+                out.append(item + ';')
+                continue
+            prelude, children = item
+            if re.match(r'@(-\w+-)?keyframes\b', prelude) and prelude.split()[-1] not in used:
+                continue
+            body = emit(children)
+            if body:
+                out.append(f'{prelude}{{{body}}}')
+        return ''.join(out).rstrip(';')
+
+    return emit(tree)
+
+
+# ===== СЖАТЫЕ КОПИИ ДЛЯ СТАТИЧЕСКОГО СЕРВЕРА =====
+
+class PrecompressedFile:
+    """Файл и его сжатые копии рядом (<имя>.gz и <имя>.br) за один проход записи.
+
+    Статический сервер перед sites/ (nginx gzip_static/brotli_static и т.п.) отдаёт
+    готовые байты и не сжимает файл на каждый запрос. Все три файла пишутся во временные
+    и подменяются в close() атомарно; при ошибке внутри with прежние версии остаются.
+    """
+
+    def __init__(self, path, gzip_level=9, brotli_quality=11):
+        self.path = path
+        self.sizes = None
+        # Страницы публикуются из потоков — временное имя своё у каждого потока
+        self._tmp_suffix = f'.{os.getpid()}.{threading.get_ident()}.tmp'
+        self._raw = open(path + self._tmp_suffix, 'wb')
+        self._gzip_file = open(f'{path}.gz{self._tmp_suffix}', 'wb')
+        # mtime=0 — одинаковая страница даёт побайтно одинаковый .gz
+        self._gzip = gzip.GzipFile(filename='', mode='wb', fileobj=self._gzip_file,
+                                   compresslevel=gzip_level, mtime=0)
+        self._brotli = self._brotli_file = None
+        if brotli is not None:
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+            self._brotli_file = open(f'{path}.br{self._tmp_suffix}', 'wb')
+
+    def write(self, data):
+        self._raw.write(data)
+        self._gzip.write(data)
+        if self._brotli is not None:
+            self._brotli_file.write(self._brotli.process(data))
+        return len(data)
+
+    def _targets(self):
+        targets = [self.path, f'{self.path}.gz']
+        if self._brotli is not None:
+            targets.append(f'{self.path}.br')
+        return targets
+
+    def close(self):
+        """Дописывает сжатые потоки и подменяет файлы; возвращает их размеры"""
+        self._gzip.close()
+        if self._brotli is not None:
+            self._brotli_file.write(self._brotli.finish())
+        for f in (self._raw, self._gzip_file, self._brotli_file):
+            if f is not None:
+                f.close()
+        for target in self._targets():
+            os.replace(target + self._tmp_suffix, target)
+        if self._brotli is None and os.path.exists(f'{self.path}.br'):
+            # .br от прошлой версии страницы отдавал бы старое содержимое
+            os.remove(f'{self.path}.br')
+        self.sizes = file_sizes(self.path)
+        return self.sizes
+
+    def abort(self):
+        """Выбрасывает недописанные файлы, прежние версии не трогает"""
+        for f in (self._raw, self._gzip_file, self._brotli_file):
+            if f is not None:
+                f.close()
+        for target in self._targets():
+            try:
+                os.remove(target + self._tmp_suffix)
+            except FileNotFoundError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+class TeeWriter:
+    """Пишет одни и те же байты в несколько приёмников — например, в файл публикации и в буфер"""
+
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def write(self, data):
+        for sink in self.sinks:
+            sink.write(data)
+        return len(data)
+
+
+def write_precompressed(path, data, brotli_quality=11):
+    """Пишет байты в path вместе со сжатыми копиями; возвращает размеры"""
+    with PrecompressedFile(path, brotli_quality=brotli_quality) as f:
+        f.write(data)
+    return f.sizes
+
+
+def has_precompressed(path):
+    """Есть ли файл со всеми сжатыми копиями, которые умеет писать PrecompressedFile"""
+    suffixes = ['', '.gz'] + (['.br'] if brotli is not None else [])
+    return all(os.path.exists(path + suffix) for suffix in suffixes)
+
+
+def file_sizes(path):
+    """Размеры файла и его сжатых копий (None — копии нет)"""
+    sizes = {'bytes': os.path.getsize(path), 'gzip': None, 'brotli': None}
+    for key, suffix in (('gzip', '.gz'), ('brotli', '.br')):
+        if os.path.exists(path + suffix):
+            sizes[key] = os.path.getsize(path + suffix)
+    return sizes
+
+
+# ===== ШРИФТЫ =====
+
+FONT_EXTENSIONS = ('.ttf', '.otf', '.woff', '.woff2')
+
+
+def find_font_faces(font_dir, family):
+    """Прямые (не курсивные) начертания семейства в font_dir.
+
+    Список словарей {'path', 'weight': (мин, макс), 'sha256'}; у статического начертания
+    мин == макс, у вариативного шрифта — диапазон оси wght. Без fontTools или папки — [].
+    """
+    if TTFont is None or not font_dir or not os.path.isdir(font_dir):
+        return []
+    faces = []
+    for name in sorted(os.listdir(font_dir)):
+        if not name.lower().endswith(FONT_EXTENSIONS):
+            continue
+        path = os.path.join(font_dir, name)
+        try:
+            font = TTFont(path, lazy=True)
+            names = font['name']
+            font_family = names.getDebugName(16) or names.getDebugName(1) or ''
+            italic = font['OS/2'].fsSelection & 1 or font['head'].macStyle & 2
+            axes = {axis.axisTag: axis for axis in font['fvar'].axes} if 'fvar' in font else {}
+            if 'wght' in axes:
+                weight = (int(axes['wght'].minValue), int(axes['wght'].maxValue))
+            else:
+                weight = (font['OS/2'].usWeightClass,) * 2
+            font.close()
+        except Exception:
+            continue
+        if font_family.lower() != family.lower() or italic:
+            continue
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        faces.append({'path': path, 'weight': weight, 'sha256': digest})
+    return faces
+
+
+def font_problem(font_dir, family):
+    """Почему find_font_faces() не нашла начертаний семейства — текстом для лога"""
+    if TTFont is None:
+        return "не установлен fontTools (pip install fonttools)"
+    if not os.path.isdir(font_dir):
+        return f"нет папки {os.path.abspath(font_dir)}"
+    if not any(name.lower().endswith(FONT_EXTENSIONS) for name in os.listdir(font_dir)):
+        return f"в {os.path.abspath(font_dir)} нет файлов {'/'.join(FONT_EXTENSIONS)}"
+    return f"в {os.path.abspath(font_dir)} нет прямых начертаний семейства {family}"
+
+
+def unicode_range(codepoints):
+    """Значение unicode-range для @font-face: "U+20-7E,U+401,..." """
+    points = sorted(set(codepoints))
+    ranges = []
+    for point in points:
+        if ranges and point == ranges[-1][1] + 1:
+            ranges[-1][1] = point
+        else:
+            ranges.append([point, point])
+    return ','.join(f'U+{lo:X}' if lo == hi else f'U+{lo:X}-{hi:X}' for lo, hi in ranges)
+
+
+def font_flavor():
+    """Формат веб-шрифта: woff2 требует пакета Brotli, иначе woff"""
+    return 'woff2' if brotli is not None else 'woff'
+
+
+def subset_font(source, codepoints, path):
+    """Пишет в path подмножество шрифта source только с символами codepoints.
+
+    Хинтинг выбрасывается (браузеры сглаживают сами), формат — font_flavor().
+    Запись атомарная: файл появляется целиком или не появляется.
+    """
+    options = font_subset.Options()
+    options.flavor = font_flavor()
+    options.hinting = False
+    options.ignore_missing_unicodes = True
+    font = font_subset.load_font(source, options)
+    try:
+        subsetter = font_subset.Subsetter(options)
+        subsetter.populate(unicodes=sorted(set(codepoints)))
+        subsetter.subset(font)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        font_subset.save_font(font, tmp, options)
+    finally:
+        font.close()
+    os.replace(tmp, path)
+    return os.path.getsize(path)
@@ -0,0 +1,573 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+from collections import OrderedDict
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, TemplateNotFound, select_autoescape
+from markupsafe import Markup
+
+from optimize import css_declarations, file_sizes, find_font_faces, font_flavor, font_problem, has_precompressed
+from optimize import minify_css, minify_js, parse_css, prune_css, subset_font, unicode_range, write_precompressed
+
+logger = logging.getLogger(__name__)
+
+# Шаблоны лежат рядом с кодом бота
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+# Версия рендера: поднимать при изменениях вывода, которых не видно в файлах шаблонов
+# (контекст страницы, фильтры). Правки самих шаблонов учитываются автоматически
+TEMPLATE_VERSION = 3
+
+# Секции страницы и поля контекста, от которых каждая зависит. Секция — partials/<имя>.html,
+# в странице она стоит между маркерами <!--section:имя--> и <!--/section:имя-->
+SECTION_DEPS = {
+    'title': ('title',),
+    'header': ('title', 'description', 'price', 'contacts', 'lead_link', 'style'),
+    'nav': ('videos', 'contacts'),
+    'about': ('description',),
+    'specs': ('specs',),
+    'gallery': ('photos',),
+    'videos': ('videos',),
+    'map': ('maps_url', 'maps_link', 'map_mode', 'location'),
+    'contacts': ('contacts', 'lead_link'),
+    'footer': ('title',),
+}
+# Секции внутри <body> по порядку; title живёт в <head>
+BODY_SECTIONS = [name for name in SECTION_DEPS if name != 'title']
+
+# Переключатель в <head> полной страницы: lite.html для prefers-reduced-motion и ?lite=1,
+# ?full=1 оставляет полную версию (ссылка с самой lite-страницы). Записан так, как его
+# оставляет минификатор, — чтобы inline_assets() находил его и в сохранённой странице
+LITE_SWITCH = ("<script>\nif(!/[?&]full=1/.test(location.search)&&(/[?&]lite=1/.test(location.search)"
+               "||matchMedia('(prefers-reduced-motion: reduce)').matches))"
+               "location.replace('lite.html'+location.search)\n</script>")
+
+# Символы своего шрифта по языку страницы: подмножество собирается из них один раз
+# на стиль и язык; остальные символы (эмодзи и т.п.) браузер берёт из системных шрифтов
+FONT_CHARSETS = {
+    'en': [*range(0x20, 0x7F), *range(0xA0, 0x100), 0x2013, 0x2014, *range(0x2018, 0x201F),
+           0x2022, 0x2026, 0x20AC],
+}
+FONT_CHARSETS['ru'] = FONT_CHARSETS['en'] + [*range(0x400, 0x460), 0x2116, 0x20BD]
+DEFAULT_LANG = 'ru'
+# Откуда берётся шрифт, если FONT_DIR задан, но файлов начертаний в нём нет
+REMOTE_FONTS_URL = 'https://fonts.googleapis.com/css2'
+
+# Страницы сайта, которые service worker скачивает при установке
+SW_PAGES = ('index.html', 'lite.html')
+# Видео service worker не кэширует: браузер тянет их кусками, целиком они слишком тяжёлые
+SW_SKIP = ('.mp4', '.webm', '.mov')
+
+
+# ===== РЕНДЕР САЙТОВ ИЗ ШАБЛОНОВ =====
+
+def srcset(variants, fmt):
+    """Фильтр шаблонов: srcset из копий фото нужного формата ("media/x.webp 480w, ...")"""
+    return ', '.join(f"{v['src']} {v['width']}w" for v in variants or [] if v['format'] == fmt)
+
+
+def heavy_effect(prop, value):
+    """Вид тяжёлого для слабых телефонов эффекта в объявлении CSS или None.
+
+    Такие объявления не попадают в lite-версию и считаются в отчёте по стилям.
+    """
+    value = value.lower()
+    if prop in ('backdrop-filter', '-webkit-backdrop-filter'):
+        return 'backdrop_filters'
+    if prop == 'filter' and 'blur(' in value:
+        return 'blur_filters'
+    if prop in ('animation', 'animation-iteration-count') and 'infinite' in value:
+        return 'infinite_animations'
+    return None
+
+
+def animation_cost(css):
+    """Счётчики тяжёлых эффектов в CSS: бесконечные анимации, размытие, backdrop-filter, @keyframes"""
+    cost = {'infinite_animations': 0, 'blur_filters': 0, 'backdrop_filters': 0}
+    for prop, value in css_declarations(parse_css(css)):
+        kind = heavy_effect(prop, value)
+        if kind:
+            cost[kind] += 1
+    cost['keyframes'] = len(re.findall(r'@(?:-\w+-)?keyframes\b', css))
+    return cost
+
+
+def font_weights(css):
+    """Веса шрифта, которые встречаются в CSS (font-weight и сокращение font); 400 и 700
+    (обычный текст, заголовки и <strong> по умолчанию) — всегда"""
+    weights = {400, 700}
+    for prop, value in css_declarations(parse_css(css)):
+        if prop not in ('font-weight', 'font'):
+            continue
+        for token in value.lower().split():
+            if token in ('bold', 'bolder'):
+                weights.add(700)
+            elif re.fullmatch(r'[1-9]00', token):
+                weights.add(int(token))
+    return weights
+
+
+class LiteBudgetExceeded(Exception):
+    """JS lite-версии больше lite_js_budget — такой бандл не публикуется"""
+
+
+class SiteRenderer:
+    """Рендер страницы объекта из Jinja2-шаблонов.
+
+    Каждый стиль — файл styles/<key>.html, наследующий site.html, и необязательный
+    styles/<key>.css; новый стиль добавляется файлами без правок кода. Скомпилированный
+    байткод шаблонов кэшируется на диске, поэтому после перезапуска шаблоны не разбираются заново.
+
+    CSS и JS стиля собираются в бандлы с хэшем содержимого в имени и пишутся в assets_dir
+    один раз на все сайты (минифицированными, с .gz/.br-копиями): страницы ссылаются на них
+    через assets_url, а браузер кэширует их навсегда. Без assets_dir бандлы встраиваются в страницу.
+
+    У каждого стиля есть lite-бандл: без размытия и бесконечных анимаций, с минимальным JS
+    не больше lite_js_budget байт — для облегчённой версии страницы (lite=True).
+
+    Шрифт font_family из font_dir публикуется своим подмножеством в assets_dir/fonts:
+    только начертания, которые использует CSS стиля, и символы языка страницы.
+    Если файлов шрифта нет, страница подключает его с Google Fonts.
+    """
+
+    def __init__(self, templates_dir=TEMPLATES_DIR, cache_dir=None, auto_reload=False,
+                 assets_dir=None, assets_url='../assets', minify=True, lite_js_budget=2048,
+                 font_dir=None, font_family='Inter'):
+        bytecode_cache = None
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(cache_dir)
+        self.env = Environment(
+            loader=FileSystemLoader(templates_dir),
+            autoescape=select_autoescape(['html']),
+            bytecode_cache=bytecode_cache,
+            auto_reload=auto_reload,
+            trim_blocks=True,
+            lstrip_blocks=True,
+        )
+        self.env.filters['srcset'] = srcset
+        self.assets_dir = assets_dir
+        self.assets_url = assets_url.rstrip('/')
+        self.minify = minify
+        self.lite_js_budget = lite_js_budget
+        self._bundles = {}
+        self.font_dir = font_dir
+        self.font_family = font_family
+        self._font_faces = find_font_faces(font_dir, font_family)
+        self._fonts = {}
+        self.version = self._version()
+
+    def _version(self):
+        """Версия для ключей кэша рендера: TEMPLATE_VERSION, исходники всех шаблонов, путь к бандлам,
+        минификация и файлы шрифта"""
+        digest = hashlib.sha256(f'{TEMPLATE_VERSION}|{self.assets_url}|{self.minify}|{self.font_family}|'
+                                f'{bool(self.font_dir)}'.encode())
+        for face in self._font_faces:
+            digest.update(face['sha256'].encode())
+        for name in sorted(self.env.list_templates()):
+            source, _, _ = self.env.loader.get_source(self.env, name)
+            digest.update(name.encode())
+            digest.update(source.encode())
+        return f'{TEMPLATE_VERSION}-{digest.hexdigest()[:16]}'
+
+    def style_keys(self):
+        """Ключи стилей, для которых есть шаблон styles/<key>.html"""
+        return sorted(name[len('styles/'):-len('.html')] for name in self.env.list_templates(extensions=['html'])
+                      if name.startswith('styles/') and name.count('/') == 1)
+
+    def warm(self):
+        """Компилирует все шаблоны и собирает бандлы стилей заранее, чтобы первый сайт не ждал"""
+        for name in self.env.list_templates(extensions=['html']):
+            try:
+                self.env.get_template(name)
+            except Exception as e:
+                logger.error(f"Ошибка компиляции шаблона {name}: {e}")
+        for key in self.style_keys():
+            try:
+                self.bundle(key)
+                self.bundle(key, lite=True)
+                self.fonts(key)
+            except LiteBudgetExceeded:
+                # Бот не запускается с lite-версией больше бюджета
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка сборки бандла стиля {key}: {e}")
+        if not self._font_faces:
+            if not self.font_dir:
+                logger.info("FONT_DIR не задан — сайты на системных шрифтах")
+            else:
+                # Страницы соберутся со шрифтом с Google Fonts — по виду сайта этого не заметить
+                logger.warning(f"Шрифт {self.font_family} не подключён: "
+                               f"{font_problem(self.font_dir, self.font_family)}. Сайты грузят его с Google Fonts; "
+                               f"положите файлы начертаний в FONT_DIR или задайте FONT_DIR пустым")
+
+    def template(self, style_key):
+        """Шаблон стиля; для неизвестного стиля — оформление по умолчанию"""
+        names = [f'styles/{style_key}.html'] if style_key else []
+        return self.env.select_template(names + ['styles/default.html'])
+
+    def _write_bundle(self, name, text):
+        """Пишет бандл со сжатыми копиями атомарно; имя содержит хэш, поэтому существующий файл не меняется"""
+        path = os.path.join(self.assets_dir, name)
+        if not has_precompressed(path):
+            os.makedirs(self.assets_dir, exist_ok=True)
+            write_precompressed(path, text.encode('utf-8'))
+        return f'{self.assets_url}/{name}'
+
+    def asset_sizes(self, style_key, lite=False):
+        """Размеры бандлов стиля по ссылкам со страницы: {href: {'original', 'bytes', 'gzip', 'brotli'}}"""
+        bundle = self.bundle(style_key, lite)
+        if not self.assets_dir:
+            return {}
+        sizes = {bundle[f'{kind}_href']: dict(file_sizes(os.path.join(self.assets_dir, bundle[f'{kind}_name'])),
+                                              original=bundle[f'{kind}_original_bytes'])
+                 for kind in ('css', 'js')}
+        if not lite:
+            # original у шрифта — размер исходного файла начертания
+            for href, face in self.fonts(style_key)['files'].items():
+                sizes[href] = dict(file_sizes(face['path']), original=os.path.getsize(face['source']))
+        return sizes
+
+    def bundle(self, style_key, lite=False):
+        """CSS и JS стиля: тексты для встраивания и ссылки на общие файлы"""
+        key = style_key or 'default'
+        bundle = self._bundles.get((key, lite))
+        if bundle is None:
+            # Порядок как раньше в <style>: сначала оформление стиля, затем базовые правила
+            parts = []
+            try:
+                parts.append(self.env.get_template(f'styles/{key}.css').render())
+            except TemplateNotFound:
+                pass
+            parts.append(self.env.get_template('partials/site.css').render())
+            if lite:
+                parts.append(self.env.get_template('partials/site-lite.css').render())
+            css = '\n'.join(parts)
+            js = self.env.get_template('partials/site-lite.js' if lite else 'partials/site.js').render()
+            original_sizes = (len(css.encode()), len(js.encode()))
+            if lite:
+                css = prune_css(css, heavy_effect)
+            if self.minify:
+                css, js = minify_css(css), minify_js(js)
+            if lite and len(js.encode()) > self.lite_js_budget:
+                # Бюджет обязателен: lite.html рассчитана на дешёвые телефоны
+                raise LiteBudgetExceeded(f"JS lite-версии {len(js.encode())} байт — больше бюджета "
+                                         f"{self.lite_js_budget} (LITE_JS_BUDGET)")
+            suffix = '.lite' if lite else ''
+            bundle = {
+                'css_original_bytes': original_sizes[0],
+                'js_original_bytes': original_sizes[1],
+                'css': Markup(css),
+                'js': Markup(js),
+                'css_inline': Markup(f'<style>\n{css}\n</style>'),
+                'js_inline': Markup(f'<script>\n{js}\n</script>'),
+                'css_name': f"{key}{suffix}.{hashlib.sha256(css.encode()).hexdigest()[:12]}.css",
+                'js_name': f"site{suffix}.{hashlib.sha256(js.encode()).hexdigest()[:12]}.js",
+                # Полная страница переключает на lite.html; в lite-версии и во встроенной копии не нужен
+                'lite_switch': Markup('' if lite else LITE_SWITCH),
+            }
+            self._bundles[(key, lite)] = bundle
+        if self.assets_dir:
+            # Проверяем каждый раз: папку с бандлами могли очистить
+            bundle['css_href'] = self._write_bundle(bundle['css_name'], bundle['css'])
+            bundle['js_href'] = self._write_bundle(bundle['js_name'], bundle['js'])
+            bundle['css_tag'] = Markup(f'<link rel="stylesheet" href="{bundle["css_href"]}">')
+            bundle['js_tag'] = Markup(f'<script src="{bundle["js_href"]}"></script>')
+        return bundle
+
+    def _face_for(self, weight):
+        """Начертание для веса: вариативное, если его ось покрывает вес, иначе ближайшее статическое"""
+        for face in self._font_faces:
+            if face['weight'][0] < face['weight'][1] and face['weight'][0] <= weight <= face['weight'][1]:
+                return face
+        return min(self._font_faces, key=lambda face: abs(face['weight'][0] - weight))
+
+    def fonts(self, style_key, lang=DEFAULT_LANG):
+        """Свой шрифт страницы: {'face': <style> с @font-face, 'preload': <link> обычного начертания,
+        'files': {href: {'path', 'source'}}}.
+
+        Подмножество собирается один раз на стиль и язык; файлы называются по хэшу исходника
+        и набора символов, поэтому стили с одинаковыми весами делят их. Без шрифта, fontTools
+        или assets_dir значения пустые — страница остаётся на системных шрифтах.
+        """
+        key = style_key or 'default'
+        fonts = self._fonts.get((key, lang))
+        if fonts is None:
+            fonts = {'face': Markup(''), 'preload': Markup(''), 'files': {}}
+            if self._font_faces and self.assets_dir:
+                charset = FONT_CHARSETS.get(lang, FONT_CHARSETS[DEFAULT_LANG])
+                ranges = unicode_range(charset)
+                flavor = font_flavor()
+                faces = {}
+                for weight in sorted(font_weights(self.bundle(key)['css'])):
+                    face = self._face_for(weight)
+                    faces.setdefault(face['path'], (face, []))[1].append(weight)
+                rules = []
+                family_slug = re.sub(r'\W+', '-', self.font_family.lower())
+                for face, weights in faces.values():
+                    low, high = face['weight']
+                    descriptor = str(low) if low == high else f'{low} {high}'
+                    digest = hashlib.sha256(f"{face['sha256']}|{ranges}|{flavor}".encode()).hexdigest()[:12]
+                    name = f"{family_slug}-{descriptor.replace(' ', '-')}.{digest}.{flavor}"
+                    href = f'{self.assets_url}/fonts/{name}'
+                    fonts['files'][href] = {'path': os.path.join(self.assets_dir, 'fonts', name), 'source': face['path']}
+                    rules.append(f"@font-face{{font-family:'{self.font_family}';font-style:normal;"
+                                 f"font-weight:{descriptor};font-display:swap;"
+                                 f"src:url({href}) format('{flavor}');unicode-range:{ranges}}}")
+                    if 400 in weights:
+                        fonts['preload'] = Markup(f'<link rel="preload" href="{href}" as="font" '
+                                                  f'type="font/{flavor}" crossorigin>')
+                fonts['face'] = Markup(f"<style>\n{''.join(rules)}\n</style>")
+            elif self.font_dir and self.font_family:
+                # Шрифт задан, но файлов нет (или нет fontTools) — прежняя таблица стилей Google Fonts,
+                # чтобы сайт не остался на системных шрифтах из-за неразложенной папки
+                weights = ';'.join(str(weight) for weight in sorted(font_weights(self.bundle(key)['css'])))
+                family = self.font_family.replace(' ', '+')
+                fonts['face'] = Markup(f'<link href="{REMOTE_FONTS_URL}?family={family}:wght@{weights}&display=swap" '
+                                       f'rel="stylesheet">')
+            self._fonts[(key, lang)] = fonts
+        # Проверяем каждый раз: папку с файлами могли очистить
+        for href, face in fonts['files'].items():
+            if not os.path.exists(face['path']):
+                try:
+                    os.makedirs(os.path.dirname(face['path']), exist_ok=True)
+                    size = subset_font(face['source'], FONT_CHARSETS.get(lang, FONT_CHARSETS[DEFAULT_LANG]),
+                                       face['path'])
+                    logger.info(f"Шрифт {href}: {os.path.getsize(face['source'])} → {size} байт")
+                except Exception as e:
+                    logger.error(f"Ошибка подготовки шрифта {href}: {e}")
+        return fonts
+
+    def _inline_map(self, style_key, lite=False):
+        """Тег подключения бандла → тот же бандл, встроенный в страницу; переключатель на lite.html
+        и свой шрифт во встроенной копии не нужны — рядом с ней нет ни lite-версии, ни assets"""
+        if not self.assets_dir:
+            return {}
+        bundle = self.bundle(style_key, lite)
+        inline = {bundle['css_tag']: bundle['css_inline'], bundle['js_tag']: bundle['js_inline']}
+        fonts = self.fonts(style_key)
+        # Таблица стилей Google Fonts (без своих файлов шрифта) работает и во встроенной копии
+        face = fonts['face'] if fonts['files'] else ''
+        for markup in (bundle['lite_switch'], face, fonts['preload']):
+            if markup:
+                inline[markup] = Markup('')
+        return inline
+
+    def stream(self, style_key, inline_assets=False, lite=False, lang=DEFAULT_LANG, **context):
+        """Страница генератором фрагментов — без сборки всего HTML в одну строку"""
+        inline_assets = inline_assets or not self.assets_dir
+        return self.template(style_key).generate(
+            assets=self.bundle(style_key, lite),
+            fonts=self.fonts(style_key, lang) if not (inline_assets or lite) else {'face': '', 'preload': ''},
+            inline_assets=inline_assets,
+            lite=lite,
+            lang=lang,
+            sections=BODY_SECTIONS,
+            **context)
+
+    def render(self, style_key, inline_assets=False, lite=False, **context):
+        """Рендер страницы; inline_assets=True — самодостаточный файл без внешних CSS/JS,
+        lite=True — облегчённая версия"""
+        return ''.join(self.stream(style_key, inline_assets=inline_assets, lite=lite, **context))
+
+    def style_report(self):
+        """Вес оформления и счётчики тяжёлых эффектов каждого стиля: полная и lite-версия"""
+        def gzip_size(text):
+            return len(gzip.compress(text.encode(), 9))
+        report = {}
+        for key in self.style_keys():
+            full, lite = self.bundle(key), self.bundle(key, lite=True)
+            report[key] = {
+                'css_bytes': len(full['css'].encode()), 'css_gzip': gzip_size(full['css']),
+                'js_bytes': len(full['js'].encode()), 'js_gzip': gzip_size(full['js']),
+                'lite_css_bytes': len(lite['css'].encode()), 'lite_css_gzip': gzip_size(lite['css']),
+                'lite_js_bytes': len(lite['js'].encode()), 'lite_js_gzip': gzip_size(lite['js']),
+                'cost': animation_cost(full['css']),
+                'lite_cost': animation_cost(lite['css']),
+            }
+        return report
+
+    def publish(self, style_key, page, document=None, lite=False, **context):
+        """Потоковый рендер в бинарные файлы: page получает страницу с общими бандлами,
+        document (если задан) — её самодостаточную копию со встроенными CSS/JS.
+
+        Страница рендерится один раз, фрагменты пишутся сразу по мере генерации;
+        lite=True — облегчённая версия. Возвращает размер страницы в байтах.
+        """
+        inline = self._inline_map(style_key, lite)
+        size = 0
+        for chunk in self.stream(style_key, lite=lite, **context):
+            data = chunk.encode('utf-8')
+            page.write(data)
+            size += len(data)
+            if document is not None:
+                document.write(inline[chunk].encode('utf-8') if chunk in inline else data)
+        return size
+
+    def service_worker(self, style_key, publish_dir):
+        """sw.js сайта: манифест из файлов, которые реально опубликованы в publish_dir.
+
+        При установке скачиваются страницы, бандлы и шрифт стиля (только со своего сервера —
+        ссылки на другой домен в кэш не положить); медиа — имена файлов media/ (хэш содержимого)
+        кроме видео, они кэшируются при первом показе. Версия — хэш манифеста, шаблонов
+        и содержимого страниц: правка поля тоже даёт новый sw.js, и браузер обновляет кэш.
+        """
+        precache = [page for page in SW_PAGES if os.path.exists(os.path.join(publish_dir, page))]
+        pages = {}
+        for page in precache:
+            with open(os.path.join(publish_dir, page), 'rb') as f:
+                pages[page] = hashlib.sha256(f.read()).hexdigest()
+        for lite in (False, True):
+            precache += [href for href in self.asset_sizes(style_key, lite) if '//' not in href and href not in precache]
+        media_dir = os.path.join(publish_dir, 'media')
+        media = sorted(f'media/{name}' for name in os.listdir(media_dir)
+                       if not name.endswith(SW_SKIP)) if os.path.isdir(media_dir) else []
+        version = hashlib.sha256(json.dumps([self.version, precache, media, pages]).encode()).hexdigest()[:12]
+        js = self.env.get_template('sw.js').render(version=version, precache=precache, media=media)
+        return minify_js(js) if self.minify else js
+
+    def section_keys(self, context):
+        """Отпечатки секций по их зависимостям; '_page' — всё, что вне секций (шаблоны, стиль)"""
+        def fingerprint(value):
+            return hashlib.sha256(json.dumps(value, ensure_ascii=False, sort_keys=True, default=str).encode()).hexdigest()[:16]
+        keys = {'_page': fingerprint([self.version, context.get('style')])}
+        for name, deps in SECTION_DEPS.items():
+            keys[name] = fingerprint([context.get(dep) for dep in deps])
+        return keys
+
+    def render_sections(self, names, **context):
+        """Рендер отдельных секций — тот же вывод, что они дают внутри целой страницы"""
+        return {name: self.env.get_template(f'partials/{name}.html').render(**context) for name in names}
+
+    def inline_assets(self, html, style_key):
+        """Встраивает общие CSS/JS в уже готовую страницу (для файла, который отправляется в Telegram)"""
+        for tag, inline in self._inline_map(style_key).items():
+            html = html.replace(tag, inline)
+        return html
+
+
+def splice_sections(html, fragments):
+    """Вклеивает фрагменты между маркерами секций; None, если какой-то секции в странице нет"""
+    for name, fragment in fragments.items():
+        pattern = re.compile(f'(<!--section:{name}-->).*?(<!--/section:{name}-->)', re.S)
+        html, count = pattern.subn(lambda m: m.group(1) + fragment + m.group(2), html, count=1)
+        if not count:
+            return None
+    return html
+
+
+# ===== КЭШ ГОТОВЫХ СТРАНИЦ =====
+
+class RenderCache:
+    """LRU-кэш готового HTML по хэшу входных данных страницы.
+
+    Свежие записи держатся в памяти, все — на диске (по файлу на ключ); оба уровня
+    ограничены по размеру и вытесняют самые давние по использованию записи.
+    """
+
+    def __init__(self, cache_dir=None, max_memory_bytes=16 * 1024 * 1024, max_disk_bytes=256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _size(value):
+        return sum(len(v) for v in value.values() if isinstance(v, str))
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.json')
+
+    def _disk_index(self):
+        """Ключи на диске от давних к свежим (по mtime); читается с диска один раз"""
+        if self._disk is None:
+            entries = []
+            if self.cache_dir and os.path.isdir(self.cache_dir):
+                for entry in os.scandir(self.cache_dir):
+                    if entry.name.endswith('.json'):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, entry.name[:-len('.json')], stat.st_size))
+            self._disk = OrderedDict((key, size) for _, key, size in sorted(entries))
+        return self._disk
+
+    def _remember(self, key, value):
+        if key in self._memory:
+            self._memory_bytes -= self._size(self._memory.pop(key))
+        self._memory[key] = value
+        self._memory_bytes += self._size(value)
+        while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= self._size(evicted)
+
+    def get(self, key):
+        value = self._memory.get(key)
+        if value is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return value
+        
+        if self.cache_dir and key in self._disk_index():
+            path = self._path(key)
+            try:
+                with open(path, encoding='utf-8') as f:
+                    value = json.load(f)
+                os.utime(path)
+                self._disk.move_to_end(key)
+                self._remember(key, value)
+                self.disk_hits += 1
+                return value
+            except Exception as e:
+                logger.error(f"Ошибка чтения кэша рендера {key}: {e}")
+                self._disk.pop(key, None)
+        
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self._remember(key, value)
+        if not self.cache_dir:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._path(key)
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            
+            index = self._disk_index()
+            index[key] = os.path.getsize(path)
+            index.move_to_end(key)
+            total = sum(index.values())
+            while total > self.max_disk_bytes and len(index) > 1:
+                evicted, size = index.popitem(last=False)
+                total -= size
+                try:
+                    os.remove(self._path(evicted))
+                except FileNotFoundError:
+                    pass
+        except Exception as e:
+            logger.error(f"Ошибка записи кэша рендера {key}: {e}")
+
+    def stats(self):
+        """Счётчики попаданий и заполненность уровней"""
+        lookups = self.hits + self.disk_hits + self.misses
+        index = self._disk_index() if self.cache_dir else {}
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': round((self.hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            'memory_items': len(self._memory),
+            'memory_bytes': self._memory_bytes,
+            'disk_items': len(index),
+            'disk_bytes': sum(index.values()),
+        }
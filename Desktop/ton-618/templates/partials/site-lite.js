@@ -0,0 +1,40 @@
+// Lite-версия: без анимаций и обработчиков прокрутки — только то, без чего страница не работает
+
+// Обработка видео
+document.querySelectorAll('video').forEach(video => {
+    video.addEventListener('click', function() {
+        if (this.paused) {
+            this.play();
+        } else {
+            this.pause();
+        }
+    });
+});
+
+// Карта: iframe Google Maps только по нажатию — в lite-версии без автозагрузки
+document.querySelectorAll('.map-facade').forEach(facade => {
+    facade.querySelector('.map-facade-button').addEventListener('click', () => {
+        const iframe = document.createElement('iframe');
+        iframe.src = facade.dataset.mapSrc;
+        iframe.title = 'Карта';
+        iframe.width = '100%';
+        iframe.height = '450';
+        iframe.style.cssText = 'border:0; border-radius: var(--radius);';
+        iframe.allowFullscreen = true;
+        facade.replaceWith(iframe);
+    });
+});
+
+// Обработка ошибок загрузки медиа
+document.addEventListener('error', function(e) {
+    if (e.target.tagName === 'IMG') {
+        e.target.style.display = 'none';
+    } else if (e.target.tagName === 'VIDEO') {
+        e.target.parentElement.innerHTML = '<p>Не удалось загрузить видео</p>';
+    }
+}, true);
+
+// Офлайн-кэш: sw.js публикуется рядом со страницей; у файла, открытого из Telegram, его нет
+if ('serviceWorker' in navigator && location.protocol.startsWith('http')) {
+    navigator.serviceWorker.register('sw.js').catch(() => {});
+}
@@ -0,0 +1,133 @@
+// Плавная прокрутка
+document.querySelectorAll('a[href^="#"]').forEach(anchor => {
+    anchor.addEventListener('click', function (e) {
+        e.preventDefault();
+        const target = document.querySelector(this.getAttribute('href'));
+        if (target) {
+            target.scrollIntoView({
+                behavior: 'smooth',
+                block: 'start'
+            });
+        }
+    });
+});
+
+// Анимации при скролле
+const observerOptions = {
+    threshold: 0.1,
+    rootMargin: '0px 0px -100px 0px'
+};
+
+const observer = new IntersectionObserver((entries) => {
+    entries.forEach(entry => {
+        if (entry.isIntersecting) {
+            entry.target.classList.add('animate');
+        }
+    });
+}, observerOptions);
+
+document.querySelectorAll('.spec-item, .gallery-item, .video-item, .contact-item, .about-content').forEach(el => {
+    observer.observe(el);
+});
+
+// Фиксированная навигация
+window.addEventListener('scroll', () => {
+    const nav = document.querySelector('.nav-scroll');
+    if (window.scrollY > 200) {
+        nav.style.position = 'fixed';
+        nav.style.width = '100%';
+        nav.style.top = '0';
+    } else {
+        nav.style.position = 'static';
+    }
+});
+
+// Lazy loading для изображений
+if ('loading' in HTMLImageElement.prototype) {
+    const images = document.querySelectorAll('img[loading="lazy"]');
+    images.forEach(img => {
+        if (img.dataset.src) img.src = img.dataset.src;
+    });
+}
+
+// Обработка видео
+const videos = document.querySelectorAll('video');
+videos.forEach(video => {
+    video.addEventListener('click', function() {
+        if (this.paused) {
+            this.play();
+        } else {
+            this.pause();
+        }
+    });
+});
+
+// Карта: iframe Google Maps подгружается по нажатию или когда блок подходит к экрану
+function loadMap(facade) {
+    if (!facade.isConnected) return;
+    const iframe = document.createElement('iframe');
+    iframe.src = facade.dataset.mapSrc;
+    iframe.title = 'Карта';
+    iframe.width = '100%';
+    iframe.height = '450';
+    iframe.style.cssText = 'border:0; border-radius: var(--radius);';
+    iframe.allowFullscreen = true;
+    iframe.referrerPolicy = 'no-referrer-when-downgrade';
+    facade.replaceWith(iframe);
+}
+document.querySelectorAll('.map-facade').forEach(facade => {
+    facade.querySelector('.map-facade-button').addEventListener('click', () => loadMap(facade));
+    if ('mapAutoload' in facade.dataset && 'IntersectionObserver' in window) {
+        const mapObserver = new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting)) {
+                mapObserver.disconnect();
+                loadMap(facade);
+            }
+        }, { rootMargin: '200px' });
+        mapObserver.observe(facade);
+    }
+});
+
+// Параллакс эффект для header
+window.addEventListener('scroll', () => {
+    const scrolled = window.pageYOffset;
+    const parallax = document.querySelector('.header');
+    if (parallax) {
+        parallax.style.backgroundPositionY = -(scrolled * 0.5) + 'px';
+    }
+});
+
+// Обработка ошибок загрузки медиа
+document.addEventListener('error', function(e) {
+    if (e.target.tagName === 'IMG') {
+        e.target.style.display = 'none';
+    } else if (e.target.tagName === 'VIDEO') {
+        e.target.parentElement.innerHTML = '<p>Не удалось загрузить видео</p>';
+    }
+}, true);
+
+// Аналитика просмотров
+window.addEventListener('load', function() {
+    const timeSpent = Date.now();
+    window.addEventListener('beforeunload', function() {
+        const totalTime = Date.now() - timeSpent;
+        console.log('Время на сайте:', Math.round(totalTime/1000), 'секунд');
+    });
+});
+
+// Оптимизация производительности
+let resizeTimer;
+window.addEventListener('resize', function() {
+    clearTimeout(resizeTimer);
+    resizeTimer = setTimeout(function() {
+        document.body.classList.add('resize-animation-stopper');
+        setTimeout(function() {
+            document.body.classList.remove('resize-animation-stopper');
+        }, 400);
+    }, 400);
+});
+
+// Офлайн-кэш: sw.js публикуется рядом со страницей; у файла, открытого из Telegram, его нет
+if ('serviceWorker' in navigator && location.protocol.startsWith('http')) {
+    navigator.serviceWorker.register('sw.js').catch(() => {});
+}
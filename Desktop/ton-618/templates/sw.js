@@ -0,0 +1,64 @@
+{#- Service worker сайта: sites/site_N/sw.js, область — папка сайта.
+    PRECACHE — каркас (страницы, общие бандлы, шрифты) — скачивается при установке;
+    MEDIA — опубликованные файлы media/ с хэшем в имени (без видео): кэшируются при первом
+    показе и дальше отдаются из кэша. Запросы кусками (Range) идут мимо кэша.
+    Новый набор файлов или новые версии страниц дают новую VERSION, а значит новый sw.js
+    и новый кэш -#}
+const VERSION = '{{ version }}';
+const PRECACHE = {{ precache|tojson }};
+const MEDIA = new Set({{ media|tojson }});
+const SCOPE = new URL(self.registration.scope);
+const PREFIX = 'site:' + SCOPE.pathname + ':';
+const CACHE = PREFIX + VERSION;
+const PRECACHE_PATHS = new Set(PRECACHE.map(href => new URL(href, SCOPE).pathname));
+
+self.addEventListener('install', event => {
+    event.waitUntil(caches.open(CACHE).then(cache => cache.addAll(PRECACHE)).then(() => self.skipWaiting()));
+});
+
+// Кэши прошлых версий этого сайта больше не нужны
+self.addEventListener('activate', event => {
+    event.waitUntil(caches.keys().then(keys => Promise.all(
+        keys.filter(key => key.startsWith(PREFIX) && key !== CACHE).map(key => caches.delete(key))
+    )).then(() => self.clients.claim()));
+});
+
+// Файлы с хэшем в имени не меняются: из кэша, в сеть только при промахе
+function cacheFirst(request) {
+    return caches.open(CACHE).then(cache => cache.match(request).then(cached => cached || fetch(request).then(response => {
+        if (response.status === 200) cache.put(request, response.clone());
+        return response;
+    })));
+}
+
+// Страница: сразу из кэша, свежая версия подтягивается в фоне к следующему визиту
+function staleWhileRevalidate(event, key) {
+    return caches.open(CACHE).then(cache => cache.match(key).then(cached => {
+        const network = fetch(event.request).then(response => {
+            if (response.status === 200) cache.put(key, response.clone());
+            return response;
+        });
+        if (!cached) return network;
+        event.waitUntil(network.catch(() => null));
+        return cached;
+    }));
+}
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    if (request.method !== 'GET' || request.headers.has('range')) return;
+    const url = new URL(request.url);
+    if (url.origin !== SCOPE.origin) return;
+    if (request.mode === 'navigate') {
+        if (!url.pathname.startsWith(SCOPE.pathname)) return;
+        const page = url.pathname.slice(SCOPE.pathname.length) || 'index.html';
+        if (page === 'index.html' || page === 'lite.html') {
+            event.respondWith(staleWhileRevalidate(event, new URL(page, SCOPE).href));
+        }
+        return;
+    }
+    const path = url.pathname.startsWith(SCOPE.pathname) ? url.pathname.slice(SCOPE.pathname.length) : null;
+    if ((path && MEDIA.has(path)) || PRECACHE_PATHS.has(url.pathname)) {
+        event.respondWith(cacheFirst(request));
+    }
+});
@@ -0,0 +1,54 @@
+import sqlite3
+
+import pytest
+
+from database import HOT_QUERIES, MIGRATIONS, BlobStore, check_query_plans, migrate
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(':memory:')
+    yield conn
+    conn.close()
+
+
+def test_hot_queries_use_indexes(conn, tmp_path):
+    migrate(conn, BlobStore(str(tmp_path)))
+    assert check_query_plans(conn) == []
+
+
+def test_hot_queries_use_indexes_with_statistics(conn, tmp_path):
+    # После ANALYZE на заполненной базе планировщик выбирает по статистике — индексы должны остаться
+    migrate(conn, BlobStore(str(tmp_path)))
+    conn.executemany("""INSERT INTO websites (user_id, title, html_path, media_path, created_at)
+                        VALUES (?, 't', ?, ?, datetime('now', ?))""",
+                     [(i % 50, f'{i % 256:02x}/{i}.gz', f'{i % 256:02x}/m{i}.gz', f'-{i} seconds')
+                      for i in range(2000)])
+    conn.executemany("INSERT INTO site_files (site_id, path, bytes, gzip_bytes, brotli_bytes) VALUES (?, ?, 1, 1, 1)",
+                     [(i, path) for i in range(1, 2001) for path in ('index.html', 'lite.html', 'sw.js')])
+    conn.execute('ANALYZE')
+    assert check_query_plans(conn) == []
+
+
+def test_check_query_plans_reports_full_scan(conn, tmp_path):
+    # Без индексов миграции 7 список сайтов и статистика читают таблицы целиком
+    migrate(conn, BlobStore(str(tmp_path)), [m for m in MIGRATIONS if m[0] < 7])
+    problems = check_query_plans(conn, {name: HOT_QUERIES[name] for name in ('list_websites', 'publish_totals')})
+    assert any(problem.startswith('list_websites: SCAN') for problem in problems)
+    assert any(problem.startswith('publish_totals: SCAN') for problem in problems)
+
+
+def test_unreferenced_blobs_swept_once_by_migration(conn, tmp_path):
+    blobs = BlobStore(str(tmp_path))
+    migrate(conn, blobs, [m for m in MIGRATIONS if m[0] < 9])
+    kept, _, _ = blobs.put_text('<html>kept</html>')
+    orphan, _, _ = blobs.put_text('<html>orphan</html>')
+    conn.execute('INSERT INTO websites (user_id, html_path) VALUES (1, ?)', (kept,))
+
+    migrate(conn, blobs)
+    assert set(blobs.paths()) == {kept}
+
+    # Дальше обход папки на старте не повторяется
+    late, _, _ = blobs.put_text('<html>late</html>')
+    migrate(conn, blobs)
+    assert late in set(blobs.paths())
@@ -0,0 +1,26 @@
+import pytest
+
+from config import LITE_JS_BUDGET
+from render import LiteBudgetExceeded, SiteRenderer
+
+
+def test_lite_js_within_budget_for_every_style():
+    renderer = SiteRenderer(lite_js_budget=LITE_JS_BUDGET)
+    for key in renderer.style_keys():
+        assert len(renderer.bundle(key, lite=True)['js'].encode()) <= LITE_JS_BUDGET
+
+
+def test_lite_bundle_over_budget_is_rejected():
+    renderer = SiteRenderer(lite_js_budget=100)
+    with pytest.raises(LiteBudgetExceeded):
+        renderer.bundle('default', lite=True)
+    with pytest.raises(LiteBudgetExceeded):
+        renderer.warm()
+
+
+def test_missing_font_dir_falls_back_to_remote_stylesheet(tmp_path):
+    renderer = SiteRenderer(font_dir=str(tmp_path / 'missing'), font_family='Inter')
+    face = renderer.fonts('default')['face']
+    assert 'fonts.googleapis.com/css2?family=Inter:wght@' in face
+    assert '400' in face
+    assert SiteRenderer(font_dir='').fonts('default')['face'] == ''
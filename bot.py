@@ -10,8 +10,10 @@ from aiogram.client.default import DefaultBotProperties
 from datetime import datetime
 import textwrap
 import re
-from PIL import Image
-import io
+import time
+from config import PHOTO_FETCH_CONCURRENCY, PHOTO_FETCH_TIMEOUT, IMAGE_WORKERS, IMAGE_QUEUE_SIZE
+from config import SESSION_TTL, SESSION_SWEEP_INTERVAL
+from media import ImageProcessor
 
 # Настройка логов
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -110,6 +112,39 @@ init_db()
 # Хранение временных данных
 user_sessions = {}
 
+def reset_session(user_id, data=None):
+    """Заменяет сессию пользователя (или удаляет при data=None), отменяя фоновые загрузки старой"""
+    old = user_sessions.pop(user_id, None)
+    for task in (old or {}).get('prefetch') or []:
+        task.cancel()
+    if data is not None:
+        data['touched'] = time.monotonic()
+        user_sessions[user_id] = data
+    return data
+
+@dp.message.outer_middleware()
+async def touch_session(handler, event, data):
+    """Отмечает активность пользователя, чтобы живые сессии не попали под очистку"""
+    session = user_sessions.get(event.from_user.id) if event.from_user else None
+    if session is not None:
+        session['touched'] = time.monotonic()
+    return await handler(event, data)
+
+async def sweep_sessions():
+    """Периодически удаляет брошенные сессии вместе с их фоновыми загрузками и готовыми фото"""
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL)
+        now = time.monotonic()
+        for user_id, session in list(user_sessions.items()):
+            if session.get('state') != 'generating' and now - session.get('touched', now) > SESSION_TTL:
+                reset_session(user_id)
+
+# Очистка запускается с первой фоновой загрузкой — только они держат память после ухода пользователя
+session_sweeper = None
+
+# Пул обработки фото
+image_processor = ImageProcessor(workers=IMAGE_WORKERS, max_pending=IMAGE_QUEUE_SIZE)
+
 # Клавиатуры
 def get_main_menu():
     return ReplyKeyboardMarkup(
@@ -137,18 +172,52 @@ async def download_photo(photo_id):
         file = await bot.get_file(photo_id)
         photo_data = await bot.download_file(file.file_path)
         
-        image = Image.open(io.BytesIO(photo_data.read()))
-        image.thumbnail((1200, 800))
-        
-        buffered = io.BytesIO()
-        image.save(buffered, format="JPEG", quality=90)
-        img_str = base64.b64encode(buffered.getvalue()).decode()
+        # Декодирование и ресайз идут в пуле процессов, event loop не блокируется
+        jpeg_bytes = await image_processor.process(photo_data.read())
+        img_str = base64.b64encode(jpeg_bytes).decode()
         
         return f"data:image/jpeg;base64,{img_str}"
     except Exception as e:
         logger.error(f"Ошибка обработки фото: {e}")
         return None
 
+# Общий лимит одновременных загрузок для фоновых и финальных скачиваний
+photo_fetch_slots = None
+
+async def fetch_photo(photo_id, timeout=PHOTO_FETCH_TIMEOUT):
+    """Скачивает одно фото, соблюдая общий лимит параллельных загрузок"""
+    global photo_fetch_slots
+    if photo_fetch_slots is None:
+        photo_fetch_slots = asyncio.Semaphore(PHOTO_FETCH_CONCURRENCY)
+    async with photo_fetch_slots:
+        try:
+            return await asyncio.wait_for(download_photo(photo_id), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Таймаут загрузки фото {photo_id}")
+            return None
+
+async def fetch_photos(photo_ids, timeout=PHOTO_FETCH_TIMEOUT):
+    """Скачивает фото параллельно, порядок сохраняется"""
+    # gather возвращает результаты в порядке входного списка
+    return await asyncio.gather(*(fetch_photo(photo_id, timeout) for photo_id in photo_ids))
+
+def schedule_prefetch(user_id, photo_id):
+    """Запускает загрузку фото в фоне сразу после получения — она идёт, пока пользователь заполняет анкету"""
+    global session_sweeper
+    if session_sweeper is None or session_sweeper.done():
+        session_sweeper = asyncio.create_task(sweep_sessions())
+    session = user_sessions[user_id]
+    session['photos'].append(photo_id)
+    session.setdefault('prefetch', []).append(asyncio.create_task(fetch_photo(photo_id)))
+
+async def collect_photos(user_data):
+    """Результаты фоновых загрузок по порядку; дожидается только тех, что ещё не готовы"""
+    tasks = user_data.get('prefetch') or []
+    if len(tasks) != len(user_data['photos']):
+        return await fetch_photos(user_data['photos'])
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    return [None if isinstance(result, BaseException) else result for result in results]
+
 def detect_style_from_description(description):
     """Определяет стиль сайта на основе описания"""
     desc_lower = description.lower()
@@ -880,7 +949,7 @@ async def start(message: types.Message):
 @dp.message(F.text == "🌐 Создать сайт")
 async def start_creation(message: types.Message):
     user_id = message.from_user.id
-    user_sessions[user_id] = {
+    reset_session(user_id, {
         'state': 'waiting_photos',
         'photos': [],
         'title': '',
@@ -894,7 +963,7 @@ async def start_creation(message: types.Message):
         'broker_email': '',
         'broker_tg': '',
         'style': {}
-    }
+    })
     await message.answer(
         "📸 <b>ШАГ 1 из 8: Фотографии объекта</b>\n\n"
         "Отправьте от 1 до 12 фотографий высокого качества\n"
@@ -914,7 +983,7 @@ async def handle_photo(message: types.Message):
         )
         return
     
-    user_sessions[user_id]['photos'].append(message.photo[-1].file_id)
+    schedule_prefetch(user_id, message.photo[-1].file_id)
     count = len(user_sessions[user_id]['photos'])
     
     if count == 1:
@@ -1076,12 +1145,8 @@ async def generate_website(message: types.Message):
     await message.answer("⏳ <b>Создаю профессиональный сайт...</b>\n\nЭто займет 1-2 минуты")
     
     try:
-        # Скачиваем и обрабатываем фото
-        photo_urls = []
-        for photo_id in user_data['photos']:
-            photo_url = await download_photo(photo_id)
-            if photo_url:
-                photo_urls.append(photo_url)
+        # Фото качались в фоне с момента загрузки — ждём только незавершённые
+        photo_urls = [url for url in await collect_photos(user_data) if url]
         
         # Генерируем HTML
         html_content = await generate_website_html(user_data, photo_urls)
@@ -1130,7 +1195,7 @@ async def generate_website(message: types.Message):
         await message.answer("❌ <b>Ошибка при создании сайта</b>\n\nПопробуйте еще раз")
     
     # Очищаем сессию
-    user_sessions.pop(user_id, None)
+    reset_session(user_id)
 
 @dp.message(F.text == "📚 Мои сайты")
 async def show_websites(message: types.Message):
@@ -6,3 +6,15 @@ BOT_TOKEN = os.getenv("BOT_TOKEN", "8358851724:AAEVVzB4EqDqmWNLjrAnW2mZVnALCzPqW
 
 if not BOT_TOKEN:
     print("⚠️ BOT_TOKEN is not set. Please export BOT_TOKEN in your environment.")
+
+# Параллельная загрузка фото: сколько файлов качаем одновременно и таймаут на один файл (сек)
+PHOTO_FETCH_CONCURRENCY = int(os.getenv("PHOTO_FETCH_CONCURRENCY", "4"))
+PHOTO_FETCH_TIMEOUT = float(os.getenv("PHOTO_FETCH_TIMEOUT", "30"))
+
+# Пул обработки фото: число процессов-воркеров и предел очереди задач
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+IMAGE_QUEUE_SIZE = int(os.getenv("IMAGE_QUEUE_SIZE", "16"))
+
+# Сессии: через сколько секунд бездействия сессия считается брошенной и как часто их проверять
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(2 * 3600)))
+SESSION_SWEEP_INTERVAL = int(os.getenv("SESSION_SWEEP_INTERVAL", "300"))
@@ -0,0 +1,68 @@
+import asyncio
+import io
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# ===== ОБРАБОТКА ИЗОБРАЖЕНИЙ В ПУЛЕ ПРОЦЕССОВ =====
+
+def process_image(raw, max_size=(1200, 800), quality=90):
+    """Декодирует, уменьшает и кодирует фото в JPEG (выполняется в процессе-воркере)"""
+    image = Image.open(io.BytesIO(raw))
+    image.thumbnail(max_size)
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+
+    buffered = io.BytesIO()
+    image.save(buffered, format="JPEG", quality=quality)
+    return buffered.getvalue()
+
+
+class ImageProcessor:
+    """Пул процессов для Pillow с ограниченной очередью задач.
+
+    Не больше max_pending фото одновременно находятся в обработке или ждут её,
+    остальные вызовы process() ждут свободного места. Свойство overloaded —
+    сигнал для обработчиков, что очередь заполнена и ответ будет не сразу.
+    """
+
+    def __init__(self, workers=2, max_pending=16):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor = None
+        self._slots = None
+
+    @property
+    def overloaded(self):
+        return self.pending >= self.max_pending
+
+    def _ensure_started(self):
+        # Пул и семафор создаём лениво — внутри работающего event loop
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            self._slots = asyncio.Semaphore(self.max_pending)
+
+    async def run(self, func, *args, **kwargs):
+        """Выполняет func в пуле процессов, соблюдая лимит очереди"""
+        self._ensure_started()
+        async with self._slots:
+            self.pending += 1
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+            finally:
+                self.pending -= 1
+
+    async def process(self, raw, max_size=(1200, 800), quality=90):
+        """Обрабатывает фото в пуле и возвращает JPEG-байты"""
+        return await self.run(process_image, raw, max_size=max_size, quality=quality)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None